@@ -23,6 +23,7 @@ from airflow import models
 from dags.common import test_owner
 from dags.common.vm_resource import TpuVersion, Zone, Project, XpkClusters, DockerImage
 from dags.multipod.configs import maxtext_sweep_gke_config
+from xlml.apis import task
 
 # Set concurrency to number of workers otherwise tasks may time out
 # if there are more concurrent tasks running at a time than number of workers
@@ -55,6 +56,5 @@ with models.DAG(
       )
   )
 
-  # Run jobs
-  for test in maxtext_sweep_gke_test:
-    test.run_with_run_name_generation()
+  # Launch all jobs from one task, then wait for each of them
+  task.run_xpk_sweep(maxtext_sweep_gke_test)
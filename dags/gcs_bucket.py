@@ -24,6 +24,16 @@ AXLEARN_DIR = "gs://axlearn-public/tensorflow_datasets"
 # GCS bucket for output
 BASE_OUTPUT_DIR = "gs://ml-auto-solutions/output"
 
+# GCS bucket for cached accelerator setup results
+SETUP_CACHE_DIR = "gs://ml-auto-solutions/setup_cache"
+
+# GCS folder holding the lease claims of warm pool TPUs
+TPU_POOL_LEASE_DIR = "gs://ml-auto-solutions/tpu_pool_leases"
+
+# GCS folder holding the manifests of validated checkpoint steps, kept out of
+# the checkpoints they describe
+CHECKPOINT_MANIFEST_DIR = "gs://ml-auto-solutions/checkpoint_manifests"
+
 # Multi-tier checkpointing need special permission for GCS Bucket
 # For further question reach out to  Multi-tier Checkpointing Owners.
 ORBAX_AUTOMATION_BUCKET_EUROPE_WEST4 = "gs://orbax-automation-europe-west4"
@@ -18,7 +18,7 @@ import datetime
 from airflow import models
 from dags import composer_env
 from dags.common.vm_resource import Project, Zone
-from xlml.utils import tpu
+from xlml.utils import gpu_pool, tpu
 
 
 # Run every 10min
@@ -65,6 +65,7 @@ with models.DAG(
   # clean up in tpu-prod-env-automated has been handled in script below:
   # https://source.corp.google.com/piper///depot/google3/cloud/tpu/tools/multipod/qr_tool/qr_delete.sh;l=32
   # No need to handle here to avoid `maximum number of DeleteNode requests per minute` error.
+  # Deletes issued below are rate limited by `tpu.DELETE_REQUESTS_PER_MINUTE`.
   qr_cloud_ml_auto_solutions = tpu.clean_up_idle_queued_resources.override(
       task_id="cleanup_qr_cloud-ml-auto-solutions"
   )(Project.CLOUD_ML_AUTO_SOLUTIONS.value, tpu_zones)
@@ -72,7 +73,13 @@ with models.DAG(
       task_id="cleanup_qr_cloud-ml-benchmarking"
   )(Project.CLOUD_ML_BENCHMARKING.value, cloud_ml_benchmarking_tpu_zones)
 
+  # GPU warm pools
+  gpu_pool_cloud_ml_auto_solutions = gpu_pool.clean_up_idle_resources.override(
+      task_id="cleanup_gpu_pool_cloud-ml-auto-solutions"
+  )(Project.CLOUD_ML_AUTO_SOLUTIONS.value)
+
   # Overview dependency
   node_cloud_ml_auto_solutions >> qr_cloud_ml_auto_solutions
   node_tpu_prod_env_automated
   node_cloud_ml_auto_benchmarking >> qr_cloud_ml_benchmarking
+  gpu_pool_cloud_ml_auto_solutions
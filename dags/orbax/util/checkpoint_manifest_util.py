@@ -0,0 +1,243 @@
+"""Verifies the checkpoint steps of a run in GCS, one step prefix at a time."""
+
+import concurrent.futures
+import dataclasses
+import json
+import re
+from typing import Iterable, Optional
+
+from absl import logging
+from airflow.providers.google.cloud.hooks.gcs import GCSHook
+from google.api_core import exceptions
+from google.cloud import storage
+from dags import gcs_bucket
+from xlml.apis import gcs
+
+
+# Manifest of the steps verified so far, under the manifest folder followed by
+# the run's bucket and path.
+MANIFEST_NAME = "checkpoint_manifest.json"
+# Directories that hold the step directories of a regular checkpoint.
+STEP_PARENTS = ("checkpoints/", "")
+# Files written by Orbax once a step is committed.
+COMMIT_MARKERS = ("commit_success.txt", "_CHECKPOINT_METADATA")
+# Per-process OCDBT directory, each with its own manifest.
+_PROCESS_DIR = re.compile(r"/(ocdbt\.process_\d+)/")
+_OCDBT_MANIFEST = "manifest.ocdbt"
+_SAVE_ATTEMPTS = 3
+
+
+@dataclasses.dataclass
+class StepManifest:
+  """What was observed in GCS for a checkpoint step.
+
+  Attributes:
+    step: The checkpoint step.
+    path: gs:// path of the step directory, or of a file of the step.
+    generation: Generation of the first object under `path`, which changes if
+      the step is deleted or written again.
+    objects: Number of objects of the step, if its shards were verified.
+    processes: Number of OCDBT process shards, if its shards were verified.
+    complete: Whether the step is committed with a manifest per shard, if its
+      shards were verified.
+  """
+
+  step: int
+  path: str
+  generation: Optional[int] = None
+  objects: Optional[int] = None
+  processes: Optional[int] = None
+  complete: Optional[bool] = None
+
+
+def _bucket_name(bucket_path: str) -> str:
+  return bucket_path.removeprefix("gs://").split("/", 1)[0]
+
+
+def _find_step(
+    bucket_path: str, step: int, multi_tier: bool
+) -> Optional[StepManifest]:
+  """Finds a step, listing at most one object per candidate."""
+  if multi_tier:
+    # e.g. <run_name>/2025-10-22_08-42/<run_name>-s199-n2-w0.meta
+    blob = gcs.first_blob(
+        f"{bucket_path}/", match_glob=f"**-s{step}-n*-w*.meta"
+    )
+    if blob:
+      return StepManifest(
+          step=step,
+          path=f"gs://{_bucket_name(bucket_path)}/{blob.name}",
+          generation=blob.generation,
+      )
+    return None
+
+  for parent in STEP_PARENTS:
+    path = f"{bucket_path}/{parent}{step}/"
+    if blob := gcs.first_blob(path):
+      return StepManifest(step=step, path=path, generation=blob.generation)
+  return None
+
+
+def _is_unchanged(manifest: StepManifest) -> bool:
+  """Checks that a saved step still starts with the object seen before."""
+  blob = gcs.first_blob(manifest.path)
+  return blob is not None and blob.generation == manifest.generation
+
+
+def _inspect_step(manifest: StepManifest) -> StepManifest:
+  """Lists a step directory to check that all its shards are committed."""
+  names = list(gcs.iter_file_list(manifest.path))
+  processes = {m.group(1) for m in map(_PROCESS_DIR.search, names) if m}
+  committed = any(
+      name.endswith(f"/{marker}") for name in names for marker in COMMIT_MARKERS
+  )
+  shards_complete = all(
+      any(name.endswith(f"/{process}/{_OCDBT_MANIFEST}") for name in names)
+      for process in processes
+  )
+  return dataclasses.replace(
+      manifest,
+      objects=len(names),
+      processes=len(processes),
+      complete=committed and shards_complete,
+  )
+
+
+def _manifest_location(
+    bucket_path: str, manifest_dir: str
+) -> tuple[storage.Bucket, str]:
+  """Returns the bucket and name of a run's manifest, outside the run."""
+  run = bucket_path.removeprefix("gs://").strip("/")
+  manifest_bucket = _bucket_name(manifest_dir)
+  prefix = manifest_dir.removeprefix(f"gs://{manifest_bucket}").strip("/")
+  name = "/".join(part for part in (prefix, run, MANIFEST_NAME) if part)
+  return GCSHook().get_conn().bucket(manifest_bucket), name
+
+
+def _read_manifest(
+    bucket: storage.Bucket, name: str
+) -> tuple[dict[int, StepManifest], int]:
+  """Returns the saved manifest and its generation, 0 if there is none."""
+  blob = bucket.get_blob(name)
+  if blob is None:
+    return {}, 0
+  try:
+    # The blob carries its generation, so the download can't mix versions.
+    content = json.loads(blob.download_as_bytes())
+  except exceptions.NotFound:
+    # Replaced since it was found, the next write will fail and retry.
+    return {}, blob.generation
+  steps = {int(step): StepManifest(**value) for step, value in content.items()}
+  return steps, blob.generation
+
+
+def load_manifest(
+    bucket_path: str, manifest_dir: str = gcs_bucket.CHECKPOINT_MANIFEST_DIR
+) -> dict[int, StepManifest]:
+  """Loads the manifest saved for a run, empty if there is none."""
+  return _read_manifest(*_manifest_location(bucket_path, manifest_dir))[0]
+
+
+def save_manifest(
+    bucket_path: str,
+    manifest: dict[int, StepManifest],
+    manifest_dir: str = gcs_bucket.CHECKPOINT_MANIFEST_DIR,
+) -> None:
+  """Merges steps into the manifest saved for a run.
+
+  Writes are conditional on the generation that was read, so steps saved by a
+  concurrent validator are merged instead of overwritten.
+  """
+  bucket, name = _manifest_location(bucket_path, manifest_dir)
+  for attempt in range(_SAVE_ATTEMPTS):
+    saved, generation = _read_manifest(bucket, name)
+    merged = {**saved, **manifest}
+    content = {
+        str(step): dataclasses.asdict(merged[step]) for step in sorted(merged)
+    }
+    try:
+      bucket.blob(name).upload_from_string(
+          json.dumps(content, indent=2),
+          content_type="application/json",
+          if_generation_match=generation,
+      )
+      logging.info(f"Saved the manifest of {len(merged)} steps to {name}")
+      return
+    except exceptions.PreconditionFailed:
+      logging.info(f"Manifest changed while saving, attempt {attempt + 1}.")
+  logging.warning(f"Failed to save the manifest of {bucket_path}.")
+
+
+def verify_steps(
+    bucket_path: str,
+    steps: Iterable[int],
+    multi_tier: bool = False,
+    verify_shards: bool = False,
+    max_workers: int = gcs.LIST_CONCURRENCY,
+    manifest_dir: str = gcs_bucket.CHECKPOINT_MANIFEST_DIR,
+) -> dict[int, StepManifest]:
+  """Checks which checkpoint steps of a run exist in GCS.
+
+  All steps are checked concurrently, each by listing at most one object under
+  its prefix. Steps already in the run's manifest are checked at their saved
+  path, and their shards aren't listed again unless the first object's
+  generation changed. The steps found are merged into the manifest.
+
+  Args:
+    bucket_path: The full gs:// path of the run's checkpoints.
+    steps: Steps to verify.
+    multi_tier: Whether the checkpoints are multi-tier backups, identified by
+      their metadata files.
+    verify_shards: Whether to also list each step directory, to check that it
+      is committed with a manifest per OCDBT process. Not done for multi-tier
+      checkpoints.
+    max_workers: Maximum number of concurrent GCS requests.
+    manifest_dir: The gs:// folder of the manifests.
+
+  Returns:
+    The manifest of each step found, by step.
+  """
+  bucket_path = bucket_path.rstrip("/")
+  verify_shards = verify_shards and not multi_tier
+  steps = set(steps)
+  saved = {
+      step: manifest
+      for step, manifest in load_manifest(bucket_path, manifest_dir).items()
+      if step in steps and (manifest.complete or not verify_shards)
+  }
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+    # A saved step may have been deleted or written again since, so it is
+    # checked again, and verified from scratch if it changed.
+    unchanged = executor.map(_is_unchanged, saved.values())
+    cached = {
+        step: manifest
+        for (step, manifest), ok in zip(saved.items(), unchanged)
+        if ok
+    }
+    if cached:
+      logging.info(f"Steps {sorted(cached)} are in the manifest already.")
+    if saved.keys() - cached.keys():
+      logging.info(
+          f"Steps {sorted(saved.keys() - cached.keys())} of the manifest"
+          " changed in GCS since they were verified."
+      )
+
+    pending = sorted(steps - cached.keys())
+    found = [
+        manifest
+        for manifest in executor.map(
+            lambda step: _find_step(bucket_path, step, multi_tier), pending
+        )
+        if manifest
+    ]
+    if verify_shards:
+      found = list(executor.map(_inspect_step, found))
+
+  if found:
+    save_manifest(
+        bucket_path,
+        {manifest.step: manifest for manifest in found},
+        manifest_dir,
+    )
+  return {**cached, **{manifest.step: manifest for manifest in found}}
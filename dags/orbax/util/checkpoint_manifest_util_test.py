@@ -0,0 +1,155 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for checkpoint_manifest_util.py."""
+
+import json
+from typing import Dict, Optional
+from unittest import mock
+
+from absl.testing import absltest
+from google.api_core import exceptions
+
+from dags.orbax.util import checkpoint_manifest_util
+
+
+_RUN = "gs://bucket/runs/run-1"
+_MANIFEST_DIR = "gs://manifests/checkpoints"
+
+
+class _FakeBucket:
+  """A bucket of JSON objects with generations."""
+
+  def __init__(self):
+    self.objects: Dict[str, tuple[bytes, int]] = {}
+
+  def get_blob(self, name: str) -> Optional[mock.Mock]:
+    if name not in self.objects:
+      return None
+    content, generation = self.objects[name]
+    return mock.Mock(
+        generation=generation,
+        download_as_bytes=mock.Mock(return_value=content),
+    )
+
+  def blob(self, name: str) -> mock.Mock:
+    def upload_from_string(content, content_type, if_generation_match):
+      del content_type
+      generation = self.objects.get(name, (b"", 0))[1]
+      if generation != if_generation_match:
+        raise exceptions.PreconditionFailed("generation changed")
+      self.objects[name] = (content.encode(), generation + 1)
+
+    return mock.Mock(upload_from_string=upload_from_string)
+
+
+class VerifyStepsTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.bucket = _FakeBucket()
+    hook = self.enter_context(
+        mock.patch.object(checkpoint_manifest_util, "GCSHook")
+    )
+    hook.return_value.get_conn.return_value.bucket.return_value = self.bucket
+    # First object of each listed prefix.
+    self.objects: Dict[str, mock.Mock] = {}
+    self.first_blob = self.enter_context(
+        mock.patch.object(
+            checkpoint_manifest_util.gcs,
+            "first_blob",
+            side_effect=lambda path, match_glob=None: self.objects.get(path),
+        )
+    )
+    self.inspect_step = self.enter_context(
+        mock.patch.object(
+            checkpoint_manifest_util,
+            "_inspect_step",
+            side_effect=lambda m: checkpoint_manifest_util.dataclasses.replace(
+                m, objects=3, processes=1, complete=True
+            ),
+        )
+    )
+
+  def _add_step(self, step: int, generation: int) -> None:
+    self.objects[f"{_RUN}/checkpoints/{step}/"] = mock.Mock(
+        generation=generation
+    )
+
+  def _verify(self, steps, verify_shards=False):
+    return checkpoint_manifest_util.verify_steps(
+        _RUN,
+        steps,
+        verify_shards=verify_shards,
+        manifest_dir=_MANIFEST_DIR,
+    )
+
+  def _saved(self) -> dict:
+    content, _ = self.bucket.objects[
+        "checkpoints/bucket/runs/run-1/checkpoint_manifest.json"
+    ]
+    return json.loads(content)
+
+  def test_saves_found_steps_outside_the_run(self):
+    self._add_step(100, generation=5)
+
+    manifest = self._verify([100, 200])
+
+    self.assertEqual(list(manifest), [100])
+    self.assertEqual(manifest[100].path, f"{_RUN}/checkpoints/100/")
+    self.assertEqual(self._saved()["100"]["generation"], 5)
+
+  def test_does_not_inspect_unchanged_steps_again(self):
+    self._add_step(100, generation=5)
+    self._verify([100], verify_shards=True)
+    self.inspect_step.reset_mock()
+    self.first_blob.reset_mock()
+
+    manifest = self._verify([100], verify_shards=True)
+
+    self.assertTrue(manifest[100].complete)
+    self.inspect_step.assert_not_called()
+    self.first_blob.assert_called_once_with(f"{_RUN}/checkpoints/100/")
+
+  def test_verifies_rewritten_steps_again(self):
+    self._add_step(100, generation=5)
+    self._verify([100], verify_shards=True)
+    self._add_step(100, generation=9)
+    self.inspect_step.reset_mock()
+
+    manifest = self._verify([100], verify_shards=True)
+
+    self.assertEqual(manifest[100].generation, 9)
+    self.inspect_step.assert_called_once()
+    self.assertEqual(self._saved()["100"]["generation"], 9)
+
+  def test_drops_deleted_steps(self):
+    self._add_step(100, generation=5)
+    self._verify([100])
+    del self.objects[f"{_RUN}/checkpoints/100/"]
+
+    self.assertEqual(self._verify([100]), {})
+
+  def test_merges_steps_saved_by_another_validator(self):
+    self._add_step(100, generation=5)
+    self._add_step(200, generation=6)
+    self._verify([100])
+
+    self._verify([200])
+
+    self.assertEqual(set(self._saved()), {"100", "200"})
+
+
+if __name__ == "__main__":
+  absltest.main()
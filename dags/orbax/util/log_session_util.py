@@ -0,0 +1,384 @@
+"""A local cache of the GKE container logs read by Orbax validation tasks."""
+
+import contextlib
+import dataclasses
+from datetime import datetime, timedelta, timezone
+import fcntl
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+from typing import Iterator, Optional
+
+from absl import logging
+from google.cloud import logging as logging_api
+
+
+# Kinds of the checkpoint events logged by Orbax.
+SAVE = "save"
+RESTORE = "restore"
+EMERGENCY_RESTORE = "emergency_restore"
+EVENT_KINDS = (SAVE, RESTORE, EMERGENCY_RESTORE)
+
+
+def _event_filter(kind: str) -> str:
+  event = f"'event_type': '{kind}'"
+  return f'(textPayload:"{event}" OR jsonPayload.message:"{event}")'
+
+
+# Server-side filters of the log entries that Orbax validators read. The first
+# query of a session fetches the entries of all of them, so later validators
+# are answered locally.
+EVENT_FILTERS = {kind: _event_filter(kind) for kind in EVENT_KINDS}
+BACKUP_FILTER = 'textPayload:"backup for step"'
+RESTORE_FILTER = '"Restoring from backup"'
+KNOWN_FILTERS = (*EVENT_FILTERS.values(), BACKUP_FILTER, RESTORE_FILTER)
+
+CACHE_DIR = os.environ.get(
+    "ORBAX_LOG_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "orbax_log_cache"),
+)
+# Cached entries older than this are dropped.
+RETENTION = timedelta(days=2)
+DEFAULT_WINDOW = timedelta(hours=12)
+# Entries may be ingested by Cloud Logging this long after their timestamp, so
+# the most recent part of a window isn't recorded as cached and is fetched
+# again by later queries.
+INGESTION_LAG = timedelta(minutes=5)
+# Part of the cache file name, so caches of an older schema aren't reused.
+_SCHEMA_VERSION = 2
+
+_EVENT = re.compile(r"'event_type': '(" + "|".join(EVENT_KINDS) + r")'")
+_EVENT_STEP = re.compile(r"'step':\s*(?:np\.int32\()?(\d+)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+  insert_id TEXT PRIMARY KEY,
+  timestamp TEXT NOT NULL,
+  pod TEXT,
+  container TEXT,
+  is_struct INTEGER NOT NULL,
+  message TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_by_timestamp ON entries (timestamp);
+CREATE INDEX IF NOT EXISTS entries_by_pod ON entries (pod, timestamp);
+CREATE TABLE IF NOT EXISTS events (
+  insert_id TEXT PRIMARY KEY,
+  timestamp TEXT NOT NULL,
+  pod TEXT,
+  kind TEXT NOT NULL,
+  step INTEGER
+);
+CREATE INDEX IF NOT EXISTS events_by_kind ON events (kind, timestamp);
+CREATE TABLE IF NOT EXISTS coverage (
+  filter TEXT PRIMARY KEY,
+  start TEXT NOT NULL,
+  end TEXT NOT NULL
+);
+"""
+
+
+@dataclasses.dataclass
+class LogRecord:
+  """A cached log entry, reduced to what validators read."""
+
+  timestamp: datetime
+  pod: str
+  container: str
+  message: str
+  is_struct: bool
+
+
+@dataclasses.dataclass
+class CheckpointEvent:
+  """A checkpoint event logged by Orbax.
+
+  Attributes:
+    kind: `SAVE`, `RESTORE` or `EMERGENCY_RESTORE`.
+    step: Step of the checkpoint, or None if the event has none.
+    pod: Pod that logged the event.
+    timestamp: Time of the event.
+  """
+
+  kind: str
+  step: Optional[int]
+  pod: str
+  timestamp: datetime
+
+
+def _format_time(time: datetime) -> str:
+  # A fixed-width UTC format, so that timestamps sort as strings.
+  return time.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _parse_time(time: str) -> datetime:
+  return datetime.strptime(time, "%Y-%m-%dT%H:%M:%S.%fZ").replace(
+      tzinfo=timezone.utc
+  )
+
+
+def _message(entry: logging_api.LogEntry) -> Optional[str]:
+  if isinstance(entry, logging_api.StructEntry):
+    return entry.payload.get("message")
+  if entry.payload is None:
+    return None
+  return str(entry.payload)
+
+
+def parse_event(message: Optional[str]) -> Optional[tuple[str, Optional[int]]]:
+  """Returns the kind and step of a checkpoint event message, if it is one."""
+  match = _EVENT.search(message or "")
+  if not match:
+    return None
+  step = _EVENT_STEP.search(message)
+  return match.group(1), int(step.group(1)) if step else None
+
+
+class LogSession:
+  """Answers the log queries of a cluster namespace from a local cache.
+
+  Entries are cached in a sqlite database per cluster and namespace on the
+  worker's disk, with the time range fetched for each filter. A query only
+  fetches the part of its window that isn't cached for its filter yet, and
+  fetches it for all `KNOWN_FILTERS` at once, in a single Cloud Logging call.
+  The last `INGESTION_LAG` before now is never recorded as cached, so entries
+  ingested late are still found by later queries.
+
+  Attributes:
+    start_time: Start of the queried window.
+    end_time: End of the queried window.
+  """
+
+  def __init__(
+      self,
+      project_id: str,
+      location: str,
+      cluster_name: str,
+      namespace: str = "default",
+      start_time: Optional[datetime] = None,
+      end_time: Optional[datetime] = None,
+  ):
+    self.project_id = project_id
+    self.location = location
+    self.cluster_name = cluster_name
+    self.namespace = namespace
+    # Default to the last 12 hours if no window is provided.
+    self.end_time = end_time or datetime.now(timezone.utc)
+    self.start_time = start_time or self.end_time - DEFAULT_WINDOW
+    key = (
+        f"{project_id}/{location}/{cluster_name}/{namespace}/{_SCHEMA_VERSION}"
+    )
+    self._path = os.path.join(
+        CACHE_DIR, hashlib.sha256(key.encode()).hexdigest()[:16]
+    )
+
+  @contextlib.contextmanager
+  def _database(self) -> Iterator[sqlite3.Connection]:
+    """Opens the cache, locked so concurrent tasks don't fetch twice."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(f"{self._path}.lock", "a", encoding="utf-8") as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      db = sqlite3.connect(f"{self._path}.sqlite")
+      try:
+        db.create_function(
+            "REGEXP", 2, lambda p, s: s is not None and bool(re.search(p, s))
+        )
+        db.executescript(_SCHEMA)
+        cutoff = _format_time(datetime.now(timezone.utc) - RETENTION)
+        db.execute("DELETE FROM entries WHERE timestamp < ?", (cutoff,))
+        db.execute("DELETE FROM events WHERE timestamp < ?", (cutoff,))
+        db.execute("DELETE FROM coverage WHERE start < ?", (cutoff,))
+        yield db
+        db.commit()
+      finally:
+        db.close()
+
+  def _fetch(
+      self,
+      db: sqlite3.Connection,
+      log_filters: list[str],
+      start: datetime,
+      end: datetime,
+  ) -> None:
+    """Fetches the entries matching any filter in a window into the cache."""
+    conditions = [
+        f'resource.labels.project_id="{self.project_id}"',
+        f'resource.labels.location="{self.location}"',
+        f'resource.labels.cluster_name="{self.cluster_name}"',
+        f'resource.labels.namespace_name="{self.namespace}"',
+        "severity>=DEFAULT",
+        f'timestamp>="{_format_time(start)}"',
+        f'timestamp<="{_format_time(end)}"',
+        "(" + " OR ".join(f"({f})" for f in log_filters) + ")",
+    ]
+    log_filter = " AND ".join(conditions)
+    logging.info(f"Log filter constructed: {log_filter}")
+
+    client = logging_api.Client(project=self.project_id)
+    rows, events = [], []
+    for entry in client.list_entries(filter_=log_filter, page_size=1000):
+      timestamp = _format_time(entry.timestamp)
+      pod = entry.resource.labels.get("pod_name")
+      message = _message(entry)
+      rows.append((
+          entry.insert_id,
+          timestamp,
+          pod,
+          entry.resource.labels.get("container_name"),
+          isinstance(entry, logging_api.StructEntry),
+          message,
+      ))
+      # Checkpoint events are parsed once, when they are cached.
+      if event := parse_event(message):
+        events.append((entry.insert_id, timestamp, pod, *event))
+
+    count = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    db.executemany("INSERT OR IGNORE INTO entries VALUES (?,?,?,?,?,?)", rows)
+    db.executemany("INSERT OR IGNORE INTO events VALUES (?,?,?,?,?)", events)
+    count = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - count
+    logging.info(f"Cached {count} new log entries of {self.namespace}.")
+
+  def _ensure_cached(self, db: sqlite3.Connection, log_filter: str) -> None:
+    """Fetches whatever part of the window isn't cached for a filter."""
+    start, end = self.start_time, self.end_time
+    row = db.execute(
+        "SELECT start, end FROM coverage WHERE filter = ?", (log_filter,)
+    ).fetchone()
+    if row:
+      covered_start, covered_end = map(_parse_time, row)
+      gaps = []
+      if start < covered_start:
+        gaps.append((start, covered_start))
+      if end > covered_end:
+        gaps.append((covered_end, end))
+    else:
+      gaps = [(start, end)]
+
+    log_filters = list(dict.fromkeys([log_filter, *KNOWN_FILTERS]))
+    settled = datetime.now(timezone.utc) - INGESTION_LAG
+    for gap_start, gap_end in gaps:
+      self._fetch(db, log_filters, gap_start, gap_end)
+      if gap_start >= settled:
+        continue
+      for f in log_filters:
+        self._extend_coverage(db, f, gap_start, min(gap_end, settled))
+
+  def _extend_coverage(
+      self,
+      db: sqlite3.Connection,
+      log_filter: str,
+      start: datetime,
+      end: datetime,
+  ) -> None:
+    row = db.execute(
+        "SELECT start, end FROM coverage WHERE filter = ?", (log_filter,)
+    ).fetchone()
+    if row:
+      covered_start, covered_end = map(_parse_time, row)
+      if start > covered_end or end < covered_start:
+        # Only one contiguous range is tracked, so keep the existing one.
+        return
+      start, end = min(start, covered_start), max(end, covered_end)
+    db.execute(
+        "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)",
+        (log_filter, _format_time(start), _format_time(end)),
+    )
+
+  def entries(
+      self,
+      log_filter: str,
+      pattern: re.Pattern,
+      pod_pattern: str = ".*",
+      container_name: Optional[str] = None,
+  ) -> list[LogRecord]:
+    """Returns the entries of the window whose message matches a pattern.
+
+    The cache holds entries fetched for other filters too, so `pattern` must
+    reject the messages `log_filter` would not match.
+
+    Args:
+      log_filter: Cloud Logging filter of the entries, e.g. `BACKUP_FILTER`.
+      pattern: Pattern searched for in each entry's message.
+      pod_pattern: Regex searched for in pod names.
+      container_name: Optional container name to filter logs.
+
+    Returns:
+      The matching entries, oldest first.
+    """
+    query = (
+        "SELECT timestamp, pod, container, message, is_struct FROM entries"
+        " WHERE timestamp >= ? AND timestamp <= ? AND pod REGEXP ?"
+        " AND MATCHES_PATTERN(message)"
+    )
+    params = [
+        _format_time(self.start_time),
+        _format_time(self.end_time),
+        pod_pattern,
+    ]
+    if container_name:
+      query += " AND container = ?"
+      params.append(container_name)
+    query += " ORDER BY timestamp, insert_id"
+
+    with self._database() as db:
+      # The compiled pattern is searched, so its flags apply.
+      db.create_function(
+          "MATCHES_PATTERN",
+          1,
+          lambda message: message is not None and bool(pattern.search(message)),
+      )
+      self._ensure_cached(db, log_filter)
+      records = [
+          LogRecord(
+              timestamp=_parse_time(timestamp),
+              pod=pod,
+              container=container,
+              message=message,
+              is_struct=bool(is_struct),
+          )
+          for timestamp, pod, container, message, is_struct in db.execute(
+              query, params
+          )
+      ]
+    logging.info(f"Found {len(records)} log entries matching {pattern}.")
+    return records
+
+  def checkpoint_events(
+      self,
+      kinds: tuple[str, ...] = EVENT_KINDS,
+      pod_pattern: str = ".*",
+  ) -> list[CheckpointEvent]:
+    """Returns the checkpoint events of the window.
+
+    Args:
+      kinds: Kinds of the events to return.
+      pod_pattern: Regex searched for in pod names.
+
+    Returns:
+      The events, oldest first.
+    """
+    query = (
+        "SELECT kind, step, pod, timestamp FROM events"
+        " WHERE timestamp >= ? AND timestamp <= ? AND pod REGEXP ?"
+        f" AND kind IN ({', '.join('?' * len(kinds))})"
+        " ORDER BY timestamp, insert_id"
+    )
+    params = [
+        _format_time(self.start_time),
+        _format_time(self.end_time),
+        pod_pattern,
+        *kinds,
+    ]
+
+    with self._database() as db:
+      for kind in kinds:
+        self._ensure_cached(db, EVENT_FILTERS[kind])
+      events = [
+          CheckpointEvent(
+              kind=kind, step=step, pod=pod, timestamp=_parse_time(timestamp)
+          )
+          for kind, step, pod, timestamp in db.execute(query, params)
+      ]
+    logging.info(f"Found {len(events)} {'/'.join(kinds)} events.")
+    return events
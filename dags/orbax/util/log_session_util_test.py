@@ -0,0 +1,157 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for log_session_util.py."""
+
+from datetime import datetime, timedelta, timezone
+import re
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from google.cloud.logging import Resource
+
+from dags.orbax.util import log_session_util
+
+
+_NOW = datetime.now(timezone.utc)
+_FILTER_TIME = re.compile(r'timestamp([<>]=)"([^"]+)"')
+
+
+class _FakeLoggingClient:
+  """Returns the entries in the time range of each filter."""
+
+  def __init__(self, entries):
+    self.entries = entries
+    self.windows = []
+
+  def list_entries(self, filter_, page_size):
+    del page_size
+    bounds = {
+        op: log_session_util._parse_time(time)
+        for op, time in _FILTER_TIME.findall(filter_)
+    }
+    self.windows.append((bounds[">="], bounds["<="]))
+    return [
+        entry
+        for entry in self.entries
+        if bounds[">="] <= entry.timestamp <= bounds["<="]
+    ]
+
+
+def _entry(insert_id: str, hours_ago: float, message: str):
+  return log_session_util.logging_api.TextEntry(
+      payload=message,
+      timestamp=_NOW - timedelta(hours=hours_ago),
+      insert_id=insert_id,
+      resource=Resource(
+          type="k8s_container",
+          labels={"pod_name": "pod-0", "container_name": "jax"},
+      ),
+  )
+
+
+class LogSessionTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(
+        mock.patch.object(
+            log_session_util,
+            "CACHE_DIR",
+            self.enter_context(tempfile.TemporaryDirectory()),
+        )
+    )
+    self.client = _FakeLoggingClient([
+        _entry("a", 10, "Backup for step 1"),
+        _entry("b", 6, "backup for step 2"),
+        _entry("c", 3, "{'event_type': 'save', 'step': 3}"),
+    ])
+    self.enter_context(
+        mock.patch.object(
+            log_session_util.logging_api, "Client", return_value=self.client
+        )
+    )
+
+  def _session(self, start_hours_ago: float, end_hours_ago: float):
+    return log_session_util.LogSession(
+        "project",
+        "region",
+        "cluster",
+        start_time=_NOW - timedelta(hours=start_hours_ago),
+        end_time=_NOW - timedelta(hours=end_hours_ago),
+    )
+
+  def _backups(self, session, flags=0):
+    return [
+        record.message
+        for record in session.entries(
+            log_session_util.BACKUP_FILTER,
+            re.compile("backup for step", flags),
+        )
+    ]
+
+  def test_fetches_only_the_gaps_of_the_coverage(self):
+    self._backups(self._session(8, 4))
+
+    backups = self._backups(self._session(12, 2))
+
+    self.assertEqual(backups, ["backup for step 2"])
+    self.assertEqual(
+        self.client.windows,
+        [
+            (_NOW - timedelta(hours=8), _NOW - timedelta(hours=4)),
+            (_NOW - timedelta(hours=12), _NOW - timedelta(hours=8)),
+            (_NOW - timedelta(hours=4), _NOW - timedelta(hours=2)),
+        ],
+    )
+
+  def test_merges_coverage_of_adjacent_windows(self):
+    self._backups(self._session(8, 4))
+    self._backups(self._session(12, 2))
+    self.client.windows.clear()
+
+    self._backups(self._session(11, 3))
+
+    self.assertEqual(self.client.windows, [])
+
+  def test_answers_other_known_filters_from_the_cache(self):
+    self._backups(self._session(12, 2))
+    self.client.windows.clear()
+
+    events = self._session(12, 2).checkpoint_events()
+
+    self.assertEqual([(e.kind, e.step) for e in events], [("save", 3)])
+    self.assertEqual(self.client.windows, [])
+
+  def test_fetches_the_ingestion_lag_again(self):
+    session = self._session(1, 0)
+    self._backups(session)
+    self.client.windows.clear()
+
+    self._backups(session)
+
+    lag_start, _ = self.client.windows[0]
+    self.assertGreaterEqual(
+        lag_start, _NOW - log_session_util.INGESTION_LAG - timedelta(minutes=1)
+    )
+
+  def test_keeps_pattern_flags(self):
+    backups = self._backups(self._session(12, 2), flags=re.IGNORECASE)
+
+    self.assertEqual(backups, ["Backup for step 1", "backup for step 2"])
+
+
+if __name__ == "__main__":
+  absltest.main()
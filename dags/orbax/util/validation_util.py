@@ -1,16 +1,36 @@
 """Utilities to get workloads logs and some utils."""
 
 from datetime import datetime, timezone, timedelta
-from typing import Optional
+import itertools
+from typing import Iterable, Optional
 from absl import logging
 import re
 
 from airflow.decorators import task
 from airflow.exceptions import AirflowFailException
 from google.cloud import logging as logging_api
+from dags.orbax.util import checkpoint_manifest_util
+from dags.orbax.util import log_session_util
 from xlml.apis import gcs
 
 
+# Step of a multi-tier checkpoint's metadata file, e.g.
+# <run_name>/2025-10-22_08-42/<run_name>-s199-n2-w0.meta
+_MTC_STEP_PATTERN = re.compile(r"-s(\d+)-n\d+-w\d+\.meta$", re.MULTILINE)
+# Step of a checkpoint directory, or file, named by digits only.
+_STEP_COMPONENT_PATTERN = re.compile(r"(?:^|/)(\d+)/?$", re.MULTILINE)
+_STEP_BATCH_SIZE = 10000
+
+# Patterns of the log lines read by validators, matched against cached entries.
+_BACKUP_FOLDER = re.compile(r"\d{4}-\d{2}-\d{2}_\d{2}-\d{2,}")
+_REPLICATOR_STEP = re.compile(r"step (\d+)")
+_BACKUP_STEP = re.compile(r"backup for step (\d+) to [^\s]+")
+_RESTORING = re.compile(r"Restoring from backup")
+_RESTORED_CHECKPOINT = re.compile(
+    r"Restoring from backup '[\w-]+', checkpoint (\d+)"
+)
+
+
 @task
 def generate_timestamp():
   return datetime.now(timezone.utc)
@@ -52,42 +72,23 @@ def validate_checkpoint_at_steps_are_saved(
     None: This function does not return a value.
   """
 
-  log_pattern = "'step': (\d+)"
-
-  complied_pattern = re.compile(log_pattern)
-  entries = list_log_entries(
-      project_id=project_id,
-      location=location,
-      cluster_name=cluster_name,
-      pod_pattern=pod_pattern,
-      text_filter=(
-          "\"'event_type': 'save'\" AND "
-          f'(textPayload=~"{log_pattern}" OR '
-          f'jsonPayload.message=~"{log_pattern}")'
-      ),
+  session = log_session_util.LogSession(
+      project_id,
+      location,
+      cluster_name,
       start_time=start_time,
       end_time=end_time,
   )
+  events = session.checkpoint_events(
+      (log_session_util.SAVE,), pod_pattern=pod_pattern
+  )
 
-  steps_are_saved: set[int] = set()  # Use a set for faster lookup.
-  for entry in entries:
-    message = None
-    if isinstance(entry, logging_api.TextEntry):
-      message = entry.payload
-    elif isinstance(entry, logging_api.StructEntry):
-      message = entry.payload.get("message")
-
-    if not message:
-      logging.warning(f"Could not extract message from log entry: {entry}")
-      continue
-
-    m = complied_pattern.search(message)
-    if m:
-      steps_are_saved.add(int(m.group(1)))
+  # Use a set for faster lookup.
+  steps_are_saved = {event.step for event in events if event.step is not None}
 
   for step in steps_to_validate:
     if step not in steps_are_saved:
-      logging.info(f"Found entries: {entries}")
+      logging.info(f"Found events: {events}")
       raise AirflowFailException(
           f"Failed to validate. Expect steps are saved: {steps_to_validate}; "
           f"got: {steps_are_saved}"
@@ -134,10 +135,10 @@ def validate_log_with_gcs(
     location: str,
     cluster_name: str,
     checkpoint_dir: str,
+    text_filter: str,
     namespace: str = "default",
     pod_pattern: str = ".*",
     container_name: Optional[str] = None,
-    text_filter: Optional[str] = None,
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
 ) -> None:
@@ -155,11 +156,12 @@ def validate_log_with_gcs(
     project_id: The Google Cloud project ID.
     location: The GKE cluster location.
     cluster_name: The GKE cluster name.
+    checkpoint_dir: The gs:// path of the run's checkpoints.
+    text_filter: A regex that the `textPayload` of the backup log entries
+      matches. Required, so that not every log entry of the namespace is read.
     namespace: The Kubernetes namespace. Defaults to "default".
     pod_pattern: A glob pattern to match pod names. Defaults to "*".
     container_name: An optional container name to filter logs by.
-    text_filter: An optional string to filter log entries by their
-      `textPayload`.
     start_time: The start time for log retrieval.
     end_time: The end time for log retrieval.
 
@@ -174,28 +176,28 @@ def validate_log_with_gcs(
 
   # Get the entries for the backup steps in the bucket. To later compare the
   # latest stored step in bucket with the latest recorded step in training pod.
-  entries = list_log_entries(
-      project_id=project_id,
-      location=location,
-      cluster_name=cluster_name,
+  session = log_session_util.LogSession(
+      project_id,
+      location,
+      cluster_name,
       namespace=namespace,
-      pod_pattern=pod_pattern,
-      container_name=container_name,
-      text_filter=f'textPayload=~"{text_filter}"',
       start_time=start_time,
       end_time=end_time,
   )
+  entries = session.entries(
+      f'textPayload=~"{text_filter}"',
+      re.compile(text_filter),
+      pod_pattern=pod_pattern,
+      container_name=container_name,
+  )
   gcs_save_step_list = []
   gcs_save_step_list_bucket = []
   for entry in entries:
-    if entry.payload is not None:
-      payload_str = str(entry.payload)
-      for line in payload_str.split("\n"):
+    if entry.message is not None:
+      for line in entry.message.split("\n"):
         # Extract the gcs bucket path from replicator logs
-        gcs_pattern = r"\d{4}-\d{2}-\d{2}_\d{2}-\d{2,}"
-        step_pattern = r"step (\d+)"
-        match_gcs = re.search(gcs_pattern, line)
-        match_step = re.search(step_pattern, line)
+        match_gcs = _BACKUP_FOLDER.search(line)
+        match_step = _REPLICATOR_STEP.search(line)
         validate_check_gcs = False
 
         # If could not found those values eg. gcs=2025-08-10_12-09 and step=60.
@@ -203,22 +205,20 @@ def validate_log_with_gcs(
           gcs_checkpoint_path = match_gcs.group(0)
           step = match_step.group(1)
           logging.info(f"get gcs path from: {gcs_checkpoint_path}")
-          bucket_files = gcs.obtain_file_list(
+          # Stop listing once a .meta file, kept for future comparison, and
+          # a .data file, the correct format, are found.
+          meta_file = None
+          for file in gcs.iter_file_list(
               f"{checkpoint_dir}/{gcs_checkpoint_path}/"
-          )
-          logging.info(f"gcs bucket files lenght: {len(bucket_files)}")
-          if len(bucket_files) > 0:
-            # Extract .meta file to future comparison
-            for file in bucket_files:
-              if ".meta" in file:
-                gcs_save_step_list_bucket.append(file)
-                break
-
-            # Check for correct format .data
-            for file in bucket_files:
-              if ".data" in file:
-                validate_check_gcs = True
-                break
+          ):
+            if meta_file is None and ".meta" in file:
+              meta_file = file
+            if ".data" in file:
+              validate_check_gcs = True
+            if meta_file and validate_check_gcs:
+              break
+          if meta_file:
+            gcs_save_step_list_bucket.append(meta_file)
 
           if not validate_check_gcs:
             raise AirflowFailException(
@@ -262,14 +262,20 @@ def validate_gcs_checkpoint_files(
     bucket_path: str,
     enable_multi_tier_checkpointing: bool = False,
     steps_to_validate: Optional[list] = None,
+    verify_shards: bool = False,
 ) -> None:
   """
   Validates that checkpoint files exist in GCS bucket for expected steps.
   This function uses the GCS utility to check that checkpoint files
   are properly saved in the bucket for each expected step.
+  Each step's prefix is checked concurrently, and the steps found are saved in
+  the run's manifest, so later validations only list their shards again if
+  they changed.
   Args:
     bucket_path: The full gs:// path to the GCS bucket
     steps_to_validate: Optional list of steps to validate
+    verify_shards: Whether to also check that each step is committed with a
+      manifest per OCDBT process
   Returns:
     None: Raises AirflowFailException if checkpoint validation fails
   """
@@ -281,20 +287,37 @@ def validate_gcs_checkpoint_files(
 
   logging.info("Validate GCS checkpoint files on path: %s", bucket_path)
   try:
-    checkpoint_files = gcs.obtain_file_list(bucket_path)
-    logging.info("Found checkpoint files in GCS: %s", checkpoint_files)
-    # Extract step from checkpoint files or directories
-    found_steps = set()
-    for file_path in checkpoint_files:
-      step_num = extract_step_number_from_file_path(
-          file_path, enable_multi_tier_checkpointing
-      )
-      if step_num is not None:
-        found_steps.add(step_num)
-
     expected_steps = set(steps_to_validate)
+    manifest = checkpoint_manifest_util.verify_steps(
+        bucket_path,
+        expected_steps,
+        multi_tier=enable_multi_tier_checkpointing,
+        verify_shards=verify_shards,
+    )
+    found_steps = set(manifest)
+    if expected_steps - found_steps:
+      # Steps may be laid out differently, so look for them in the listing.
+      if enable_multi_tier_checkpointing:
+        # Only the metadata files carry the step, so GCS filters out the rest.
+        found_steps |= _extract_steps(
+            gcs.iter_file_list(bucket_path, match_glob="**.meta"),
+            _MTC_STEP_PATTERN,
+        )
+      else:
+        found_steps |= _find_checkpoint_steps(bucket_path)
     missing_steps = expected_steps - found_steps
 
+    if verify_shards:
+      incomplete_steps = sorted(
+          step for step, m in manifest.items() if m.complete is False
+      )
+      if incomplete_steps:
+        raise AirflowFailException(
+            "GCS checkpoint validation failed: Steps "
+            f"{incomplete_steps} are not committed or miss shard manifests: "
+            f"{[manifest[step] for step in incomplete_steps]}"
+        )
+
     logging.info("Expected steps: %s", sorted(expected_steps))
     logging.info("Found steps: %s", sorted(found_steps))
 
@@ -312,37 +335,41 @@ def validate_gcs_checkpoint_files(
     raise AirflowFailException(f"Error validating GCS checkpoints: {e}") from e
 
 
-def extract_step_number_from_file_path(
-    path: str,
-    enable_multi_tier_checkpointing: bool,
-) -> Optional[int]:
+def _extract_steps(names: Iterable[str], pattern: re.Pattern) -> set[int]:
   """
-  Extracts the step number from a file path.
-  Args:
-    path: The full path to the file or the folder.
-    enable_multi_tier_checkpointing: Whether to enable multi-tier
-      checkpointing.
-  Returns:
-    Optional[int]: The step number extracted from the file path, or None if
-    not found.
+  Extracts the steps matched by the first group of `pattern` from names.
+
+  Names are joined into batches, and each batch is scanned by a single
+  `findall`, instead of one regex call per name.
   """
-  logging.info("checking for mtc checkpoint file path: %s", path)
-  if enable_multi_tier_checkpointing:
-    # max-mtc-resume-gcs-mtc-2x-tpu-v5p-16-2025-10-22-08-36/2025-10-22_08-42/max-mtc-resume-gcs-mtc-2x-tpu-v5p-16-2025-10-22-08-36-s199-n2-w0.meta
-    step_pattern = r"-s(\d+)-n\d+-w\d+\.meta$"
-    complied_step_pattern = re.compile(step_pattern)
-    matched = complied_step_pattern.search(path)
-    logging.info("matched: %s", matched)
-    if matched:
-      logging.info("found step: %s", matched.group(1))
-      return int(matched.group(1))
-  else:
-    path_parts = path.split("/")
-    for part in path_parts:
-      if part.isdigit():
-        logging.info("found step: %s", part)
-        return int(part)
-  return None
+  steps = set()
+  names = iter(names)
+  while batch := list(itertools.islice(names, _STEP_BATCH_SIZE)):
+    steps.update(int(step) for step in pattern.findall("\n".join(batch)))
+  return steps
+
+
+def _find_checkpoint_steps(bucket_path: str) -> set[int]:
+  """
+  Finds the steps of the checkpoints under a GCS path.
+
+  A step is the first path component made of digits only, e.g. 100 in
+  <run_name>/checkpoints/100/items/... The path is listed one directory level
+  at a time, so each step directory costs one entry however many shards it
+  holds, and the directories of a level are listed in parallel.
+  """
+  bucket_name = bucket_path.removeprefix("gs://").split("/", 1)[0]
+  steps = set()
+  level = [f"{bucket_path.rstrip('/')}/"]
+  while level:
+    names = list(gcs.iter_file_lists(level, delimiter="/"))
+    steps |= _extract_steps(names, _STEP_COMPONENT_PATTERN)
+    level = [
+        f"gs://{bucket_name}/{name}"
+        for name in names
+        if name.endswith("/") and not _STEP_COMPONENT_PATTERN.search(name)
+    ]
+  return steps
 
 
 def list_log_entries(
@@ -460,59 +487,39 @@ def validate_restored_correct_checkpoint(
 ) -> None:
   """Validate the restored step is in the expected range."""
 
-  entries = list_log_entries(
-      project_id=project_id,
-      location=location,
-      cluster_name=cluster_name,
-      namespace="default",
-      pod_pattern=pod_pattern,
-      text_filter=(
-          "(textPayload:\"'event_type'\" OR jsonPayload.message:\"'event_type'\")"
-      ),
+  session = log_session_util.LogSession(
+      project_id,
+      location,
+      cluster_name,
       start_time=start_time,
       end_time=end_time,
   )
+  events = session.checkpoint_events(pod_pattern=pod_pattern)
 
-  if not entries:
+  if not events:
     raise AirflowFailException("No event_type found in the log.")
 
   local_saved_steps_before_restore = []
-  for entry in entries:
-    message = None
-    if isinstance(entry, logging_api.TextEntry):
-      message = entry.payload
-    elif isinstance(entry, logging_api.StructEntry):
-      message = entry.payload.get("message")
-
-    if not message:
-      logging.warning(f"Could not extract message from log entry: {entry}")
-      continue
-
-    if re.search(r"'event_type': 'save'", message):
-      saved_step_match = re.search(r"'step': (\d+)", message)
-      if not saved_step_match:
+  for event in events:
+    if event.kind == log_session_util.SAVE:
+      if event.step is None:
         raise AirflowFailException(
-            f"Found save event with no step number, message: {message}"
+            f"Found save event with no step number: {event}"
         )
 
-      local_saved_steps_before_restore.append(int(saved_step_match.group(1)))
+      local_saved_steps_before_restore.append(event.step)
 
-    elif re.search(r"'event_type': '(emergency_)?restore'", message):
-      logging.info("Found restore event: %s", message)
+    else:
+      logging.info("Found restore event: %s", event)
       logging.info(
           "Saved steps before restore: %s", local_saved_steps_before_restore
       )
 
-      restored_step_match = re.search(
-          r"'step':\s*(?:np\.int32\()?(\d+)", message
-      )
-      restored_step = (
-          int(restored_step_match.group(1)) if restored_step_match else None
-      )
+      restored_step = event.step
 
       if not restored_step:
         raise AirflowFailException(
-            f"Found restore event with no step number, message: {message}"
+            f"Found restore event with no step number: {event}"
         )
 
       if restored_step < interrupt_at_step:
@@ -552,7 +559,7 @@ def validate_replicator_gcs_restore_log(
     location: str,
     cluster_name: str,
     namespace: str = "default",
-    pod_pattern: str = "*",
+    pod_pattern: str = ".*",
     container_name: Optional[str] = None,
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
@@ -578,33 +585,30 @@ def validate_replicator_gcs_restore_log(
     None: Raises AirflowFailException if replicator GCS restore validation
       fails
   """
-  entries = list_log_entries(
-      project_id=project_id,
-      location=location,
-      cluster_name=cluster_name,
+  session = log_session_util.LogSession(
+      project_id,
+      location,
+      cluster_name,
       namespace=namespace,
-      pod_pattern=pod_pattern,
-      container_name=container_name,
-      text_filter="Restoring from backup",
       start_time=start_time,
       end_time=end_time,
   )
+  entries = session.entries(
+      log_session_util.RESTORE_FILTER,
+      _RESTORING,
+      pod_pattern=pod_pattern,
+      container_name=container_name,
+  )
 
   restored_steps = set()
 
   for entry in entries:
-    if not entry.payload:
-      continue
-    payload_str = str(entry.payload)
-
-    for line in payload_str.split("\n"):
+    for line in entry.message.split("\n"):
       # Look for restore initiation logs
       if "Restoring from backup" in line and "checkpoint" in line:
         # Extract step from restore log
         # Example: "Restoring from backup '2025-08-22_03-01', checkpoint 120"
-        checkpoint_match = re.search(
-            r"Restoring from backup '[\w-]+', checkpoint (\d+)", line
-        )
+        checkpoint_match = _RESTORED_CHECKPOINT.search(line)
 
         if checkpoint_match:
           step = checkpoint_match.group(1)
@@ -646,7 +650,7 @@ def validate_replicator_gcs_backup_log(
     location: str,
     cluster_name: str,
     namespace: str = "default",
-    pod_pattern: str = "*",
+    pod_pattern: str = ".*",
     container_name: Optional[str] = None,
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
@@ -672,30 +676,28 @@ def validate_replicator_gcs_backup_log(
   Raises:
     AirflowFailException: If replicator backup validation fails
   """
-  step_regex = "backup for step (\d+) to [^\s]+"
-  entries = list_log_entries(
-      project_id=project_id,
-      location=location,
-      cluster_name=cluster_name,
+  session = log_session_util.LogSession(
+      project_id,
+      location,
+      cluster_name,
       namespace=namespace,
-      pod_pattern=pod_pattern,
-      container_name=container_name,
-      text_filter=f'textPayload=~"{step_regex}"',
       start_time=start_time,
       end_time=end_time,
   )
+  entries = session.entries(
+      log_session_util.BACKUP_FILTER,
+      _BACKUP_STEP,
+      pod_pattern=pod_pattern,
+      container_name=container_name,
+  )
 
   backed_up_steps = set()
 
   for entry in entries:
-    if not entry.payload:
-      continue
-    payload_str = str(entry.payload)
-
-    for line in payload_str.split("\n"):
+    for line in entry.message.split("\n"):
       # Extract step from backup log
       # Example: "backup for step 399 to backup/gcs/2025-10-30_07-15"
-      backup_match = re.search(rf"{step_regex}", line)
+      backup_match = _BACKUP_STEP.search(line)
 
       if backup_match:
         step = int(backup_match.group(1))
@@ -19,6 +19,7 @@ This is done by comparing data from Cloud Logging and Cloud Monitoring.
 """
 
 import datetime
+import logging
 import os
 import re
 import subprocess
@@ -50,6 +51,7 @@ from dags.common.scheduling_helper.scheduling_helper import SchedulingHelper, ge
 DAG_ID = "tpu_info_format_validation_dag"
 DAGRUN_TIMEOUT = get_dag_timeout(DAG_ID)
 SCHEDULE = SchedulingHelper.arrange_schedule_time(DAG_ID)
+TPU_INFO_TIMEOUT = datetime.timedelta(minutes=5)
 
 
 @task
@@ -58,8 +60,8 @@ def get_tpu_info_from_pod(info: node_pool.Info, pod_name: str) -> str:
   Executes the `tpu-info` command in a specified pod and returns its output.
 
   This task uses kubectl to run the 'tpu-info' command inside the given pod
-  in the 'default' namespace. The output of the command is captured and
-  returned.
+  in the 'default' namespace. The output of the command is streamed, so it is
+  logged as it is produced, and returned.
 
   Args:
     kubeconfig: The path to the kubeconfig file.
@@ -77,7 +79,16 @@ def get_tpu_info_from_pod(info: node_pool.Info, pod_name: str) -> str:
         f"kubectl exec {pod_name} -n default -- tpu-info",
     ])
 
-    return subprocess.run_exec(cmd, env=env)
+    lines = []
+
+    def collect(line: str) -> None:
+      logging.info("[tpu-info] %s", line)
+      lines.append(line)
+
+    subprocess.stream_exec(
+        cmd, on_line=collect, env=env, timeout=TPU_INFO_TIMEOUT.total_seconds()
+    )
+    return "\n".join(lines)
 
 
 @task
@@ -14,6 +14,7 @@
 
 """Utilities for managing JobSets in GKE clusters for TPU observability."""
 
+import contextlib
 import enum
 import dataclasses
 from datetime import timedelta
@@ -22,9 +23,8 @@ import logging
 import os
 import random
 import string
-import tempfile
 import textwrap
-from typing import Final
+from typing import Final, Iterator
 
 from airflow.decorators import task
 from airflow.exceptions import AirflowFailException
@@ -40,6 +40,7 @@ from dags.tpu_observability.utils.time_util import TimeUtil
 from xlml.apis import gcs
 from xlml.utils import composer
 from xlml.utils import gke
+from xlml.utils import workload_status
 
 
 @task
@@ -334,6 +335,41 @@ class Command:
     return Command.k8s_get_pods(jobset_name, namespace, output)
 
 
+@contextlib.contextmanager
+def _kubectl_env(
+    node_pool: node_pool_info,
+) -> Iterator[tuple[str, dict[str, str]]]:
+  """Provides a kubeconfig of a node pool's cluster, and its env.
+
+  This replaces `Command.get_credentials_command` before `kubectl` commands,
+  without running gcloud. The kubeconfig is removed when the context exits.
+  """
+  for attr_name in ["cluster_name", "region", "project_id"]:
+    if not getattr(node_pool, attr_name):
+      raise ValueError(f"{attr_name} must be set in the Info object.")
+
+  with gke.kubeconfig(
+      node_pool.project_id, node_pool.region, node_pool.cluster_name
+  ) as kubeconfig:
+    yield kubeconfig, {**os.environ, "KUBECONFIG": kubeconfig}
+
+
+def _list_jobset_pods(
+    node_pool: node_pool_info, jobset_name: str, namespace: str
+) -> list[kubernetes.client.V1Pod]:
+  """Lists the pods of a JobSet with the Kubernetes API."""
+  api_client = gke.get_authenticated_client(
+      node_pool.project_id,
+      node_pool.region,
+      node_pool.cluster_name,
+  )
+  pods = kubernetes.client.CoreV1Api(api_client).list_namespaced_pod(
+      namespace,
+      label_selector=f"{workload_status.JOBSET_NAME_LABEL}={jobset_name}",
+  )
+  return pods.items
+
+
 def get_replica_num(
     replica_type: str, job_name: str, node_pool: node_pool_info
 ) -> int:
@@ -400,27 +436,13 @@ def get_running_pods(
     A list containing the names of all the pods in the "running" state as
       strings.
   """
-  with tempfile.TemporaryDirectory() as tmpdir:
-    env = os.environ.copy()
-    env["KUBECONFIG"] = os.path.join(tmpdir, "kubeconfig")
-
-    cmd = " && ".join([
-        Command.get_credentials_command(node_pool),
-        Command.k8s_get_pod_name_command(
-            jobset_name, namespace, Command.K8sGetPodsOutput.DEFAULT
-        ),
-    ])
-
-    stdout = subprocess.run_exec(cmd, env=env)
-    data = json.loads(stdout)
-
-    running_pods = [
-        item["metadata"]["name"]
-        for item in data.get("items", [])
-        if item.get("status", {}).get("phase") == "Running"
-    ]
+  running_pods = [
+      pod.metadata.name
+      for pod in _list_jobset_pods(node_pool, jobset_name, namespace)
+      if pod.status.phase == "Running"
+  ]
 
-    logging.info("Running pods for JobSet '%s': %s", jobset_name, running_pods)
+  logging.info("Running pods for JobSet '%s': %s", jobset_name, running_pods)
 
   return running_pods
 
@@ -494,39 +516,30 @@ def run_workload(
   Returns:
     The UTC time when the workload was started.
   """
-  with tempfile.NamedTemporaryFile() as temp_config_file:
-    env = os.environ.copy()
-    env["KUBECONFIG"] = temp_config_file.name
-    yaml_config = jobset_config.generate_yaml(workload_script=workload_type)
-
-    cmd = " && ".join([
-        Command.get_credentials_command(node_pool),
-        Command.k8s_apply_jobset_command(
-            temp_config_file.name, yaml_config, jobset_config.namespace
-        ),
-    ])
-
+  yaml_config = jobset_config.generate_yaml(workload_script=workload_type)
+  with _kubectl_env(node_pool) as (kubeconfig, env):
+    cmd = Command.k8s_apply_jobset_command(
+        kubeconfig, yaml_config, jobset_config.namespace
+    )
     subprocess.run_exec(cmd, env=env)
 
-    # Log metadata for XLML dashboard
-    # Pod names follow the pattern:
-    #   {jobset_name}-{replicated_job_name}-{job-index}-{pod-index}-{random}
-    # The jobset_name prefix is stable across pod recreations, so a regex
-    # pattern is more reliable than an exact pod name list.
-    pod_name_pattern = f"{jobset_config.jobset_name}.*"
-    jobset_metadata = {
-        "project_id": node_pool.project_id,
-        "cluster_name": node_pool.cluster_name,
-        "node_pool_name": node_pool.node_pool_name,
-        "jobset_name": jobset_config.jobset_name,
-        "pod_name_pattern": pod_name_pattern,
-    }
-    composer.log_metadata_for_xlml_dashboard(jobset_metadata)
-    logging.info(
-        "Logged JobSet metadata to XLML dashboard: %s", jobset_metadata
-    )
+  # Log metadata for XLML dashboard
+  # Pod names follow the pattern:
+  #   {jobset_name}-{replicated_job_name}-{job-index}-{pod-index}-{random}
+  # The jobset_name prefix is stable across pod recreations, so a regex
+  # pattern is more reliable than an exact pod name list.
+  pod_name_pattern = f"{jobset_config.jobset_name}.*"
+  jobset_metadata = {
+      "project_id": node_pool.project_id,
+      "cluster_name": node_pool.cluster_name,
+      "node_pool_name": node_pool.node_pool_name,
+      "jobset_name": jobset_config.jobset_name,
+      "pod_name_pattern": pod_name_pattern,
+  }
+  composer.log_metadata_for_xlml_dashboard(jobset_metadata)
+  logging.info("Logged JobSet metadata to XLML dashboard: %s", jobset_metadata)
 
-    return TimeUtil.now()
+  return TimeUtil.now()
 
 
 @task
@@ -534,28 +547,20 @@ def end_workload(node_pool: node_pool_info, jobset_config: JobSet):
   """
   Deletes all JobSets from the GKE cluster to clean up resources.
 
-  This task executes a bash script to:
-  1. Authenticate `gcloud` with the specified GKE cluster.
-  2. Delete all JobSets in the `default` namespace using `kubectl`.
+  This task deletes the JobSet using `kubectl`, with a kubeconfig written
+  from the cluster's cached client.
 
   Args:
     node_pool: Configuration object with cluster details.
     jobset_name: The name of the JobSet to delete.
     namespace: The Kubernetes namespace to delete the JobSet from.
   """
-  with tempfile.NamedTemporaryFile() as temp_config_file:
-    env = os.environ.copy()
-    env["KUBECONFIG"] = temp_config_file.name
-
-    cmd = " && ".join([
-        Command.get_credentials_command(node_pool),
-        Command.k8s_delete_jobset_command(
-            temp_config_file.name,
-            jobset_config.jobset_name,
-            jobset_config.namespace,
-        ),
-    ])
-
+  with _kubectl_env(node_pool) as (kubeconfig, env):
+    cmd = Command.k8s_delete_jobset_command(
+        kubeconfig,
+        jobset_config.jobset_name,
+        jobset_config.namespace,
+    )
     subprocess.run_exec(cmd, env=env)
 
 
@@ -567,9 +572,8 @@ def list_pod_names(
   Lists the names of all active pods in the specified namespace for a given
   JobSet.
 
-  This task executes a series of shell commands to:
-  1. Authenticate `gcloud` and generate a temporary kubeconfig for the cluster.
-  2. Query `kubectl` to fetch pod names filtered by the provided namespace.
+  The pods are listed with the Kubernetes API, filtered by the JobSet's label
+  in the provided namespace.
 
   Args:
     node_pool: Configuration object with cluster details.
@@ -582,27 +586,18 @@ def list_pod_names(
     AirflowFailException: If the command returns an empty output or fails to
       retrieve any pod names.
   """
-  with tempfile.NamedTemporaryFile() as temp_config_file:
-    env = os.environ.copy()
-    env["KUBECONFIG"] = temp_config_file.name
-
-    cmd = " && ".join([
-        Command.get_credentials_command(node_pool),
-        Command.k8s_get_pod_name_command(
-            jobset_config.jobset_name,
-            jobset_config.namespace,
-            Command.K8sGetPodsOutput.POD_NAME,
-        ),
-    ])
-
-    stdout = subprocess.run_exec(cmd, env=env)
+  pod_list = [
+      pod.metadata.name
+      for pod in _list_jobset_pods(
+          node_pool, jobset_config.jobset_name, jobset_config.namespace
+      )
+  ]
 
-    if not stdout or not stdout.strip():
-      logging.warning("Received empty pod list from bash task.")
-      raise AirflowFailException("Received empty pod list from bash task.")
+  if not pod_list:
+    logging.warning("Received empty pod list.")
+    raise AirflowFailException("Received empty pod list.")
 
-    pod_list = stdout.strip().split()
-    return pod_list
+  return pod_list
 
 
 @task
@@ -615,7 +610,8 @@ def delete_one_random_pod(
 
   This task is used for fault injection to test the self-healing and recovery
   capabilities of a JobSet. It first retrieves all running pods in the
-  specified namespace and then triggers a deletion via kubectl.
+  specified namespace and then deletes one with the Kubernetes API, without
+  waiting for it to terminate.
 
   Args:
     node_pool: The Info object containing the cluster information needed for
@@ -643,19 +639,15 @@ def delete_one_random_pod(
   target_pod = random.choice(running_pods)
   logging.info("Targeting pod for deletion: %s", target_pod)
 
-  with tempfile.NamedTemporaryFile() as temp_config_file:
-    env = os.environ.copy()
-    env["KUBECONFIG"] = temp_config_file.name
-
-    cmd = " && ".join([
-        Command.get_credentials_command(node_pool),
-        Command.k8s_delete_pod_command(
-            temp_config_file.name, target_pod, jobset_config.namespace
-        ),
-    ])
-
-    subprocess.run_exec(cmd, env=env)
-    logging.info("Successfully initiated deletion for pod: %s", target_pod)
+  api_client = gke.get_authenticated_client(
+      node_pool.project_id,
+      node_pool.region,
+      node_pool.cluster_name,
+  )
+  kubernetes.client.CoreV1Api(api_client).delete_namespaced_pod(
+      target_pod, jobset_config.namespace
+  )
+  logging.info("Successfully initiated deletion for pod: %s", target_pod)
 
 
 @task.sensor(poke_interval=30, timeout=900, mode="poke")
@@ -12,18 +12,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Utility functions for managing GKE node pools."""
+"""Utility functions for managing GKE node pools.
 
+Node pools and their instances are managed through the GKE and Compute Engine
+API clients, which are created once per process. Reads fall back to the
+equivalent gcloud command if their API call fails. Mutations only fall back if
+the API can't be used at all, since a failed call may still have been acted
+on. gcloud is used for everything if `USE_GCLOUD` is set.
+"""
+
+import concurrent.futures
 import dataclasses
 import datetime
 import enum
+import functools
 import json
 import logging
+import os
 import random
 import re
+import time
+from typing import Callable
 
 from airflow.decorators import task
 from airflow.exceptions import AirflowFailException
+from google.api_core import exceptions
+import google.auth.exceptions
+from google.cloud import compute_v1
+from google.cloud import container_v1
 from google.cloud import monitoring_v3
 
 from dags.tpu_observability.utils.time_util import TimeUtil
@@ -42,6 +58,45 @@ on the correct node pool. It is applied to both:
 - JobSet YAML via `nodeSelector` to target the labeled nodes
 """
 
+USE_GCLOUD = os.environ.get("NODE_POOL_USE_GCLOUD", "").lower() in (
+    "1",
+    "true",
+)
+"""Whether to manage node pools with gcloud commands instead of API clients."""
+
+OPERATION_TIMEOUT = datetime.timedelta(hours=1)
+OPERATION_POLL_INTERVAL = datetime.timedelta(seconds=10)
+LIST_INSTANCES_CONCURRENCY = 8
+
+# Defaults that `gcloud container node-pools create` sets on the client side,
+# which the API doesn't apply. node_pool_util_test pins them, so they are
+# updated together with gcloud rather than drifting.
+NODE_OAUTH_SCOPES = (
+    "https://www.googleapis.com/auth/devstorage.read_only",
+    "https://www.googleapis.com/auth/logging.write",
+    "https://www.googleapis.com/auth/monitoring",
+    "https://www.googleapis.com/auth/service.management.readonly",
+    "https://www.googleapis.com/auth/servicecontrol",
+    "https://www.googleapis.com/auth/trace.append",
+)
+NODE_METADATA = {"disable-legacy-endpoints": "true"}
+NODE_AUTO_REPAIR = True
+NODE_AUTO_UPGRADE = True
+
+# Errors for which the API wasn't reached or can't be used, e.g. because it
+# isn't enabled, so a request is known not to have been acted on.
+_API_UNAVAILABLE = (
+    google.auth.exceptions.GoogleAuthError,
+    exceptions.Unauthenticated,
+    exceptions.PermissionDenied,
+    exceptions.MethodNotImplemented,
+)
+
+# The zone and name of an instance group, in its URL.
+_INSTANCE_GROUP_URL = re.compile(
+    r"zones/([\w-]+)/instanceGroupManagers/([\w-]+)"
+)
+
 
 class Status(enum.Enum):
   """Enum for GKE node pool status."""
@@ -174,21 +229,190 @@ def copy_node_pool_info_with_override(info: Info, **overrides) -> Info:
   return replaced_info
 
 
-def _node_pool_exists(node_pool: Info) -> bool:
-  check_cmd = (
+@functools.cache
+def _cluster_manager() -> container_v1.ClusterManagerClient:
+  return container_v1.ClusterManagerClient()
+
+
+@functools.cache
+def _instance_groups() -> compute_v1.InstanceGroupsClient:
+  return compute_v1.InstanceGroupsClient()
+
+
+@functools.cache
+def _instances() -> compute_v1.InstancesClient:
+  return compute_v1.InstancesClient()
+
+
+def _location_path(node_pool: Info) -> str:
+  return f"projects/{node_pool.project_id}/locations/{node_pool.location}"
+
+
+def _node_pool_path(node_pool: Info) -> str:
+  return (
+      f"{_location_path(node_pool)}/clusters/{node_pool.cluster_name}"
+      f"/nodePools/{node_pool.node_pool_name}"
+  )
+
+
+def _with_fallback(
+    native: Callable[[], object], command: str, mutation: bool = False
+) -> object:
+  """Calls an API client, or runs a gcloud command if it fails.
+
+  Args:
+    native: Calls the API client.
+    command: The equivalent gcloud command.
+    mutation: Whether the call changes resources. Mutations only fall back if
+      the API can't be used, so a request the API may have acted on isn't sent
+      again.
+
+  Returns:
+    The result of `native`, or the stdout of `command`.
+  """
+  if not USE_GCLOUD:
+    try:
+      return native()
+    except exceptions.NotFound:
+      raise
+    except _API_UNAVAILABLE as e:
+      logging.warning("API unavailable, falling back to gcloud: %s", e)
+    except exceptions.GoogleAPICallError as e:
+      if mutation:
+        raise
+      logging.warning("API call failed, falling back to gcloud: %s", e)
+  return subprocess.run_exec(command)
+
+
+def _describe(node_pool: Info) -> container_v1.NodePool:
+  """Gets a node pool.
+
+  Raises:
+    google.api_core.exceptions.NotFound: If the node pool doesn't exist.
+  """
+  command = (
       f"gcloud container node-pools describe {node_pool.node_pool_name} "
       f"--project={node_pool.project_id} "
       f"--cluster={node_pool.cluster_name} "
       f"--location={node_pool.location} "
-      f"--format='value(name)'"
+      "--format=json"
   )
+  result = _with_fallback(
+      lambda: _cluster_manager().get_node_pool(name=_node_pool_path(node_pool)),
+      command,
+  )
+  if isinstance(result, str):
+    return container_v1.NodePool.from_json(result, ignore_unknown_fields=True)
+  return result
+
+
+def _wait_for_operation(
+    node_pool: Info, operation: container_v1.Operation
+) -> None:
+  """Polls a GKE operation until it is done.
+
+  Raises:
+    AirflowFailException: If the operation fails or times out.
+  """
+  name = f"{_location_path(node_pool)}/operations/{operation.name}"
+  deadline = time.monotonic() + OPERATION_TIMEOUT.total_seconds()
+  while operation.status != container_v1.Operation.Status.DONE:
+    if time.monotonic() > deadline:
+      raise AirflowFailException(
+          f"Operation {operation.name} did not finish within "
+          f"{OPERATION_TIMEOUT}."
+      )
+    time.sleep(OPERATION_POLL_INTERVAL.total_seconds())
+    operation = _cluster_manager().get_operation(name=name)
+
+  if operation.error.message:
+    raise AirflowFailException(
+        f"Operation {operation.name} failed: {operation.error.message}"
+    )
+  logging.info("Operation %s is done.", operation.name)
+
+
+def _run_operation(
+    node_pool: Info,
+    native: Callable[[], container_v1.Operation],
+    command: str,
+) -> None:
+  """Starts a GKE operation and waits for it, or runs a gcloud command."""
+  result = _with_fallback(native, command, mutation=True)
+  if isinstance(result, container_v1.Operation):
+    _wait_for_operation(node_pool, result)
+
+
+def _node_pool_exists(node_pool: Info) -> bool:
   try:
-    subprocess.run_exec(check_cmd)
+    _describe(node_pool)
     return True
   except Exception:
     return False
 
 
+def _new_node_pool(node_pool: Info) -> container_v1.NodePool:
+  """Builds the node pool of the `gcloud container node-pools create` flags.
+
+  The defaults that gcloud sets on the client side are set explicitly, so
+  nodes can pull images and are repaired the same way either way.
+  """
+  config = container_v1.NodeConfig(
+      machine_type=node_pool.machine_type,
+      oauth_scopes=list(NODE_OAUTH_SCOPES),
+      metadata=NODE_METADATA,
+  )
+  if node_pool.reservation:
+    config.reservation_affinity = container_v1.ReservationAffinity(
+        consume_reservation_type=(
+            container_v1.ReservationAffinity.Type.SPECIFIC_RESERVATION
+        ),
+        key="compute.googleapis.com/reservation-name",
+        values=[node_pool.reservation],
+    )
+  if node_pool.node_pool_selector:
+    config.labels = {NODE_POOL_SELECTOR_KEY: node_pool.node_pool_selector}
+  return container_v1.NodePool(
+      name=node_pool.node_pool_name,
+      initial_node_count=node_pool.num_nodes,
+      locations=node_pool.node_locations.split(","),
+      config=config,
+      placement_policy=container_v1.NodePool.PlacementPolicy(
+          tpu_topology=node_pool.tpu_topology
+      ),
+      management=container_v1.NodeManagement(
+          auto_repair=NODE_AUTO_REPAIR, auto_upgrade=NODE_AUTO_UPGRADE
+      ),
+  )
+
+
+def _running_operations(node_pool: Info) -> str:
+  """Describes the running operations on a node pool, for debugging."""
+  command = (
+      "gcloud container operations list "
+      f"--project={node_pool.project_id} "
+      f"--region={node_pool.location} "
+      f"--filter='status=RUNNING AND targetLink:{node_pool.node_pool_name}' "
+      f"--format='json(name,status)'"
+  )
+  result = _with_fallback(
+      lambda: _cluster_manager().list_operations(
+          parent=_location_path(node_pool)
+      ),
+      command,
+  )
+  if isinstance(result, str):
+    return result
+  return json.dumps(
+      [
+          {"name": op.name, "status": op.status.name}
+          for op in result.operations
+          if op.status == container_v1.Operation.Status.RUNNING
+          and node_pool.node_pool_name in op.target_link
+      ]
+  )
+
+
 @task
 def create(
     node_pool: Info,
@@ -233,29 +457,30 @@ def create(
   if node_pool.node_pool_selector:
     command += f" --node-labels={NODE_POOL_SELECTOR_KEY}={node_pool.node_pool_selector}"
 
-  if ignore_failure:
-    command += "2>&1 || true "
-
   try:
-    subprocess.run_exec(command)
-  except Exception as e:
-    debug_cmd = (
-        "gcloud container operations list "
-        f"--project={node_pool.project_id} "
-        f"--region={node_pool.location} "
-        f"--filter='status=RUNNING AND targetLink:{node_pool.node_pool_name}' "
-        f"--format='json(name,status)'"
+    _run_operation(
+        node_pool,
+        lambda: _cluster_manager().create_node_pool(
+            parent=(
+                f"{_location_path(node_pool)}/clusters/{node_pool.cluster_name}"
+            ),
+            node_pool=_new_node_pool(node_pool),
+        ),
+        command,
     )
-    debug_res = subprocess.run_exec(debug_cmd)
-
+  except Exception as e:
+    if ignore_failure:
+      logging.warning("Ignoring failure to create the node pool: %s", e)
+      return
     raise AirflowFailException(
-        f"Primary task failed. Current operations:\n{debug_res}"
+        "Primary task failed. Current operations:\n"
+        f"{_running_operations(node_pool)}"
     ) from e
 
 
 @task
 def delete(node_pool: Info) -> None:
-  """Deletes the GKE node pool using gcloud command."""
+  """Deletes the GKE node pool."""
 
   """Check if the node pool is valid."""
   if not _node_pool_exists(node_pool):
@@ -272,14 +497,47 @@ def delete(node_pool: Info) -> None:
       "--quiet"
   )
 
-  subprocess.run_exec(command)
+  _run_operation(
+      node_pool,
+      lambda: _cluster_manager().delete_node_pool(
+          name=_node_pool_path(node_pool)
+      ),
+      command,
+  )
+
+
+def _list_instances(
+    project_id: str, zone: str, instance_group: str
+) -> list[str]:
+  """Lists the instance URLs of an instance group."""
+  command = (
+      "gcloud compute instance-groups list-instances"
+      f" {instance_group} "
+      f"--project={project_id} "
+      f"--zone={zone} "
+      "--format='json(instance)'"
+  )
+  result = _with_fallback(
+      lambda: _instance_groups().list_instances(
+          project=project_id,
+          zone=zone,
+          instance_group=instance_group,
+          instance_groups_list_instances_request_resource=(
+              compute_v1.InstanceGroupsListInstancesRequest()
+          ),
+      ),
+      command,
+  )
+  if isinstance(result, str):
+    return [item["instance"] for item in json.loads(result)]
+  return [item.instance for item in result]
 
 
 def list_nodes(node_pool: Info) -> list[str]:
   """Lists all node names in the specified GKE node pool.
 
   It queries GKE and Compute APIs and parses instance group URLs
-  to extract VM instance names.
+  to extract VM instance names. The instance groups are listed concurrently.
 
   Args:
       node_pool: An instance of the Info class that encapsulates the
@@ -289,61 +547,43 @@ def list_nodes(node_pool: Info) -> list[str]:
   Raises:
       RuntimeError: If no instance groups or zone are found for the node pool.
   """
-  instance_group_urls_key = "instanceGroupUrls"
-
-  command = (
-      f"gcloud container node-pools describe {node_pool.node_pool_name} "
-      f"--project={node_pool.project_id} "
-      f"--cluster={node_pool.cluster_name} "
-      f"--location={node_pool.location} "
-      f"--format='json({instance_group_urls_key})'"
-  )
-
-  stdout = subprocess.run_exec(command)
-
-  instance_group_urls_val = json.loads(stdout).get(instance_group_urls_key, [])
-  if not instance_group_urls_val:
+  instance_group_urls = _describe(node_pool).instance_group_urls
+  if not instance_group_urls:
     raise AirflowFailException(
         f"No instance groups found for node pool {node_pool.node_pool_name}."
     )
 
-  node_names = []
-
-  for url in instance_group_urls_val:
-    # Extract the {instance_group_name} segments from an URL:
-    # https://www.googleapis.com/compute/v1/projects/tpu-prod-env-one-vm/zones/asia-northeast1-b/instanceGroups/gke-yuna-xpk-v6e-2-yuna-xpk-v6e-2-np--b3a745c7-grp
+  instance_groups = []
+  for url in instance_group_urls:
+    # Extract the {zone} and {instance_group_name} segments from an URL:
+    # https://www.googleapis.com/compute/v1/projects/tpu-prod-env-one-vm/zones/asia-northeast1-b/instanceGroupManagers/gke-yuna-xpk-v6e-2-yuna-xpk-v6e-2-np--b3a745c7-grp
     # in which, `gke-yuna-xpk-v6e-2-yuna-xpk-v6e-2-np--b3a745c7-grp`
     # is the of the instance group
-    match = re.search(r"instanceGroupManagers/([\w-]+)", url)
+    match = _INSTANCE_GROUP_URL.search(url)
     if not match:
       logging.warning("Could not parse instance group URL: %s", url)
       continue
-
-    instance_group_name = match.group(1)
-
-    command = (
-        "gcloud compute instance-groups list-instances"
-        f" {instance_group_name} "
-        f"--project={node_pool.project_id} "
-        f"--zone={node_pool.node_locations} "
-        "--format='json(instance)'"
+    instance_groups.append(match.groups())
+
+  with concurrent.futures.ThreadPoolExecutor(
+      LIST_INSTANCES_CONCURRENCY
+  ) as executor:
+    instance_lists = executor.map(
+        lambda group: _list_instances(node_pool.project_id, *group),
+        instance_groups,
     )
-    stdout = subprocess.run_exec(command)
-
-    instances = json.loads(stdout)
-
-    for instance_item in instances:
-      instance_url = instance_item["instance"]
-      # Extract the {node_name} segments from an URL like this:
-      # https://www.googleapis.com/compute/v1/projects/<project>/zones/<zone>/instances/<node_name>
-      # in which, `gke-tpu-b3a745c7-08bk` is the name of the node
-      node_name = re.search(r"gke[\w-]+", instance_url).group()
-      if node_name:
-        node_names.append(node_name)
-      else:
-        logging.warning(
-            "Could not extract node name from URL: %s", instance_url
-        )
+    instance_urls = [url for urls in instance_lists for url in urls]
+
+  node_names = []
+  for instance_url in instance_urls:
+    # Extract the {node_name} segments from an URL like this:
+    # https://www.googleapis.com/compute/v1/projects/<project>/zones/<zone>/instances/<node_name>
+    # in which, `gke-tpu-b3a745c7-08bk` is the name of the node
+    match = re.search(r"gke[\w-]+", instance_url)
+    if match:
+      node_names.append(match.group())
+    else:
+      logging.warning("Could not extract node name from URL: %s", instance_url)
   return node_names
 
 
@@ -382,7 +622,17 @@ def delete_one_random_node(node_pool: Info) -> None:
       "--quiet"
   )
 
-  subprocess.run_exec(command)
+  result = _with_fallback(
+      lambda: _instances().delete(
+          project=node_pool.project_id,
+          zone=node_pool.node_locations,
+          instance=node_to_delete,
+      ),
+      command,
+      mutation=True,
+  )
+  if not isinstance(result, str):
+    result.result(timeout=OPERATION_TIMEOUT.total_seconds())
 
 
 def _query_status_metric(node_pool: Info) -> Status:
@@ -481,7 +731,7 @@ def wait_for_status(
 
 @task
 def rollback(node_pool: Info) -> None:
-  """Performs a rollback on given GKE node pool using the gcloud command.
+  """Performs a rollback on given GKE node pool.
 
   Args:
       node_pool: An instance of the Info class that encapsulates the
@@ -495,7 +745,13 @@ def rollback(node_pool: Info) -> None:
       f"--quiet"
   )
 
-  subprocess.run_exec(command)
+  _run_operation(
+      node_pool,
+      lambda: _cluster_manager().rollback_node_pool_upgrade(
+          name=_node_pool_path(node_pool)
+      ),
+      command,
+  )
 
 
 @task.sensor(poke_interval=30, timeout=1200, mode="poke")
@@ -639,7 +895,7 @@ def wait_for_ttr(
 
 
 def get_node_pool_disk_size(node_pool: Info) -> int:
-  """Gets the disk size of a GKE node pool using gcloud command.
+  """Gets the disk size of a GKE node pool.
 
   Args:
     node_pool: An instance of the Info class that encapsulates the
@@ -648,21 +904,11 @@ def get_node_pool_disk_size(node_pool: Info) -> int:
   Returns:
     The disk size of the node pool in GB.
   """
-  command = (
-      f"gcloud container node-pools describe {node_pool.node_pool_name} "
-      f"--project={node_pool.project_id} "
-      f"--cluster={node_pool.cluster_name} "
-      f"--location={node_pool.location} "
-      f'--format="value(config.diskSizeGb)"'
-  )
-
-  result = subprocess.run_exec(command).strip()
-
-  return int(result)
+  return _describe(node_pool).config.disk_size_gb
 
 
 def get_node_pool_labels(node_pool: Info) -> dict[str, str]:
-  """Gets the labels of a GKE node pool using gcloud command.
+  """Gets the labels of a GKE node pool.
 
   Args:
     node_pool: An instance of the Info class that encapsulates the
@@ -671,21 +917,7 @@ def get_node_pool_labels(node_pool: Info) -> dict[str, str]:
   Returns:
     A dictionary contains the node pool labels.
   """
-  command = (
-      f"gcloud container node-pools describe {node_pool.node_pool_name} "
-      f"--project={node_pool.project_id} "
-      f"--cluster={node_pool.cluster_name} "
-      f"--location={node_pool.location} "
-      f"--format='json(config.resourceLabels)'"
-  )
-
-  result = (
-      json.loads(subprocess.run_exec(command).strip())
-      .get("config", {})
-      .get("resourceLabels", {})
-  )
-
-  return result
+  return dict(_describe(node_pool).config.resource_labels)
 
 
 class UpdateTarget(enum.Enum):
@@ -769,21 +1001,30 @@ def update(node_pool: Info, spec: NodePoolUpdateSpec) -> TimeUtil:
     ValueError: If the target is unsupported.
   """
   flags: list[str] = []
+  request = container_v1.UpdateNodePoolRequest(name=_node_pool_path(node_pool))
 
   match spec.target:
     case UpdateTarget.DISK_SIZE:
       current_disk_size = get_node_pool_disk_size(node_pool=node_pool)
       updated_disk_size = current_disk_size + spec.delta
       flags.append(f"--{spec.target.value}={updated_disk_size}")
+      request.disk_size_gb = updated_disk_size
 
     case UpdateTarget.LABEL:
       current_labels = get_node_pool_labels(node_pool=node_pool)
-      updated_labels = []
+      updated_labels = {}
       for key, val in spec.delta.items():
         if current_labels.get(key) == val:
           val += val
-        updated_labels.append(f"{key}={val}")
-      flags.append(f"--{spec.target.value}={','.join(updated_labels)}")
+        updated_labels[key] = val
+      flags.append(
+          f"--{spec.target.value}="
+          + ",".join(f"{key}={val}" for key, val in updated_labels.items())
+      )
+      # Like the gcloud flag, this replaces all the resource labels.
+      request.resource_labels = container_v1.ResourceLabels(
+          labels=updated_labels
+      )
 
     case _:
       raise ValueError(f"Unsupported target: {spec.target}")
@@ -803,5 +1044,9 @@ def update(node_pool: Info, spec: NodePoolUpdateSpec) -> TimeUtil:
       datetime.datetime.now(datetime.timezone.utc)
   )
 
-  subprocess.run_exec(update_cmd)
+  _run_operation(
+      node_pool,
+      lambda: _cluster_manager().update_node_pool(request=request),
+      update_cmd,
+  )
   return operation_start_time
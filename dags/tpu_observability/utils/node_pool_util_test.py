@@ -0,0 +1,306 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for node_pool_util.py."""
+
+import itertools
+from unittest import mock
+
+from absl.testing import absltest
+from airflow.exceptions import AirflowException, AirflowFailException
+from google.api_core import exceptions
+from google.cloud import compute_v1
+from google.cloud import container_v1
+
+from dags.tpu_observability.utils import node_pool_util
+
+
+_DONE = container_v1.Operation.Status.DONE
+_RUNNING = container_v1.Operation.Status.RUNNING
+
+_NODE_POOL = node_pool_util.Info(
+    project_id="project",
+    cluster_name="cluster",
+    node_pool_name="pool",
+    location="us-central2",
+    node_locations="us-central2-b",
+    machine_type="ct4p-hightpu-4t",
+    num_nodes=2,
+    tpu_topology="2x2x2",
+    reservation="reservation",
+    node_pool_selector="workload",
+)
+
+
+class NodePoolTestCase(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(mock.patch.object(node_pool_util, "USE_GCLOUD", False))
+    self.cluster_manager = mock.Mock()
+    self.instance_groups = mock.Mock()
+    self.instances = mock.Mock()
+    for name, client in (
+        ("_cluster_manager", self.cluster_manager),
+        ("_instance_groups", self.instance_groups),
+        ("_instances", self.instances),
+    ):
+      self.enter_context(
+          mock.patch.object(node_pool_util, name, return_value=client)
+      )
+    self.run_exec = self.enter_context(
+        mock.patch.object(node_pool_util.subprocess, "run_exec")
+    )
+    self.sleep = self.enter_context(
+        mock.patch.object(node_pool_util.time, "sleep")
+    )
+
+  def gcloud_commands(self) -> list[str]:
+    return [call.args[0] for call in self.run_exec.call_args_list]
+
+
+class CreateTest(NodePoolTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.cluster_manager.get_node_pool.side_effect = exceptions.NotFound("")
+    self.cluster_manager.create_node_pool.return_value = container_v1.Operation(
+        name="create", status=_DONE
+    )
+
+  def test_creates_with_api(self):
+    node_pool_util.create.function(_NODE_POOL)
+
+    request = self.cluster_manager.create_node_pool.call_args.kwargs
+    self.assertEqual(
+        request["parent"],
+        "projects/project/locations/us-central2/clusters/cluster",
+    )
+    pool = request["node_pool"]
+    self.assertEqual(pool.name, "pool")
+    self.assertEqual(pool.initial_node_count, 2)
+    self.assertEqual(list(pool.locations), ["us-central2-b"])
+    self.assertEqual(pool.placement_policy.tpu_topology, "2x2x2")
+    self.assertEqual(
+        list(pool.config.reservation_affinity.values), ["reservation"]
+    )
+    self.assertEqual(
+        dict(pool.config.labels),
+        {node_pool_util.NODE_POOL_SELECTOR_KEY: "workload"},
+    )
+    self.assertEqual(self.gcloud_commands(), [])
+
+  def test_sets_gcloud_client_side_defaults(self):
+    # Pinned to the defaults of `gcloud container node-pools create`, which the
+    # API doesn't apply. Update them together with gcloud.
+    pool = node_pool_util._new_node_pool(_NODE_POOL)
+
+    self.assertCountEqual(
+        pool.config.oauth_scopes,
+        [
+            "https://www.googleapis.com/auth/devstorage.read_only",
+            "https://www.googleapis.com/auth/logging.write",
+            "https://www.googleapis.com/auth/monitoring",
+            "https://www.googleapis.com/auth/service.management.readonly",
+            "https://www.googleapis.com/auth/servicecontrol",
+            "https://www.googleapis.com/auth/trace.append",
+        ],
+    )
+    self.assertEqual(
+        dict(pool.config.metadata), {"disable-legacy-endpoints": "true"}
+    )
+    self.assertTrue(pool.management.auto_repair)
+    self.assertTrue(pool.management.auto_upgrade)
+
+  def test_skips_existing_node_pool(self):
+    self.cluster_manager.get_node_pool.side_effect = None
+
+    node_pool_util.create.function(_NODE_POOL)
+
+    self.cluster_manager.create_node_pool.assert_not_called()
+
+  def test_falls_back_to_gcloud_if_api_unavailable(self):
+    self.cluster_manager.create_node_pool.side_effect = (
+        exceptions.PermissionDenied("API disabled")
+    )
+
+    node_pool_util.create.function(_NODE_POOL)
+
+    (command,) = self.gcloud_commands()
+    self.assertStartsWith(command, "gcloud container node-pools create pool ")
+    self.assertIn("--tpu-topology=2x2x2", command)
+
+  def test_does_not_retry_failed_mutation_with_gcloud(self):
+    self.cluster_manager.create_node_pool.side_effect = (
+        exceptions.InternalServerError("maybe created")
+    )
+    self.cluster_manager.list_operations.return_value = (
+        container_v1.ListOperationsResponse()
+    )
+
+    with self.assertRaises(AirflowFailException):
+      node_pool_util.create.function(_NODE_POOL)
+
+    self.assertEqual(self.gcloud_commands(), [])
+
+  def test_ignores_failure_if_asked(self):
+    self.cluster_manager.create_node_pool.side_effect = (
+        exceptions.InternalServerError("")
+    )
+
+    node_pool_util.create.function(_NODE_POOL, ignore_failure=True)
+
+  def test_uses_gcloud_if_configured(self):
+    self.run_exec.side_effect = [AirflowException("no pool"), ""]
+
+    with mock.patch.object(node_pool_util, "USE_GCLOUD", True):
+      node_pool_util.create.function(_NODE_POOL)
+
+    self.cluster_manager.create_node_pool.assert_not_called()
+    self.assertLen(self.gcloud_commands(), 2)
+
+
+class DeleteTest(NodePoolTestCase):
+
+  def test_deletes_with_api_and_waits(self):
+    self.cluster_manager.get_node_pool.return_value = container_v1.NodePool()
+    self.cluster_manager.delete_node_pool.return_value = container_v1.Operation(
+        name="delete", status=_RUNNING
+    )
+    self.cluster_manager.get_operation.side_effect = [
+        container_v1.Operation(name="delete", status=_RUNNING),
+        container_v1.Operation(name="delete", status=_DONE),
+    ]
+
+    node_pool_util.delete.function(_NODE_POOL)
+
+    self.cluster_manager.delete_node_pool.assert_called_once_with(
+        name="projects/project/locations/us-central2/clusters/cluster"
+        "/nodePools/pool"
+    )
+    self.cluster_manager.get_operation.assert_called_with(
+        name="projects/project/locations/us-central2/operations/delete"
+    )
+    self.assertEqual(self.cluster_manager.get_operation.call_count, 2)
+
+  def test_skips_missing_node_pool(self):
+    self.cluster_manager.get_node_pool.side_effect = exceptions.NotFound("")
+
+    node_pool_util.delete.function(_NODE_POOL)
+
+    self.cluster_manager.delete_node_pool.assert_not_called()
+
+
+class WaitForOperationTest(NodePoolTestCase):
+
+  def test_fails_on_operation_error(self):
+    operation = container_v1.Operation(
+        name="op", status=_DONE, error={"message": "quota exceeded"}
+    )
+
+    with self.assertRaisesRegex(AirflowFailException, "quota exceeded"):
+      node_pool_util._wait_for_operation(_NODE_POOL, operation)
+
+  def test_times_out(self):
+    self.cluster_manager.get_operation.return_value = container_v1.Operation(
+        name="op", status=_RUNNING
+    )
+    timeout = node_pool_util.OPERATION_TIMEOUT.total_seconds()
+    self.enter_context(
+        mock.patch.object(
+            node_pool_util.time,
+            "monotonic",
+            side_effect=itertools.count(step=timeout / 3),
+        )
+    )
+
+    with self.assertRaisesRegex(AirflowFailException, "did not finish"):
+      node_pool_util._wait_for_operation(
+          _NODE_POOL, container_v1.Operation(name="op", status=_RUNNING)
+      )
+
+    self.assertLess(self.cluster_manager.get_operation.call_count, 5)
+
+
+class ReadFallbackTest(NodePoolTestCase):
+
+  def test_describe_falls_back_to_gcloud_on_api_error(self):
+    self.cluster_manager.get_node_pool.side_effect = (
+        exceptions.InternalServerError("")
+    )
+    self.run_exec.return_value = '{"name": "pool", "unknownField": 1}'
+
+    self.assertEqual(node_pool_util._describe(_NODE_POOL).name, "pool")
+
+  def test_describe_does_not_fall_back_if_missing(self):
+    self.cluster_manager.get_node_pool.side_effect = exceptions.NotFound("")
+
+    with self.assertRaises(exceptions.NotFound):
+      node_pool_util._describe(_NODE_POOL)
+    self.run_exec.assert_not_called()
+
+
+class NodesTest(NodePoolTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.cluster_manager.get_node_pool.return_value = container_v1.NodePool(
+        instance_group_urls=[
+            "https://www.googleapis.com/compute/v1/projects/project/zones/"
+            f"us-central2-b/instanceGroupManagers/gke-pool-{group}-grp"
+            for group in ("a", "b")
+        ]
+    )
+
+    def list_instances(project, zone, instance_group, **kwargs):
+      del project, kwargs
+      return [
+          compute_v1.InstanceWithNamedPorts(
+              instance=f"https://www.googleapis.com/compute/v1/projects/"
+              f"project/zones/{zone}/instances/{instance_group}-node-{i}"
+          )
+          for i in range(2)
+      ]
+
+    self.instance_groups.list_instances.side_effect = list_instances
+
+  def test_lists_nodes_of_all_instance_groups(self):
+    self.assertCountEqual(
+        node_pool_util.list_nodes(_NODE_POOL),
+        [
+            f"gke-pool-{group}-grp-node-{i}"
+            for group in ("a", "b")
+            for i in range(2)
+        ],
+    )
+
+  def test_deletes_a_node_and_waits(self):
+    node_pool_util.delete_one_random_node.function(_NODE_POOL)
+
+    request = self.instances.delete.call_args.kwargs
+    self.assertEqual(request["zone"], "us-central2-b")
+    self.assertStartsWith(request["instance"], "gke-pool-")
+    self.instances.delete.return_value.result.assert_called_once()
+
+  def test_node_deletion_falls_back_if_api_unavailable(self):
+    self.instances.delete.side_effect = exceptions.Unauthenticated("")
+
+    node_pool_util.delete_one_random_node.function(_NODE_POOL)
+
+    (command,) = self.gcloud_commands()
+    self.assertStartsWith(command, "gcloud compute instances delete gke-pool-")
+
+
+if __name__ == "__main__":
+  absltest.main()
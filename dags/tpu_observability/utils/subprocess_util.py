@@ -24,20 +24,49 @@ Our requirement is to capture the complete output from the command (e.g., the
 full `tpu-info` table).
 Therefore, we are using Python's native `subprocess.run()` instead, which allows
 us to capture the full STDOUT and STDERR streams.
+
+For commands with large or long-running output, `stream_exec` hands each line
+to a callback as it is produced, and only keeps the tail of the output in
+memory.
 """
 
+import collections
+import contextlib
+import dataclasses
+import gzip
 import logging
+import os
+import signal
 import subprocess
+import threading
+from typing import Callable
 
 from airflow.exceptions import AirflowException
 
 
+# Bytes of each output stream kept in memory by `stream_exec`.
+TAIL_BYTES = 64 * 1024
+
+
 class ProcessKilledException(AirflowException):
   """Raised specifically when a command returns exit code 137 (SIGKILL)."""
 
   pass
 
 
+def _raise_for_returncode(returncode: int, stderr: str) -> None:
+  if returncode != 0:
+    logging.info("[subprocess] stderr: %s", stderr)
+    match returncode:
+      case 137:
+        raise ProcessKilledException()
+      case _:
+        raise AirflowException(
+            f"Caught an error while executing a command. \n"
+            f"stderr Message: {stderr}"
+        )
+
+
 def run_exec(
     cmd: str,
     env: dict[str, str] | None = None,
@@ -67,18 +96,161 @@ def run_exec(
       # (using the default system encoding).
       text=True,
   )
-  if res.returncode != 0:
-    logging.info("[subprocess] stderr: %s", res.stderr)
-    match res.returncode:
-      case 137:
-        raise ProcessKilledException()
-      case _:
-        raise AirflowException(
-            f"Caught an error while executing a command. \n"
-            f"stderr Message: {res.stderr}"
-        )
+  _raise_for_returncode(res.returncode, res.stderr)
 
   if log_output:
     logging.info("[subprocess] stdout: %s", res.stdout)
 
   return res.stdout
+
+
+class _Tail:
+  """Keeps the last lines of a stream, up to a number of bytes."""
+
+  def __init__(self, max_bytes: int):
+    self._max_bytes = max_bytes
+    self._lines = collections.deque()
+    self._size = 0
+
+  def append(self, line: bytes) -> None:
+    self._lines.append(line)
+    self._size += len(line)
+    while self._size > self._max_bytes and len(self._lines) > 1:
+      self._size -= len(self._lines.popleft())
+
+  def text(self) -> str:
+    return b"".join(self._lines).decode(errors="replace")
+
+
+@dataclasses.dataclass
+class StreamResult:
+  """The outcome of a command run by `stream_exec`.
+
+  Attributes:
+    stdout_tail: The last lines of stdout, up to `tail_bytes`.
+    stderr_tail: The last lines of stderr, up to `tail_bytes`.
+    stopped: Whether the command was killed because `on_line` asked to stop.
+    spill_path: The gzip file holding the whole stdout, if any.
+  """
+
+  stdout_tail: str
+  stderr_tail: str
+  stopped: bool = False
+  spill_path: str | None = None
+
+
+def _kill_group(process: subprocess.Popen) -> None:
+  """Kills a command started in its own session, with its child processes."""
+  try:
+    os.killpg(process.pid, signal.SIGKILL)
+  except ProcessLookupError:
+    pass
+
+
+def stream_exec(
+    cmd: str,
+    on_line: Callable[[str], bool | None] | None = None,
+    env: dict[str, str] | None = None,
+    timeout: float | None = None,
+    tail_bytes: int = TAIL_BYTES,
+    spill_path: str | None = None,
+    log_command: bool = True,
+) -> StreamResult:
+  """Executes a shell command, handling its stdout line by line.
+
+  Unlike `run_exec`, the output is not buffered until the command exits. Each
+  stdout line is passed to `on_line` as soon as it is read, and only the last
+  `tail_bytes` of each stream are kept, for error reporting. The command runs
+  in its own process group, so a timeout kills the processes it started too.
+
+  Args:
+    cmd: The shell command to execute.
+    on_line: Called with each stdout line, without its line ending. If it
+      returns True, the command is killed and its remaining output is ignored.
+    env: Environment variables of the command.
+    timeout: Seconds after which the command is killed.
+    tail_bytes: Bytes of each stream to keep in memory.
+    spill_path: Optional path of a gzip file to write the whole stdout to.
+    log_command: Whether to log the command.
+
+  Returns:
+    The tails of the output.
+
+  Raises:
+    ProcessKilledException: If the command returns exit code 137.
+    AirflowException: If the command fails or times out.
+  """
+  if log_command:
+    logging.info("[subprocess] streaming command:\n %s\n", cmd)
+
+  process = subprocess.Popen(
+      cmd,
+      env=env,
+      shell=True,
+      stdout=subprocess.PIPE,
+      stderr=subprocess.PIPE,
+      start_new_session=True,
+  )
+  stdout_tail = _Tail(tail_bytes)
+  stderr_tail = _Tail(tail_bytes)
+
+  def drain_stderr() -> None:
+    for line in process.stderr:
+      stderr_tail.append(line)
+
+  # stderr is drained concurrently, so a full pipe can't block the command.
+  stderr_reader = threading.Thread(target=drain_stderr, daemon=True)
+  stderr_reader.start()
+
+  timed_out = threading.Event()
+
+  def kill_on_timeout() -> None:
+    timed_out.set()
+    _kill_group(process)
+
+  timer = threading.Timer(timeout, kill_on_timeout) if timeout else None
+  if timer:
+    timer.start()
+
+  stopped = False
+  try:
+    with (
+        gzip.open(spill_path, "wb") if spill_path else contextlib.nullcontext()
+    ) as spill:
+      for line in process.stdout:
+        stdout_tail.append(line)
+        if spill:
+          spill.write(line)
+        if on_line and on_line(line.decode(errors="replace").rstrip("\r\n")):
+          stopped = True
+          _kill_group(process)
+          break
+    returncode = process.wait()
+    stderr_reader.join()
+  finally:
+    if timer:
+      timer.cancel()
+    if process.poll() is None:
+      # `on_line` or the spill file raised, so the command is abandoned.
+      _kill_group(process)
+      process.wait()
+    process.stdout.close()
+    process.stderr.close()
+
+  result = StreamResult(
+      stdout_tail=stdout_tail.text(),
+      stderr_tail=stderr_tail.text(),
+      stopped=stopped,
+      spill_path=spill_path,
+  )
+  # The timer may fire just as the command exits, so a timeout only counts if
+  # it killed the command.
+  if returncode != 0 and not stopped and timed_out.is_set():
+    logging.info("[subprocess] stderr: %s", result.stderr_tail)
+    raise AirflowException(
+        f"Command timed out after {timeout} seconds. \n"
+        f"stdout tail: {result.stdout_tail}"
+    )
+  if not stopped:
+    _raise_for_returncode(returncode, result.stderr_tail)
+  return result
@@ -0,0 +1,118 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for subprocess_util.py."""
+
+import gzip
+import os
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from airflow.exceptions import AirflowException
+
+from dags.tpu_observability.utils import subprocess_util
+
+
+class _FiresOnCancelTimer:
+  """A timer that fires when it is cancelled, as if it raced the command."""
+
+  def __init__(self, interval, function):
+    del interval
+    self._function = function
+
+  def start(self):
+    pass
+
+  def cancel(self):
+    self._function()
+
+
+class StreamExecTest(absltest.TestCase):
+
+  def test_passes_each_line(self):
+    lines = []
+
+    result = subprocess_util.stream_exec(
+        "printf 'a\\r\\nb\\n'; echo err >&2", on_line=lines.append
+    )
+
+    self.assertEqual(lines, ["a", "b"])
+    self.assertEqual(result.stdout_tail, "a\r\nb\n")
+    self.assertEqual(result.stderr_tail, "err\n")
+    self.assertFalse(result.stopped)
+
+  def test_raises_on_failure(self):
+    with self.assertRaisesRegex(AirflowException, "boom"):
+      subprocess_util.stream_exec("echo boom >&2; exit 1")
+
+  def test_raises_when_killed(self):
+    with self.assertRaises(subprocess_util.ProcessKilledException):
+      subprocess_util.stream_exec("sh -c 'kill -9 $$'")
+
+  def test_kills_command_on_timeout(self):
+    with self.assertRaisesRegex(AirflowException, "timed out"):
+      subprocess_util.stream_exec("echo started; sleep 60", timeout=0.5)
+
+  def test_ignores_timeout_racing_successful_exit(self):
+    self.enter_context(
+        mock.patch.object(
+            subprocess_util.threading, "Timer", _FiresOnCancelTimer
+        )
+    )
+
+    result = subprocess_util.stream_exec("echo done", timeout=60)
+
+    self.assertEqual(result.stdout_tail, "done\n")
+
+  def test_stops_when_callback_returns_true(self):
+    lines = []
+
+    def on_line(line):
+      lines.append(line)
+      return len(lines) == 2
+
+    result = subprocess_util.stream_exec("yes", on_line=on_line, timeout=60)
+
+    self.assertTrue(result.stopped)
+    self.assertEqual(lines, ["y", "y"])
+
+  def test_keeps_only_the_tail(self):
+    result = subprocess_util.stream_exec("seq 1000", tail_bytes=10)
+
+    self.assertEqual(result.stdout_tail, "999\n1000\n")
+
+  def test_keeps_last_line_longer_than_tail(self):
+    result = subprocess_util.stream_exec(
+        "echo short; echo long-line", tail_bytes=4
+    )
+
+    self.assertEqual(result.stdout_tail, "long-line\n")
+
+  def test_spills_whole_stdout(self):
+    spill_path = os.path.join(
+        self.enter_context(tempfile.TemporaryDirectory()), "stdout.gz"
+    )
+
+    result = subprocess_util.stream_exec(
+        "seq 1000", tail_bytes=10, spill_path=spill_path
+    )
+
+    self.assertEqual(result.spill_path, spill_path)
+    with gzip.open(spill_path, "rt") as f:
+      self.assertEqual(f.read(), "".join(f"{i}\n" for i in range(1, 1001)))
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -14,26 +14,141 @@
 
 """Functions for GCS Bucket"""
 
+import concurrent.futures
+import copy
+import dataclasses
+import hashlib
 import os
 import re
 import tempfile
-from typing import List
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from absl import logging
 from airflow.decorators import task
-from airflow.hooks.subprocess import SubprocessHook
 from airflow.providers.google.cloud.operators.gcs import GCSHook
+from google.cloud import storage
 import yaml
 
 
+LIST_PAGE_SIZE = 1000
+LIST_CONCURRENCY = 16
+DOWNLOAD_TIMEOUT_SECONDS = 60
+# DAG files are parsed under a timeout, so GCS reads there must be quick.
+PARSE_TIMEOUT_SECONDS = 10
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "gcs_file_cache")
+
+# Characters with a special meaning in `match_glob` patterns.
+_GLOB_SPECIAL_CHARS = re.compile(r"[*?\[\]{}\\]")
+
+
+def _split_gcs_path(gcs_path: str) -> Tuple[str, str]:
+  m = re.match(r"^gs://(?P<bucket>[^/]+)/(?P<name>.+)$", gcs_path)
+  if not m:
+    raise ValueError(
+        f"Invalid GCS path: '{gcs_path}'. Path must start with 'gs://'."
+    )
+  return m.group("bucket"), m.group("name")
+
+
+def iter_file_list(
+    gcs_path: str,
+    match_glob: Optional[str] = None,
+    delimiter: Optional[str] = None,
+) -> Iterator[str]:
+  """
+  Yields the names of objects under a GCS path, one page at a time.
+
+  Args:
+    gcs_path (str): The full gs:// path to the GCS bucket and prefix
+      (e.g., "gs://my-bucket/my-folder/").
+    match_glob (str): Optional glob, matched against the full object name by
+      GCS, that objects must match.
+    delimiter (str): Optional delimiter, e.g. "/", to list a single level.
+      The names of sub-prefixes, ending with the delimiter, are yielded
+      after the objects of each page.
+
+  Yields:
+    str: Object names (keys), without the bucket.
+  """
+  bucket_name, prefix = _split_gcs_path(gcs_path)
+  blobs = (
+      GCSHook()
+      .get_conn()
+      .list_blobs(
+          bucket_name,
+          prefix=prefix,
+          match_glob=match_glob,
+          delimiter=delimiter,
+          page_size=LIST_PAGE_SIZE,
+      )
+  )
+  for page in blobs.pages:
+    for blob in page:
+      yield blob.name
+    yield from sorted(page.prefixes)
+
+
+def iter_file_lists(
+    gcs_paths: Iterable[str],
+    match_glob: Optional[str] = None,
+    delimiter: Optional[str] = None,
+    max_workers: int = LIST_CONCURRENCY,
+) -> Iterator[str]:
+  """
+  Lists independent GCS paths in parallel, see `iter_file_list`.
+
+  Names are yielded path by path, in the order of `gcs_paths`.
+  """
+  with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+    listings = executor.map(
+        lambda path: list(iter_file_list(path, match_glob, delimiter)),
+        gcs_paths,
+    )
+    for names in listings:
+      yield from names
+
+
+def first_blob(
+    gcs_path: str, match_glob: Optional[str] = None
+) -> Optional[storage.Blob]:
+  """
+  Returns an object under a GCS path, listing at most one.
+
+  Args:
+    gcs_path (str): The full gs:// path to the GCS bucket and prefix.
+    match_glob (str): Optional glob, matched against the full object name by
+      GCS, that the object must match.
+
+  Returns:
+    storage.Blob: The first matching object, with its name and generation,
+      or None if there is none.
+  """
+  bucket_name, prefix = _split_gcs_path(gcs_path)
+  blobs = (
+      GCSHook()
+      .get_conn()
+      .list_blobs(
+          bucket_name, prefix=prefix, match_glob=match_glob, max_results=1
+      )
+  )
+  return next(iter(blobs), None)
+
+
+def first_file(
+    gcs_path: str, match_glob: Optional[str] = None
+) -> Optional[str]:
+  """
+  Returns the name of an object under a GCS path, see `first_blob`.
+  """
+  blob = first_blob(gcs_path, match_glob)
+  return blob.name if blob else None
+
+
 def obtain_file_list(gcs_path: str) -> List[str]:
   """
   Lists files in a GCS bucket at a specified path.
 
-  This function uses the GCSHook to connect to Google Cloud Storage.
-  It parses the provided `output_path` to extract the bucket name and prefix,
-  and then lists all objects within that path.
-
   Args:
     output_path (str): The full gs:// path to the GCS bucket and prefix
       (e.g., "gs://my-bucket/my-folder/").
@@ -41,24 +156,76 @@ def obtain_file_list(gcs_path: str) -> List[str]:
   Returns:
     List[str]: A list of file names (keys) found in the specified GCS path.
   """
-  hook = GCSHook()
-  pattern = re.compile(r"^gs://(?P<bucket>[^/]+)/(?P<prefix>.+)$")
-  m = pattern.match(gcs_path)
-
-  if not m:
+  try:
+    _split_gcs_path(gcs_path)
+  except ValueError:
     logging.error(f"Invalid GCS path format: {gcs_path}")
     return []
 
-  bucket_name = m.group("bucket")
-  prefix = m.group("prefix")
+  files = list(iter_file_list(gcs_path))
+  logging.info(f"Found {len(files)} files in {gcs_path}")
+  return files
 
-  logging.info(f"output_path:{gcs_path}")
-  logging.info(f"bucket:{bucket_name}")
-  logging.info(f"prefix:{prefix}")
 
-  files = hook.list(bucket_name=bucket_name, prefix=prefix)
-  logging.info(f"Files ===> {files}")
-  return files
+def _matches_file(name: str, prefix: str, target_file: str) -> bool:
+  """Whether an object stands for a file, see `file_exists`."""
+  return name.startswith(prefix) and target_file in os.path.basename(name)
+
+
+def file_exists(file_path: str) -> bool:
+  """
+  Check whether a file exists in GCS, at a cost independent of its directory
+
+  A file also counts as existing if an object under its directory, at any
+  depth, has its file name in its own name, e.g. `gs://b/dir/x.txt` matches
+  `gs://b/dir/1/x.txt.tmp`. The exact object is checked first, then at most
+  one such object is listed, with a glob. Names with glob characters can't be
+  matched by a glob, so for them the directory is listed until a match.
+
+  Args:
+    file_path (str): The full path of the target
+      file (e.g gs://mybucket/commit_message.txt)
+
+  Returns:
+    bool: return True if target file is found
+  """
+  bucket_name, object_name = _split_gcs_path(file_path)
+
+  hook = GCSHook()
+  if hook.exists(bucket_name, object_name):
+    logging.info(f"Found target file in the GCS path: {file_path}")
+    return True
+
+  directory, target_file = os.path.split(object_name)
+  prefix = f"{directory}/" if directory else ""
+  if _GLOB_SPECIAL_CHARS.search(object_name):
+    blobs = hook.get_conn().list_blobs(
+        bucket_name, prefix=prefix, page_size=LIST_PAGE_SIZE
+    )
+  else:
+    # `**` spans directories and `*` doesn't, so the file name must be in the
+    # last part of the object name, as `_matches_file` checks.
+    blobs = hook.get_conn().list_blobs(
+        bucket_name,
+        prefix=prefix,
+        match_glob=f"{prefix}**{target_file}*",
+        max_results=1,
+    )
+
+  # Pages are only fetched until a match is found.
+  match = next(
+      (
+          blob.name
+          for blob in blobs
+          if _matches_file(blob.name, prefix, target_file)
+      ),
+      None,
+  )
+  if match:
+    logging.info(
+        f"Found target file in the GCS path: gs://{bucket_name}/{match}"
+    )
+  return match is not None
 
 
 @task.sensor(poke_interval=3, timeout=300, mode="reschedule")
@@ -73,24 +240,105 @@ def wait_for_file_to_exist(file_path: str) -> bool:
   Returns:
     bool: return True if target file is found
   """
-  directory_path = os.path.dirname(file_path)
-  target_file = os.path.basename(file_path)
-  logging.info(f"Directory to check: {directory_path}")
-  logging.info(f"Target file name: {target_file}")
+  if file_exists(file_path):
+    return True
 
-  if not directory_path.startswith("gs://"):
-    raise ValueError(
-        f"Invalid GCS path provided: {file_path}. "
-        "Path must start with 'gs://'."
+  logging.info(f"Target file {file_path} not found.")
+  return False
+
+
+@dataclasses.dataclass
+class _CachedFile:
+  generation: int
+  content: bytes
+  parsed: Any = None
+
+
+_file_cache: Dict[str, _CachedFile] = {}
+_file_cache_lock = threading.Lock()
+
+
+def _get_blob(gcs_path: str, timeout: float) -> storage.Blob:
+  """Gets the metadata of a GCS file, including its current generation."""
+  bucket_name, object_name = _split_gcs_path(gcs_path)
+  blob = (
+      GCSHook()
+      .get_conn()
+      .bucket(bucket_name)
+      .get_blob(object_name, timeout=timeout)
+  )
+  if blob is None:
+    raise FileNotFoundError(
+        f"[Errno 2] Failed to download file from GCS path: {gcs_path}"
     )
-  checkpoint_files = obtain_file_list(directory_path)
-  for file in checkpoint_files:
-    if target_file in file:
-      logging.info(f"Found target file in the GCS path: {file}")
-      return True
+  return blob
 
-  logging.info("Target file not found in the specified GCS path.")
-  return False
+
+def _cached_file(gcs_path: str) -> _CachedFile:
+  """Reads a GCS file, downloading it only if it changed since the last read.
+
+  The file's generation is checked on every call, so a cached file is never
+  stale, but an unchanged file costs a metadata request instead of a download.
+  """
+  blob = _get_blob(gcs_path, DOWNLOAD_TIMEOUT_SECONDS)
+  with _file_cache_lock:
+    cached = _file_cache.get(gcs_path)
+  if cached and cached.generation == blob.generation:
+    logging.info(f"Using cached {gcs_path} (generation {blob.generation}).")
+    return cached
+
+  # The blob carries its generation, so the download can't mix versions.
+  content = blob.download_as_bytes(timeout=DOWNLOAD_TIMEOUT_SECONDS)
+  cached = _CachedFile(generation=blob.generation, content=content)
+  with _file_cache_lock:
+    _file_cache[gcs_path] = cached
+  return cached
+
+
+def read_file_for_dag_parsing(
+    gcs_path: str, timeout: float = PARSE_TIMEOUT_SECONDS
+) -> bytes:
+  """Reads a GCS file from a DAG file, at parse time.
+
+  Each parse runs in a new process, so the file is cached on local disk with
+  its generation. If GCS can't be reached within `timeout`, the last cached
+  copy is used, so an outage doesn't make the DAG disappear.
+
+  Args:
+    gcs_path: The full gs:// path of the file.
+    timeout: Seconds to wait for each GCS request.
+
+  Returns:
+    The content of the file.
+  """
+  path = os.path.join(
+      CACHE_DIR, hashlib.sha256(gcs_path.encode()).hexdigest()[:16]
+  )
+  try:
+    with open(f"{path}.generation", encoding="utf-8") as f:
+      generation = int(f.read())
+    with open(path, "rb") as f:
+      content = f.read()
+  except (FileNotFoundError, ValueError):
+    generation, content = None, None
+
+  try:
+    blob = _get_blob(gcs_path, timeout)
+    if blob.generation != generation:
+      content = blob.download_as_bytes(timeout=timeout)
+      os.makedirs(CACHE_DIR, exist_ok=True)
+      for suffix, data in (
+          ("", content),
+          (".generation", b"%d" % blob.generation),
+      ):
+        with open(f"{path}{suffix}.tmp", "wb") as f:
+          f.write(data)
+        os.replace(f"{path}{suffix}.tmp", f"{path}{suffix}")
+  except Exception as e:  # pylint: disable=broad-exception-caught
+    if content is None:
+      raise
+    logging.warning(f"Using cached copy of {gcs_path}, failed to read it: {e}")
+  return content
 
 
 def load_yaml_from_gcs(gcs_path: str) -> dict:
@@ -110,27 +358,9 @@ def load_yaml_from_gcs(gcs_path: str) -> dict:
         "Proceeding, but be aware this might not be a YAML file."
     )
 
-  with tempfile.TemporaryDirectory() as tmpdir:
-    temp_file_path = os.path.join(tmpdir, "downloaded_config")
-
-    hook = SubprocessHook()
-    command = ["gcloud", "storage", "cp", gcs_path, temp_file_path]
-    logging.info(f"Running command: {' '.join(command)}")
-    result = hook.run_command(command)
-    assert (
-        result.exit_code == 0
-    ), f"gcloud storage command failed with exit code {result.exit_code}"
-
-    if not os.path.exists(temp_file_path):
-      logging.error(
-          f"gcloud storage cp command completed, but '{temp_file_path}' was not created. "
-          "This often means the copy failed. Check gcloud storage stdout/stderr in logs."
-      )
-      raise FileNotFoundError(
-          f"[Errno 2] Failed to download file from GCS path: {gcs_path}"
-      )
-
-    with open(temp_file_path, "r", encoding="utf-8") as f:
-      dag_yaml = f.read()
-
-  return yaml.safe_load(dag_yaml)
+  cached = _cached_file(gcs_path)
+  with _file_cache_lock:
+    if cached.parsed is None:
+      cached.parsed = yaml.safe_load(cached.content)
+  # Callers may modify the config, so each gets its own copy.
+  return copy.deepcopy(cached.parsed)
@@ -0,0 +1,295 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for gcs.py."""
+
+import os
+import re
+import tempfile
+from typing import Dict, List, Optional
+from unittest import mock
+
+from absl.testing import absltest
+from xlml.apis import gcs
+
+
+def _glob_to_regex(glob: str) -> re.Pattern:
+  """Translates the `match_glob` wildcards used by gcs.py."""
+  parts = re.split(r"(\*\*|\*)", glob)
+  return re.compile(
+      "".join(
+          {"**": ".*", "*": "[^/]*"}.get(part, re.escape(part))
+          for part in parts
+      )
+      + "$"
+  )
+
+
+def _blob(name: str, generation: int = 1) -> mock.Mock:
+  blob = mock.Mock(generation=generation)
+  blob.name = name
+  return blob
+
+
+class _Page(list):
+
+  def __init__(self, blobs, prefixes):
+    super().__init__(blobs)
+    self.prefixes = prefixes
+
+
+class _FakeClient:
+  """Lists the objects of one bucket, a page of `page_size` at a time."""
+
+  def __init__(self, names: List[str]):
+    self.names = sorted(names)
+    self.calls = []
+
+  def list_blobs(
+      self,
+      bucket_name: str,
+      prefix: str = "",
+      match_glob: Optional[str] = None,
+      delimiter: Optional[str] = None,
+      page_size: Optional[int] = None,
+      max_results: Optional[int] = None,
+  ):
+    del bucket_name
+    self.calls.append({"prefix": prefix, "match_glob": match_glob})
+    names, prefixes = [], set()
+    for name in self.names:
+      if not name.startswith(prefix):
+        continue
+      if match_glob and not _glob_to_regex(match_glob).match(name):
+        continue
+      rest = name[len(prefix) :]
+      if delimiter and delimiter in rest:
+        prefixes.add(prefix + rest.split(delimiter)[0] + delimiter)
+        continue
+      names.append(name)
+    names = names[:max_results]
+    size = page_size or len(names) or 1
+    pages = [
+        _Page(
+            [_blob(name) for name in names[i : i + size]],
+            prefixes if i == 0 else set(),
+        )
+        for i in range(0, max(len(names), 1), size)
+    ]
+    listing = mock.MagicMock(pages=pages)
+    listing.__iter__.side_effect = lambda: iter(
+        [blob for page in pages for blob in page]
+    )
+    return listing
+
+
+class GcsTestCase(absltest.TestCase):
+
+  def set_objects(self, names: List[str]) -> None:
+    self.client = _FakeClient(names)
+    hook = self.enter_context(mock.patch.object(gcs, "GCSHook")).return_value
+    hook.get_conn.return_value = self.client
+    hook.exists.side_effect = lambda bucket, name: name in self.client.names
+
+
+class ListingTest(GcsTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(mock.patch.object(gcs, "LIST_PAGE_SIZE", 2))
+    self.set_objects([
+        "run/1/a.data",
+        "run/1/b.meta",
+        "run/2/c.data",
+        "run/top.txt",
+        "runs/other.txt",
+    ])
+
+  def test_lists_all_pages(self):
+    self.assertEqual(
+        list(gcs.iter_file_list("gs://b/run/")),
+        ["run/1/a.data", "run/1/b.meta", "run/2/c.data", "run/top.txt"],
+    )
+
+  def test_lists_one_level(self):
+    self.assertEqual(
+        list(gcs.iter_file_list("gs://b/run/", delimiter="/")),
+        ["run/top.txt", "run/1/", "run/2/"],
+    )
+
+  def test_lists_nested_glob_matches(self):
+    self.assertEqual(
+        list(gcs.iter_file_list("gs://b/run/", match_glob="**.data")),
+        ["run/1/a.data", "run/2/c.data"],
+    )
+
+  def test_lists_paths_in_order(self):
+    self.assertEqual(
+        list(gcs.iter_file_lists(["gs://b/run/2/", "gs://b/run/1/"])),
+        ["run/2/c.data", "run/1/a.data", "run/1/b.meta"],
+    )
+
+  def test_first_file(self):
+    self.assertEqual(gcs.first_file("gs://b/run/1/"), "run/1/a.data")
+    self.assertEqual(
+        gcs.first_file("gs://b/run/", match_glob="**.meta"), "run/1/b.meta"
+    )
+    self.assertIsNone(gcs.first_file("gs://b/run/3/"))
+
+  def test_first_blob_has_generation(self):
+    self.assertEqual(gcs.first_blob("gs://b/run/2/").generation, 1)
+
+  def test_rejects_paths_without_scheme(self):
+    with self.assertRaises(ValueError):
+      gcs.first_file("b/run/")
+
+
+class FileExistsTest(GcsTestCase):
+
+  def test_exact_hit_lists_nothing(self):
+    self.set_objects(["dir/commit_success.txt"])
+
+    self.assertTrue(gcs.file_exists("gs://b/dir/commit_success.txt"))
+    self.assertEqual(self.client.calls, [])
+
+  def test_nested_hit(self):
+    self.set_objects(["dir/100/items/commit_success.txt.tmp"])
+
+    self.assertTrue(gcs.file_exists("gs://b/dir/commit_success.txt"))
+    self.assertEqual(len(self.client.calls), 1)
+
+  def test_name_in_a_directory_is_not_a_hit(self):
+    self.set_objects(
+        ["dir/commit_success.txt/other", "dir2/commit_success.txt"]
+    )
+
+    self.assertFalse(gcs.file_exists("gs://b/dir/commit_success.txt"))
+
+  def test_name_with_glob_characters(self):
+    self.set_objects(["dir/1/step[1]*.txt", "dir/step.txt"])
+
+    self.assertTrue(gcs.file_exists("gs://b/dir/step[1]*.txt"))
+    self.assertIsNone(self.client.calls[0]["match_glob"])
+    self.assertFalse(gcs.file_exists("gs://b/dir/step[2].txt"))
+
+  def test_glob_and_listing_agree(self):
+    names = [
+        "dir/a/x.txt.1",
+        "dir/x.txt/b",
+        "dirx/x.txt",
+        "dir/b/c/x.txt",
+        "dir/y.txt",
+        "dir/w.txt/b",
+        "dirw/w.txt",
+    ]
+    self.set_objects(names)
+
+    for target in ("x.txt", "y.txt", "w.txt", "z.txt"):
+      with mock.patch.object(gcs, "_GLOB_SPECIAL_CHARS", re.compile("$^")):
+        by_glob = gcs.file_exists(f"gs://b/dir/{target}")
+      with mock.patch.object(gcs, "_GLOB_SPECIAL_CHARS", re.compile("")):
+        by_listing = gcs.file_exists(f"gs://b/dir/{target}")
+      self.assertEqual(by_glob, by_listing, target)
+
+
+class _FakeBucket:
+  """Serves objects by name, with their content and generation."""
+
+  def __init__(self):
+    self.objects: Dict[str, tuple[bytes, int]] = {}
+    self.downloads = 0
+    self.error: Optional[Exception] = None
+
+  def get_blob(self, name: str, timeout: float) -> Optional[mock.Mock]:
+    del timeout
+    if self.error:
+      raise self.error
+    if name not in self.objects:
+      return None
+    content, generation = self.objects[name]
+
+    def download_as_bytes(timeout):
+      del timeout
+      self.downloads += 1
+      return content
+
+    blob = _blob(name, generation)
+    blob.download_as_bytes = download_as_bytes
+    return blob
+
+
+class CachedFileTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.bucket = _FakeBucket()
+    hook = self.enter_context(mock.patch.object(gcs, "GCSHook")).return_value
+    hook.get_conn.return_value.bucket.return_value = self.bucket
+    self.enter_context(mock.patch.dict(gcs._file_cache, clear=True))
+    self.enter_context(
+        mock.patch.object(
+            gcs,
+            "CACHE_DIR",
+            os.path.join(
+                self.enter_context(tempfile.TemporaryDirectory()), "cache"
+            ),
+        )
+    )
+
+  def test_downloads_only_new_generations(self):
+    self.bucket.objects["config.yaml"] = (b"a: 1", 1)
+
+    self.assertEqual(gcs.load_yaml_from_gcs("gs://b/config.yaml"), {"a": 1})
+    self.assertEqual(gcs.load_yaml_from_gcs("gs://b/config.yaml"), {"a": 1})
+    self.assertEqual(self.bucket.downloads, 1)
+
+    self.bucket.objects["config.yaml"] = (b"a: 2", 2)
+
+    self.assertEqual(gcs.load_yaml_from_gcs("gs://b/config.yaml"), {"a": 2})
+    self.assertEqual(self.bucket.downloads, 2)
+
+  def test_callers_get_their_own_copy(self):
+    self.bucket.objects["config.yaml"] = (b"a: [1]", 1)
+
+    gcs.load_yaml_from_gcs("gs://b/config.yaml")["a"].append(2)
+
+    self.assertEqual(gcs.load_yaml_from_gcs("gs://b/config.yaml"), {"a": [1]})
+
+  def test_missing_file(self):
+    with self.assertRaises(FileNotFoundError):
+      gcs.load_yaml_from_gcs("gs://b/config.yaml")
+
+  def test_dag_parsing_revalidates_disk_cache(self):
+    self.bucket.objects["dag.yaml"] = (b"v1", 1)
+    self.assertEqual(gcs.read_file_for_dag_parsing("gs://b/dag.yaml"), b"v1")
+    self.assertEqual(gcs.read_file_for_dag_parsing("gs://b/dag.yaml"), b"v1")
+    self.assertEqual(self.bucket.downloads, 1)
+
+    self.bucket.objects["dag.yaml"] = (b"v2", 2)
+
+    self.assertEqual(gcs.read_file_for_dag_parsing("gs://b/dag.yaml"), b"v2")
+    self.assertEqual(self.bucket.downloads, 2)
+
+  def test_dag_parsing_uses_disk_cache_when_gcs_fails(self):
+    self.bucket.objects["dag.yaml"] = (b"v1", 1)
+    gcs.read_file_for_dag_parsing("gs://b/dag.yaml")
+    self.bucket.error = TimeoutError("unreachable")
+
+    self.assertEqual(gcs.read_file_for_dag_parsing("gs://b/dag.yaml"), b"v1")
+    with self.assertRaises(TimeoutError):
+      gcs.read_file_for_dag_parsing("gs://b/other.yaml")
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -18,7 +18,7 @@ import abc
 import dataclasses
 import datetime
 import shlex
-from typing import Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import airflow
 from airflow.models.taskmixin import DAGNode
@@ -29,6 +29,8 @@ from airflow.operators.empty import EmptyOperator
 
 from dags.common.quarantined_tests import QuarantineTests
 from xlml.utils import gpu, metric, name_format, ssh, tpu, xpk, axlearn, gke, kpo
+from xlml.utils import gpu_pool, k8s_watch, setup_cache, tpu_pool
+from xlml.utils import workload_status
 from xlml.apis import gcp_config, metric_config, test_config, gcs
 
 
@@ -68,6 +70,8 @@ def run_queued_resource_test(
     all_workers: bool = True,
     skip_post_process: bool = False,
     custom_env: dict[str, str] = {},
+    warm_pool_size: int = 0,
+    cache_setup: bool = False,
 ):
   """This is a class to set up tasks for TPU provisioned by Queued Resource.
 
@@ -88,12 +92,30 @@ def run_queued_resource_test(
       only.
     skip_post_process: If True, the post processing step will be skipped.
     custom_env: Extra enviroment variables.
+    warm_pool_size: If positive, lease the TPU from a warm pool that keeps up
+      to this many idle TPUs set up for this test, instead of provisioning and
+      tearing down a new TPU. Intended for short tests on small slices.
+    cache_setup: If True, restore the results of the setup script from a GCS
+      cache keyed by the setup script and runtime version, and populate the
+      cache on a miss. Only for setup scripts that install pinned versions
+      under the home directory.
 
   Returns:
       A task group with the following tasks chained: provision, run_model,
       post_process and clean_up.
   """
 
+  setup_script = task_test_config.setup_script
+  if cache_setup:
+    setup_script = setup_cache.with_setup_cache(
+        setup_script,
+        setup_cache.cache_key(
+            setup_script,
+            task_test_config.accelerator.name,
+            task_test_config.accelerator.runtime_version,
+        ),
+    )
+
   with TaskGroup(
       group_id=task_test_config.benchmark_id, prefix_group_id=True
   ) as test:
@@ -108,13 +130,29 @@ def run_queued_resource_test(
             task_test_config.benchmark_id,
         )
 
-      queued_resource_op, queued_resource_name = tpu.create_queued_resource(
-          tpu_name,
-          task_gcp_config,
-          ssh_keys,
-          tpu_create_timeout,
-          task_test_config,
-      )
+      if warm_pool_size > 0:
+        with TaskGroup(group_id="create_queued_resource") as queued_resource_op:
+          lease = tpu_pool.lease_queued_resource(
+              tpu_name,
+              task_gcp_config,
+              ssh_keys,
+              tpu_create_timeout,
+              task_test_config,
+              setup_script=setup_script,
+          )
+          queued_resource_name = lease["qualified_name"]
+          tpu.wait_for_ready_queued_resource.override(
+              timeout=tpu_create_timeout.total_seconds()
+          )(queued_resource_name)
+        setup_script = lease["setup_cmds"]
+      else:
+        queued_resource_op, queued_resource_name = tpu.create_queued_resource(
+            tpu_name,
+            task_gcp_config,
+            ssh_keys,
+            tpu_create_timeout,
+            task_test_config,
+        )
 
       setup_task = tpu.ssh_tpu.override(
           task_id="setup",
@@ -124,7 +162,7 @@ def run_queued_resource_test(
           retry_delay=datetime.timedelta(seconds=30),
       )(
           queued_resource_name,
-          task_test_config.setup_script,
+          setup_script,
           ssh_keys,
           True if task_test_config.test_name.startswith("tf_") else all_workers,
       )
@@ -147,9 +185,14 @@ def run_queued_resource_test(
         },
     )
 
-    clean_up = tpu.delete_queued_resource.override(group_id="clean_up")(
-        queued_resource_name
-    )
+    if warm_pool_size > 0:
+      clean_up = tpu_pool.release_queued_resource.override(task_id="clean_up")(
+          queued_resource_name, lease["lease_id"], warm_pool_size
+      )
+    else:
+      clean_up = tpu.delete_queued_resource.override(group_id="clean_up")(
+          queued_resource_name
+      )
 
     if skip_post_process:
       _ = provision >> run_model >> clean_up
@@ -316,6 +359,10 @@ class XpkTask(BaseTask):
     task_gcp_config: Runtime TPU/GPU creation parameters.
     task_metric_config: Metric configs to process metrics.
     workload_provision_timeout: Time allowed for provisioning a workload.
+    use_k8s_api: Submit supported TPU workloads as JobSets through the
+      Kubernetes API instead of the xpk CLI.
+    deferrable: Wait for workloads with Kubernetes watches in the triggerer
+      instead of polling sensors. Pathways workloads always use sensors.
   """
 
   task_test_config: Union[
@@ -327,6 +374,8 @@ class XpkTask(BaseTask):
       # Set the provision timeout from 300 to 60 minutes for decreasing the duration of failed tasks
       minutes=60
   )
+  use_k8s_api: bool = False
+  deferrable: bool = False
 
   def run(
       self,
@@ -380,6 +429,7 @@ class XpkTask(BaseTask):
       last_node: bool = False,
       max_restart: int = 0,
       check_file_exists: bool = False,
+      fast_disruption: bool = False,
   ) -> DAGNode:
     """Run a test job within a docker image.
 
@@ -403,6 +453,9 @@ class XpkTask(BaseTask):
         This will restart the job with flag "--max-restarts"
       check_file_exists: By default, this is False. If set to True,
         task branch task_path_decider will be performed.
+      fast_disruption: If True, a single task follows the workload's log and
+        deletes the node as soon as the step is logged, then records when
+        the workload restarted and resumed training.
     Returns:
       A task group with the following tasks chained: run_model and
       post_process.
@@ -419,6 +472,7 @@ class XpkTask(BaseTask):
           last_node=last_node,
           max_restart=max_restart,
           check_file_exists=check_file_exists,
+          fast_disruption=fast_disruption,
       )
       if not skip_post_process:
         _ = run_model >> self.post_process(gcs_path)
@@ -437,6 +491,7 @@ class XpkTask(BaseTask):
       last_node: bool = False,
       max_restart: int = 0,
       check_file_exists: bool = False,
+      fast_disruption: bool = False,
   ) -> DAGNode:
     """Run the TPU/GPU test in `task_test_config` using xpk.
 
@@ -458,6 +513,9 @@ class XpkTask(BaseTask):
         This will restart the job with flag "--max-restarts"
       check_file_exists: By default, this is False. If set to True,
         task branch task_path_decider will be performed.
+      fast_disruption: If True, a single task follows the workload's log and
+        deletes the node as soon as the step is logged, then records when
+        the workload restarted and resumed training.
     Returns:
       A DAG node that executes the model test.
     """
@@ -471,39 +529,67 @@ class XpkTask(BaseTask):
             self.task_test_config.benchmark_id,
         )
 
-      launch_workload_and_wait_for_reach_step = (
-          self.launch_workload_with_node_reach_to_step(
-              workload_id,
-              gcs_path,
-              expect_reach_to_step,
-              use_vertex_tensorboard,
-              use_pathways,
-              ramdisk_directory,
-              mtc_enabled,
-              xpk_branch,
-              max_restart,
-              check_file_exists,
-          )
-      )
+      if fast_disruption:
+        launch_workload = self.launch_workload(
+            workload_id,
+            gcs_path,
+            use_vertex_tensorboard,
+            use_pathways,
+            ramdisk_directory,
+            mtc_enabled,
+            xpk_branch,
+            max_restart,
+        )
+        run_node_interruption = xpk.disrupt_node_at_step.override(
+            owner=self.task_test_config.task_owner
+        )(
+            project_id=self.task_gcp_config.project_name,
+            zone=self.task_gcp_config.zone,
+            cluster_name=self.task_test_config.cluster_name,
+            workload_id=workload_id,
+            expect_reach_to_step=expect_reach_to_step,
+            wait_for_file=(
+                f"{gcs_path}/{expect_reach_to_step}/commit_success.txt"
+                if check_file_exists
+                else None
+            ),
+            last_node=last_node,
+        )
+        _ = (workload_id, gcs_path) >> launch_workload >> run_node_interruption
+      else:
+        launch_workload_and_wait_for_reach_step = (
+            self.launch_workload_with_node_reach_to_step(
+                workload_id,
+                gcs_path,
+                expect_reach_to_step,
+                use_vertex_tensorboard,
+                use_pathways,
+                ramdisk_directory,
+                mtc_enabled,
+                xpk_branch,
+                max_restart,
+                check_file_exists,
+            )
+        )
 
-      run_node_interruption = xpk.delete_node.override(
-          owner=self.task_test_config.task_owner, trigger_rule="none_failed"
-      )(
-          project=self.task_gcp_config.project_name,
-          zone=self.task_gcp_config.zone,
-          cluster_name=self.task_test_config.cluster_name,
-          workload_id=workload_id,
-          dry_run=False,
-          last_node=last_node,
-      )
+        run_node_interruption = xpk.delete_node.override(
+            owner=self.task_test_config.task_owner, trigger_rule="none_failed"
+        )(
+            project=self.task_gcp_config.project_name,
+            zone=self.task_gcp_config.zone,
+            cluster_name=self.task_test_config.cluster_name,
+            workload_id=workload_id,
+            dry_run=False,
+            last_node=last_node,
+        )
+        _ = (
+            (workload_id, gcs_path)
+            >> launch_workload_and_wait_for_reach_step
+            >> run_node_interruption
+        )
 
-      wait_for_workload_completion = xpk.wait_for_workload_completion.override(
-          timeout=int(self.task_test_config.timeout.total_seconds()),
-      )(
-          workload_id=workload_id,
-          project_id=self.task_gcp_config.project_name,
-          region=gke.zone_to_region(self.task_gcp_config.zone),
-          cluster_name=self.task_test_config.cluster_name,
+      wait_for_workload_completion = self.wait_for_workload_completion(
+          workload_id, use_pathways
       )
 
       clean_up_workload = xpk.clean_up_workload(
@@ -515,9 +601,7 @@ class XpkTask(BaseTask):
       )
 
       _ = (
-          (workload_id, gcs_path)
-          >> launch_workload_and_wait_for_reach_step
-          >> run_node_interruption
+          run_node_interruption
           >> wait_for_workload_completion
           >> clean_up_workload
       )
@@ -535,6 +619,7 @@ class XpkTask(BaseTask):
       xpk_branch: str = xpk.MAIN_BRANCH,
       max_restart: int = 0,
       check_file_exists: bool = False,
+      reach_step_timeout: datetime.timedelta = xpk.REACH_STEP_TIMEOUT,
   ) -> DAGNode:
     """Create the workload and wait for it to provision."""
     with TaskGroup(group_id="launch_workload_with_node_reach_to_step") as group:
@@ -558,25 +643,11 @@ class XpkTask(BaseTask):
           mtc_enabled=mtc_enabled,
           xpk_branch=xpk_branch,
           max_restart=max_restart,
+          use_k8s_api=self.use_k8s_api,
       )
-      wait_for_workload_start = xpk.wait_for_workload_start.override(
-          timeout=self.workload_provision_timeout.total_seconds()
-      )(
-          workload_id=workload_id,
-          project_id=self.task_gcp_config.project_name,
-          region=gke.zone_to_region(self.task_gcp_config.zone),
-          cluster_name=self.task_test_config.cluster_name,
-      )
-      wait_for_workload_to_reach_step = (
-          xpk.wait_for_workload_reach_step.override(
-              task_id="wait_for_workload_reach_step"
-          )(
-              workload_id=workload_id,
-              project_id=self.task_gcp_config.project_name,
-              region=gke.zone_to_region(self.task_gcp_config.zone),
-              cluster_name=self.task_test_config.cluster_name,
-              expect_reach_to_step=str(expect_reach_to_step),
-          )
+      wait_for_workload_start = self.wait_for_workload_start(workload_id)
+      wait_for_workload_to_reach_step = self.wait_for_workload_reach_step(
+          workload_id, expect_reach_to_step, timeout=reach_step_timeout
       )
 
       task_id_wait_file_exist = "wait_for_file_to_exist"
@@ -655,52 +726,55 @@ class XpkTask(BaseTask):
     with TaskGroup(
         group_id=self.task_test_config.benchmark_id, prefix_group_id=True
     ) as group:
-      run_name = name_format.generate_run_name(
-          self.task_test_config.benchmark_id
+      run_name, file_locations = self.generate_run_name(
+          run_name_env, nested_run_name_in_tb_file_location
       )
-      tb_file_location = name_format.generate_tb_file_location(
-          run_name,
-          self.task_metric_config.tensorboard_summary.file_location,
-          nested_run_name_in_tb_file_location,
+      run_model, gcs_path = self.run_model(
+          use_pathways=use_pathways, xpk_branch=xpk_branch
       )
+      _ = run_name >> file_locations >> run_model >> self.post_process(gcs_path)
+    return group
+
+  def generate_run_name(
+      self,
+      run_name_env: str = "M_RUN_NAME",
+      nested_run_name_in_tb_file_location: bool = True,
+  ) -> Tuple[airflow.XComArg, List[airflow.XComArg]]:
+    """Generate a unique run name and point the test at it.
+
+    The run name is exported as `run_name_env` before the test's commands,
+    and the tensorboard and profile locations of the metric config are moved
+    under it.
+
+    Returns:
+      The run name, and the tasks generating the file locations.
+    """
+    run_name = name_format.generate_run_name(self.task_test_config.benchmark_id)
+    tb_file_location = name_format.generate_tb_file_location(
+        run_name,
+        self.task_metric_config.tensorboard_summary.file_location,
+        nested_run_name_in_tb_file_location,
+    )
+
+    # Set run_name in run_model_cmds
+    new_run_model_cmds = [f"export {run_name_env}={run_name}"]
+    for cmd in self.task_test_config.run_model_cmds:
+      new_run_model_cmds.append(cmd)
+    self.task_test_config.run_model_cmds = new_run_model_cmds
 
-      # Set run_name in run_model_cmds
-      new_run_model_cmds = [f"export {run_name_env}={run_name}"]
-      for cmd in self.task_test_config.run_model_cmds:
-        new_run_model_cmds.append(cmd)
-      self.task_test_config.run_model_cmds = new_run_model_cmds
+    # Update tensorboard file location
+    self.task_metric_config.tensorboard_summary.file_location = tb_file_location
+    file_locations = [tb_file_location]
 
-      # Update tensorboard file location
-      self.task_metric_config.tensorboard_summary.file_location = (
-          tb_file_location
+    # Update profile file location
+    if self.task_metric_config.profile:
+      profile_file_location = name_format.generate_profile_file_location(
+          run_name, self.task_metric_config.profile.file_location
       )
+      self.task_metric_config.profile.file_location = profile_file_location
+      file_locations.append(profile_file_location)
 
-      # Update profile file location
-      if self.task_metric_config.profile:
-        profile_file_location = name_format.generate_profile_file_location(
-            run_name, self.task_metric_config.profile.file_location
-        )
-        self.task_metric_config.profile.file_location = profile_file_location
-        run_model, gcs_path = self.run_model(
-            use_pathways=use_pathways, xpk_branch=xpk_branch
-        )
-        _ = (
-            run_name
-            >> (tb_file_location, profile_file_location)
-            >> run_model
-            >> self.post_process(gcs_path)
-        )
-      else:
-        run_model, gcs_path = self.run_model(
-            use_pathways=use_pathways, xpk_branch=xpk_branch
-        )
-        _ = (
-            run_name
-            >> tb_file_location
-            >> run_model
-            >> self.post_process(gcs_path)
-        )
-    return group
+    return run_name, file_locations
 
   def run_model(
       self,
@@ -741,13 +815,12 @@ class XpkTask(BaseTask):
           xpk_branch,
           max_restart,
       )
-      wait_for_workload_completion = xpk.wait_for_workload_completion.override(
-          timeout=int(self.task_test_config.timeout.total_seconds()),
-      )(
-          workload_id=workload_id,
-          project_id=self.task_gcp_config.project_name,
-          region=gke.zone_to_region(self.task_gcp_config.zone),
-          cluster_name=self.task_test_config.cluster_name,
+      wait_for_workload_completion = self.wait_for_workload_completion(
+          workload_id, use_pathways
+      )
+
+      record_workload_timing = self.record_workload_timing(
+          workload_id, f"{launch_workload.group_id}.run_workload"
       )
 
       clean_up_workload = xpk.clean_up_workload(
@@ -762,6 +835,7 @@ class XpkTask(BaseTask):
           (workload_id, gcs_path)
           >> launch_workload
           >> wait_for_workload_completion
+          >> record_workload_timing
           >> clean_up_workload
       )
       return group, gcs_path
@@ -799,18 +873,90 @@ class XpkTask(BaseTask):
           mtc_enabled=mtc_enabled,
           xpk_branch=xpk_branch,
           max_restart=max_restart,
+          use_k8s_api=self.use_k8s_api,
       )
-      wait_for_workload_start = xpk.wait_for_workload_start.override(
-          timeout=self.workload_provision_timeout.total_seconds()
-      )(
-          workload_id=workload_id,
-          project_id=self.task_gcp_config.project_name,
-          region=gke.zone_to_region(self.task_gcp_config.zone),
-          cluster_name=self.task_test_config.cluster_name,
-      )
+      wait_for_workload_start = self.wait_for_workload_start(workload_id)
       _ = run_workload >> wait_for_workload_start
       return group
 
+  def _cluster_kwargs(self) -> Dict[str, str]:
+    return {
+        "project_id": self.task_gcp_config.project_name,
+        "region": gke.zone_to_region(self.task_gcp_config.zone),
+        "cluster_name": self.task_test_config.cluster_name,
+    }
+
+  def wait_for_workload_start(self, workload_id: airflow.XComArg) -> DAGNode:
+    """Wait for the first pod of the workload to be created."""
+    if self.deferrable:
+      return k8s_watch.WaitForPodsOperator(
+          task_id="wait_for_workload_start",
+          label_key=workload_status.JOBSET_NAME_LABEL,
+          label_value=workload_id,
+          condition=k8s_watch.STARTED,
+          timeout=self.workload_provision_timeout,
+          **self._cluster_kwargs(),
+      )
+    return xpk.wait_for_workload_start.override(
+        timeout=self.workload_provision_timeout.total_seconds()
+    )(workload_id=workload_id, **self._cluster_kwargs())
+
+  def wait_for_workload_completion(
+      self, workload_id: airflow.XComArg, use_pathways: bool = False
+  ) -> DAGNode:
+    """Wait for all pods of the workload to succeed."""
+    # Pathways deletes pods on failure, which only the sensor handles.
+    if self.deferrable and not use_pathways:
+      return k8s_watch.WaitForPodsOperator(
+          task_id="wait_for_workload_completion",
+          label_key=workload_status.JOBSET_NAME_LABEL,
+          label_value=workload_id,
+          condition=k8s_watch.COMPLETED,
+          timeout=self.task_test_config.timeout,
+          **self._cluster_kwargs(),
+      )
+    return xpk.wait_for_workload_completion.override(
+        timeout=int(self.task_test_config.timeout.total_seconds()),
+    )(workload_id=workload_id, **self._cluster_kwargs())
+
+  def wait_for_workload_reach_step(
+      self,
+      workload_id: airflow.XComArg,
+      expect_reach_to_step: int,
+      timeout: datetime.timedelta = xpk.REACH_STEP_TIMEOUT,
+  ) -> DAGNode:
+    """Wait for the workload to log the expected training step."""
+    if self.deferrable:
+      return k8s_watch.WaitForStepOperator(
+          task_id="wait_for_workload_reach_step",
+          label_key=workload_status.JOBSET_NAME_LABEL,
+          label_value=workload_id,
+          step=int(expect_reach_to_step),
+          step_pattern=xpk.COMPLETED_STEP_PATTERN,
+          timeout=timeout,
+          **self._cluster_kwargs(),
+      )
+    return xpk.wait_for_workload_reach_step.override(
+        task_id="wait_for_workload_reach_step",
+        timeout=timeout.total_seconds(),
+    )(
+        workload_id=workload_id,
+        expect_reach_to_step=str(expect_reach_to_step),
+        **self._cluster_kwargs(),
+    )
+
+  def record_workload_timing(
+      self, workload_id: airflow.XComArg, launch_task_id: str
+  ) -> DAGNode:
+    """Record the time the workload spent in each stage, for post_process."""
+    return xpk.record_workload_timing(
+        project_id=self.task_gcp_config.project_name,
+        zone=self.task_gcp_config.zone,
+        cluster_name=self.task_test_config.cluster_name,
+        workload_id=workload_id,
+        launch_task_id=launch_task_id,
+    )
+
   def post_process(self, result_location: Optional[str] = None) -> DAGNode:
     """Process metrics and metadata, and insert them into BigQuery tables.
 
@@ -858,6 +1004,11 @@ class GpuCreateResourceTask(BaseTask):
     install_nvidia_drivers: whether to install Nvidia drivers.
     existing_instance_name: whether an existing GPU instance shall be used.
     reservation: use a specific reservation for the VM instance, if available
+    cache_setup: whether to restore the setup script results from a GCS cache
+      keyed by the setup script and image, populating it on a miss.
+    warm_pool_size: if positive, lease the VM from a warm pool that keeps up to
+      this many idle VMs of the same machine type and image, instead of
+      creating and deleting a VM per test.
   """
 
   image_project: str
@@ -869,6 +1020,8 @@ class GpuCreateResourceTask(BaseTask):
   install_nvidia_drivers: bool = False
   existing_instance_name: str = None
   reservation: bool = False
+  cache_setup: bool = False
+  warm_pool_size: int = 0
 
   def run(self) -> DAGNode:
     """Run a test job.
@@ -881,6 +1034,8 @@ class GpuCreateResourceTask(BaseTask):
     # resource command for GPU.
     if self.existing_instance_name is not None:
       return self.run_with_existing_instance()
+    if self.warm_pool_size > 0:
+      return self.run_with_warm_pool()
 
     with TaskGroup(
         group_id=self.task_test_config.benchmark_id, prefix_group_id=True
@@ -944,6 +1099,83 @@ class GpuCreateResourceTask(BaseTask):
       _ = provision >> run_model >> post_process >> clean_up
     return group
 
+  def run_with_warm_pool(self) -> DAGNode:
+    """Run a test job on a VM leased from the warm pool.
+
+    Returns:
+      A task group with the following tasks chained:
+      provision, run_model, post_process and clean_up.
+    """
+    with TaskGroup(
+        group_id=self.task_test_config.benchmark_id, prefix_group_id=True
+    ) as group:
+      with TaskGroup(group_id="provision") as provision:
+        with TaskGroup(group_id="initialize"):
+          gpu_name = gpu.generate_gpu_name()
+          ssh_keys = ssh.generate_ssh_keys()
+          gcs_location = name_format.generate_gcs_folder_location(
+              self.task_test_config.gcs_subfolder,
+              self.task_test_config.benchmark_id,
+          )
+
+        # Keeps the task IDs of `gpu.create_resource`, which are used to
+        # compute the job status.
+        with TaskGroup(group_id="create_resource"):
+          run_timeout = self.task_test_config.timeout or datetime.timedelta(
+              hours=2
+          )
+          lease = gpu_pool.lease_resource(
+              gpu_name,
+              self.image_project,
+              self.image_family,
+              self.task_test_config.accelerator,
+              self.task_gcp_config,
+              ssh_keys,
+              lease_duration=(
+                  self.gpu_create_timeout
+                  + run_timeout
+                  + datetime.timedelta(hours=1)
+              ),
+              install_nvidia_drivers=self.install_nvidia_drivers,
+              reservation=self.reservation,
+          )
+          ip_address = gpu_pool.get_ip_address(
+              lease["instance_name"], lease["operation"], self.task_gcp_config
+          )
+          _ = (
+              gpu_pool.wait_for_resource_creation.override(
+                  timeout=self.gpu_create_timeout.total_seconds()
+              )(lease["operation"], self.task_gcp_config)
+              >> ip_address
+          )
+
+        _ = ip_address >> gpu.ssh_host.override(task_id="setup")(
+            ip_address,
+            self._setup_script(lease["instance_name"]),
+            ssh_keys,
+        )
+
+      if (
+          self.task_metric_config
+          and self.task_metric_config.use_runtime_generated_gcs_folder
+      ):
+        env_variable = {
+            f"{metric_config.SshEnvVars.GCS_OUTPUT.name}": gcs_location
+        }
+      else:
+        env_variable = None
+      run_model = self.run_model(ip_address, ssh_keys, env_variable)
+      post_process = self.post_process(gcs_location)
+      clean_up = gpu_pool.release_resource.override(task_id="clean_up")(
+          lease["instance_name"],
+          lease["lease_id"],
+          ssh_keys,
+          self.task_gcp_config,
+          self.warm_pool_size,
+      )
+      _ = provision >> run_model >> post_process >> clean_up
+    return group
+
   def provision_via_existing_instance(
       self,
   ) -> Tuple[DAGNode, airflow.XComArg, airflow.XComArg, airflow.XComArg,]:
@@ -1011,12 +1243,34 @@ class GpuCreateResourceTask(BaseTask):
 
       _ = ip_address >> gpu.ssh_host.override(task_id="setup")(
           ip_address,
-          self.task_test_config.setup_script,
+          self._setup_script(gpu_name),
           ssh_keys,
       )
 
     return group, ip_address, gpu_name, ssh_keys, gcs_location
 
+  def _setup_script(
+      self, instance_name: airflow.XComArg
+  ) -> Union[str, airflow.XComArg]:
+    setup_script = self.task_test_config.setup_script
+    if not self.cache_setup:
+      return setup_script
+
+    accelerator = self.task_test_config.accelerator
+    gcp = self.task_gcp_config
+
+    @task
+    def cached_setup_script(instance_name: str) -> str:
+      # Keyed by the image the VM booted from rather than its family, so a new
+      # image in the family doesn't restore a setup built on the old one.
+      image = gpu.get_boot_image(gcp.project_name, gcp.zone, instance_name)
+      return setup_cache.with_setup_cache(
+          setup_script,
+          setup_cache.cache_key(setup_script, accelerator.name, image),
+      )
+
+    return cached_setup_script(instance_name)
+
   def run_model(
       self,
       resource: airflow.XComArg,
@@ -1098,6 +1352,112 @@ class GpuCreateResourceTask(BaseTask):
     )
 
 
+def run_xpk_sweep(
+    tests: List[XpkTask],
+    max_concurrency: int = xpk.BATCH_LAUNCH_CONCURRENCY,
+    xpk_branch: str = xpk.MAIN_BRANCH,
+    run_name_env: str = "M_RUN_NAME",
+    nested_run_name_in_tb_file_location: bool = True,
+) -> DAGNode:
+  """Run a sweep of XPK tests on one cluster, launching them in one task.
+
+  Like `XpkTask.run_with_run_name_generation` for each test, except that all
+  workloads are submitted together by `xpk.run_workloads`. A workload that
+  fails to launch only fails its own test's tasks.
+
+  Args:
+    tests: Tests to run, all on the same cluster.
+    max_concurrency: Number of workloads submitted in parallel.
+    xpk_branch: xpk branch to use for workloads that need the xpk CLI.
+    run_name_env: Environment variable holding each test's run name.
+    nested_run_name_in_tb_file_location: Whether the tensorboard file location
+      has the run name nested twice.
+
+  Returns:
+    A task group that runs the sweep.
+  """
+  gcp = tests[0].task_gcp_config
+  cluster_name = tests[0].task_test_config.cluster_name
+  if any(
+      (t.task_gcp_config.project_name, t.task_gcp_config.zone)
+      != (gcp.project_name, gcp.zone)
+      or t.task_test_config.cluster_name != cluster_name
+      for t in tests
+  ):
+    raise ValueError("All tests of a sweep must run on the same cluster.")
+
+  with TaskGroup(group_id="sweep") as group:
+    test_groups, workloads, workload_specs, gcs_paths = [], [], [], []
+    for test in tests:
+      config = test.task_test_config
+      with TaskGroup(group_id=config.benchmark_id) as test_group:
+        run_name, file_locations = test.generate_run_name(
+            run_name_env, nested_run_name_in_tb_file_location
+        )
+        workload_id = xpk.generate_workload_id(config.benchmark_id)
+        gcs_path = name_format.generate_gcs_folder_location(
+            config.gcs_subfolder, config.benchmark_id
+        )
+        _ = run_name >> file_locations
+      test_groups.append(test_group)
+      workloads.append((workload_id, file_locations))
+      gcs_paths.append(gcs_path)
+      workload_specs.append({
+          "benchmark_id": config.benchmark_id,
+          "workload_id": workload_id,
+          "gcs_path": gcs_path,
+          "docker_image": config.docker_image,
+          "accelerator_type": config.accelerator.name,
+          "run_cmds": config.test_script,
+          "num_slices": config.num_slices,
+          "use_k8s_api": test.use_k8s_api,
+      })
+
+    run_workloads = xpk.run_workloads.override(
+        owner=tests[0].task_test_config.task_owner
+    )(
+        cluster_project=gcp.project_name,
+        zone=gcp.zone,
+        cluster_name=cluster_name,
+        workloads=workload_specs,
+        max_concurrency=max_concurrency,
+        xpk_branch=xpk_branch,
+    )
+
+    for test, test_group, (workload_id, file_locations), gcs_path in zip(
+        tests, test_groups, workloads, gcs_paths
+    ):
+      with test_group:
+        check_workload_launched = xpk.check_workload_launched(
+            run_workloads, workload_id
+        )
+        wait_for_workload_start = test.wait_for_workload_start(workload_id)
+        wait_for_workload_completion = test.wait_for_workload_completion(
+            workload_id
+        )
+        record_workload_timing = test.record_workload_timing(
+            workload_id, run_workloads.operator.task_id
+        )
+        clean_up_workload = xpk.clean_up_workload(
+            workload_id=workload_id,
+            project_id=gcp.project_name,
+            zone=gcp.zone,
+            cluster_name=cluster_name,
+            xpk_branch=xpk_branch,
+        )
+        _ = (
+            file_locations
+            >> run_workloads
+            >> check_workload_launched
+            >> wait_for_workload_start
+            >> wait_for_workload_completion
+            >> record_workload_timing
+            >> clean_up_workload
+            >> test.post_process(gcs_path)
+        )
+  return group
+
+
 # TODO(ranran): This class is big. Let's move it to a new file.
 @dataclasses.dataclass
 class GpuGkeTask(BaseTask):
@@ -1109,6 +1469,7 @@ class GpuGkeTask(BaseTask):
     cluster_name: Name of the GCP cluster.
     job_create_timeout: Amount of time to wait for all pods to become active.
     task_metric_config: metric configuration (e.g., result gcs path).
+    deferrable: Wait for the job in the triggerer instead of on a worker.
   """
 
   task_test_config: test_config.GpuGkeTest
@@ -1116,6 +1477,7 @@ class GpuGkeTask(BaseTask):
   cluster_name: str
   job_create_timeout: datetime.timedelta = datetime.timedelta(minutes=10)
   task_metric_config: Optional[metric_config.MetricConfig] = None
+  deferrable: bool = False
 
   def run(self) -> DAGNode:
     """Run a test job and do post data process.
@@ -1141,6 +1503,7 @@ class GpuGkeTask(BaseTask):
           self.job_create_timeout,
           self.task_test_config.task_owner,
           gcs_location,
+          deferrable=self.deferrable,
       )
       post_process = self.post_process(gcs_location)
       _ = gcs_location >> gke_run >> post_process
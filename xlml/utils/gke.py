@@ -1,19 +1,23 @@
+import asyncio
 import base64
-import concurrent.futures
+import contextlib
 import datetime
+import json
 import logging
+import os
 import tempfile
-import time
-from typing import Any, Dict, Optional
+import threading
+from typing import Any, Callable, Dict, Iterator, Tuple
 
 from airflow.decorators import task, task_group
 import google.auth
+import google.auth.credentials
 import google.auth.transport.requests
 from google.cloud import container_v1
 import kubernetes
 
 from xlml.apis import gcp_config, test_config
-from xlml.utils import composer
+from xlml.utils import composer, k8s_watch, pod_logs
 
 """Utilities for GKE."""
 
@@ -25,7 +29,53 @@ class PodsNotReadyError(Exception):
     super().__init__(message)
 
 
-def get_authenticated_client(
+# CA certificates of clusters, one file per cluster, overwritten when a client
+# is created. Airflow task processes exit without running `atexit` handlers,
+# so per-process files would never be removed.
+CA_CERT_DIR = os.path.join(tempfile.gettempdir(), 'gke_ca_certs')
+
+
+# Authenticated clients keyed by (project, region, cluster), shared by all
+# Kubernetes helpers in this process.
+_client_cache: Dict[Tuple[str, str, str], kubernetes.client.ApiClient] = {}
+_client_cache_lock = threading.Lock()
+
+
+def _refresh_token_hook(
+    creds: google.auth.credentials.Credentials,
+) -> Callable[[kubernetes.client.Configuration], None]:
+  """Returns a hook that refreshes the bearer token before it expires."""
+  lock = threading.Lock()
+
+  def refresh(configuration: kubernetes.client.Configuration) -> None:
+    with lock:
+      # Credentials become invalid shortly before they actually expire.
+      if not creds.valid:
+        creds.refresh(google.auth.transport.requests.Request())
+      configuration.api_key['authorization'] = creds.token
+
+  return refresh
+
+
+def _write_ca_cert(
+    project_name: str, region: str, cluster_name: str, content: bytes
+) -> str:
+  """Writes the CA certificate of a cluster to its file, returning the path."""
+  os.makedirs(CA_CERT_DIR, exist_ok=True)
+  path = os.path.join(
+      CA_CERT_DIR, f'{project_name}_{region}_{cluster_name}.crt'
+  )
+  # The file is replaced atomically, so a client in another process never reads
+  # a partial one.
+  with tempfile.NamedTemporaryFile(
+      dir=CA_CERT_DIR, suffix='.tmp', delete=False
+  ) as ca_cert:
+    ca_cert.write(content)
+  os.replace(ca_cert.name, path)
+  return path
+
+
+def _create_authenticated_client(
     project_name: str, region: str, cluster_name: str
 ) -> kubernetes.client.ApiClient:
   container_client = container_v1.ClusterManagerClient()
@@ -34,23 +84,102 @@ def get_authenticated_client(
   )
   response = container_client.get_cluster(name=cluster_path)
   creds, _ = google.auth.default()
-  auth_req = google.auth.transport.requests.Request()
-  creds.refresh(auth_req)
   configuration = kubernetes.client.Configuration()
   configuration.host = f'https://{response.endpoint}'
 
   ca_cert_content = base64.b64decode(
       response.master_auth.cluster_ca_certificate
   )
-  with tempfile.NamedTemporaryFile(delete=False) as ca_cert:
-    ca_cert.write(ca_cert_content)
-    configuration.ssl_ca_cert = ca_cert.name
+  configuration.ssl_ca_cert = _write_ca_cert(
+      project_name, region, cluster_name, ca_cert_content
+  )
   configuration.api_key_prefix['authorization'] = 'Bearer'
-  configuration.api_key['authorization'] = creds.token
+  configuration.refresh_api_key_hook = _refresh_token_hook(creds)
 
   return kubernetes.client.ApiClient(configuration)
 
 
+def get_authenticated_client(
+    project_name: str, region: str, cluster_name: str
+) -> kubernetes.client.ApiClient:
+  """Returns a Kubernetes API client for a GKE cluster.
+
+  Clients are cached per cluster for the lifetime of the process, so the
+  cluster endpoint and CA certificate are fetched once per process. The cache
+  is best-effort: Airflow runs each task try, and each poke of a sensor in
+  reschedule mode, in a new process, so it only saves requests between calls
+  within one of them. A cluster recreated within a process isn't detected.
+  The bearer token is refreshed before each request if it is about to expire.
+
+  Args:
+    project_name: Project of the cluster.
+    region: Region or zone of the cluster.
+    cluster_name: Name of the cluster.
+
+  Returns:
+    An authenticated `ApiClient`.
+  """
+  key = (project_name, region, cluster_name)
+  with _client_cache_lock:
+    if key not in _client_cache:
+      _client_cache[key] = _create_authenticated_client(*key)
+    return _client_cache[key]
+
+
+@contextlib.contextmanager
+def kubeconfig(
+    project_name: str, region: str, cluster_name: str
+) -> Iterator[str]:
+  """Provides a kubeconfig for `kubectl` to access a GKE cluster.
+
+  Unlike `gcloud container clusters get-credentials`, this runs no process.
+  The kubeconfig is written from the cluster's cached client with its current
+  bearer token. It holds the token, so it only exists within the context, and
+  a new one should be provided for each `kubectl` command.
+
+  Args:
+    project_name: Project of the cluster.
+    region: Region or zone of the cluster.
+    cluster_name: Name of the cluster.
+
+  Yields:
+    The path of the kubeconfig file.
+  """
+  configuration = get_authenticated_client(
+      project_name, region, cluster_name
+  ).configuration
+  # Refreshes the token if it is about to expire.
+  token = configuration.get_api_key_with_prefix('authorization').removeprefix(
+      'Bearer '
+  )
+  config = {
+      'apiVersion': 'v1',
+      'kind': 'Config',
+      'clusters': [{
+          'name': cluster_name,
+          'cluster': {
+              'server': configuration.host,
+              'certificate-authority': configuration.ssl_ca_cert,
+          },
+      }],
+      'users': [{'name': cluster_name, 'user': {'token': token}}],
+      'contexts': [{
+          'name': cluster_name,
+          'context': {'cluster': cluster_name, 'user': cluster_name},
+      }],
+      'current-context': cluster_name,
+  }
+  # Temporary files are only readable by their owner.
+  with tempfile.NamedTemporaryFile(
+      'w', suffix='.kubeconfig', delete=False
+  ) as f:
+    json.dump(config, f)
+  try:
+    yield f.name
+  finally:
+    os.remove(f.name)
+
+
 @task_group
 def run_job(
     body: Dict[str, Any],
@@ -60,6 +189,7 @@ def run_job(
     job_create_timeout: datetime.timedelta,
     task_owner: str,
     gcs_location: str = '',
+    deferrable: bool = False,
 ):
   """Run a batch job directly on a GKE cluster.
 
@@ -71,6 +201,9 @@ def run_job(
     job_create_timeout: Amount of time to wait for all pods to become active.
     task_owner: Task owner username or link.
     gcs_location: GCS path for all artifacts of the test.
+    deferrable: Wait for the job with Kubernetes watches in the triggerer
+      instead of a sensor and a task streaming logs for the whole job. Logs
+      are then archived and exit codes checked once the job ends.
   """
 
   @task
@@ -128,92 +261,57 @@ def run_job(
     return True
 
   @task(retries=6)
-  def stream_logs(name: str):
-    def _watch_pod(name, namespace) -> Optional[int]:
-      logs_watcher = kubernetes.watch.Watch()
-
-      logging.info(f'Waiting for pod {name} to start...')
-      pod_watcher = kubernetes.watch.Watch()
-      for event in pod_watcher.stream(
-          core_api.list_namespaced_pod,
-          namespace,
-          field_selector=f'metadata.name={name}',
-      ):
-        status = event['object'].status
-        logging.info(
-            f'Pod {event["object"].metadata.name} status: {status.phase}'
-        )
-        if status.phase != 'Pending':
-          break
-
-      logging.info(f'Streaming pod logs for {name}...')
-      for line in logs_watcher.stream(
-          core_api.read_namespaced_pod_log,
-          name,
-          namespace,
-          _request_timeout=3600,
-      ):
-        logging.info(f'{name}] {line}')
-
-      logging.warning(f'Lost logs stream for {name}.')
-
-      pod = core_api.read_namespaced_pod(namespace='default', name=name)
-      if pod.status.container_statuses:
-        container_status = pod.status.container_statuses[0]
-        if pod.status.container_statuses[0].state.terminated:
-          exit_code = container_status.state.terminated.exit_code
-          if exit_code:
-            logging.error(f'Pod {name} had non-zero exit code {exit_code}')
-
-          return exit_code
-
-      logging.warning(f'Unknown status for pod {name}')
-      return None
-
-    # We need to re-authenticate if the stream_logs fail. This can happen when
-    # the job runs for too long and the credential expire.
-    client = get_authenticated_client(gcp.project_name, gcp.zone, cluster_name)
-
-    batch_api = kubernetes.client.BatchV1Api(client)
-    core_api = kubernetes.client.CoreV1Api(client)
-    pod_label_selector = f'batch.kubernetes.io/job-name={name}'
-    pods = core_api.list_namespaced_pod(
-        namespace='default', label_selector=pod_label_selector
-    )
-    # TODO(piz): Use time.sleep may not be a good solution here. However, I expect
-    # resources are all ready in wait_all_pods_ready stage. This just in case
-    # authentication takes time. Check with Will for better solutions.
-    time.sleep(30)
-    if len(pods.items) != body['spec']['parallelism']:
-      logging.info('Waiting for all pods to be re-connected...')
-      raise PodsNotReadyError('pods are not ready after refreshing credential.')
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-      futures = []
-      for pod in pods.items:
-        f = executor.submit(
-            _watch_pod, pod.metadata.name, pod.metadata.namespace
-        )
-        futures.append(f)
-
-      # Wait for pods to complete, and exit with the first non-zero exit code.
-      for f in concurrent.futures.as_completed(futures):
-        try:
-          # TODO(piz/wcromar): it looks like there is a delay between as_completed
-          # and update of f.result(). exit_code can be None even task is complete.
-          exit_code = f.result()
-        except kubernetes.client.ApiException as e:
-          logging.error('Kubernetes error. Retrying...', exc_info=e)
-          exit_code = None
-
-        # Retry if status is unknown
-        if exit_code is None:
-          raise RuntimeError('unknown exit code')
-        if exit_code:
-          raise RuntimeError('Non-zero exit code')
+  def stream_logs(name: str, gcs_location: str):
+    try:
+      exit_codes = pod_logs.stream_job_logs(
+          gcp.project_name,
+          gcp.zone,
+          cluster_name,
+          label_selector=f'batch.kubernetes.io/job-name={name}',
+          expected_pods=body['spec']['parallelism'],
+          archive_location=f'{gcs_location}/logs' if gcs_location else None,
+      )
+    except asyncio.TimeoutError as e:
+      raise PodsNotReadyError(f'Pods of {name} are not ready.') from e
+
+    # Exit with the first non-zero exit code, and retry if any is unknown.
+    for exit_code in exit_codes.values():
+      if exit_code is None:
+        raise RuntimeError('unknown exit code')
+      if exit_code:
+        raise RuntimeError('Non-zero exit code')
 
   name = deploy_job.override(owner=task_owner)(gcs_location)
-  wait_all_pods_ready(name) >> stream_logs(name)
+  if deferrable:
+    cluster_kwargs = {
+        'project_id': gcp.project_name,
+        'region': gcp.zone,
+        'cluster_name': cluster_name,
+        'label_key': 'batch.kubernetes.io/job-name',
+        'label_value': name,
+    }
+    wait_all_pods_ready_deferred = k8s_watch.WaitForPodsOperator(
+        task_id='wait_all_pods_ready',
+        condition=k8s_watch.READY,
+        expected_pods=body['spec']['parallelism'],
+        timeout=job_create_timeout,
+        **cluster_kwargs,
+    )
+    wait_for_job_completion = k8s_watch.WaitForPodsOperator(
+        task_id='wait_for_job_completion',
+        condition=k8s_watch.COMPLETED,
+        expected_pods=body['spec']['parallelism'],
+        timeout=gke_test_config.timeout,
+        **cluster_kwargs,
+    )
+    # The pods have terminated, so their logs are read in full at once. This
+    # archives them and checks exit codes even if a pod failed.
+    archive_logs = stream_logs.override(
+        task_id='archive_logs', trigger_rule='all_done'
+    )(name, gcs_location)
+    _ = wait_all_pods_ready_deferred >> wait_for_job_completion >> archive_logs
+  else:
+    wait_all_pods_ready(name) >> stream_logs(name, gcs_location)
 
 
 def zone_to_region(zone: str) -> str:
@@ -0,0 +1,110 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for gke.py."""
+
+import base64
+import json
+import os
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from google.cloud import container_v1
+from xlml.utils import gke
+
+
+class GetAuthenticatedClientTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.addCleanup(gke._client_cache.clear)
+    self.enter_context(
+        mock.patch.object(
+            gke,
+            "CA_CERT_DIR",
+            self.enter_context(tempfile.TemporaryDirectory()),
+        )
+    )
+    self.get_cluster = self.enter_context(
+        mock.patch.object(container_v1, "ClusterManagerClient")
+    ).return_value.get_cluster
+    self.get_cluster.return_value = container_v1.Cluster(
+        endpoint="1.2.3.4",
+        master_auth=container_v1.MasterAuth(
+            cluster_ca_certificate=base64.b64encode(b"ca").decode()
+        ),
+    )
+    self.creds = mock.Mock(valid=False, token="token")
+    self.enter_context(
+        mock.patch.object(
+            gke.google.auth, "default", return_value=(self.creds, "project")
+        )
+    )
+
+  def test_caches_client_per_cluster(self):
+    client = gke.get_authenticated_client("p", "r", "c")
+    cached_client = gke.get_authenticated_client("p", "r", "c")
+    other_client = gke.get_authenticated_client("p", "r", "other")
+
+    self.assertIs(client, cached_client)
+    self.assertIsNot(client, other_client)
+    self.assertEqual(self.get_cluster.call_count, 2)
+    self.assertEqual(client.configuration.host, "https://1.2.3.4")
+
+  def test_writes_ca_cert_once_per_cluster(self):
+    gke.get_authenticated_client("p", "r", "c")
+    gke._client_cache.clear()
+    configuration = gke.get_authenticated_client("p", "r", "c").configuration
+
+    self.assertEqual(
+        os.listdir(gke.CA_CERT_DIR),
+        [os.path.basename(configuration.ssl_ca_cert)],
+    )
+    with open(configuration.ssl_ca_cert, "rb") as f:
+      self.assertEqual(f.read(), b"ca")
+
+  def test_refreshes_token_near_expiry(self):
+    configuration = gke.get_authenticated_client("p", "r", "c").configuration
+
+    self.assertEqual(
+        configuration.get_api_key_with_prefix("authorization"), "Bearer token"
+    )
+    self.creds.valid = True
+    configuration.get_api_key_with_prefix("authorization")
+
+    self.creds.refresh.assert_called_once()
+
+  def test_kubeconfig_has_current_token_and_is_removed(self):
+    with gke.kubeconfig("p", "r", "c") as path:
+      with open(path, encoding="utf-8") as f:
+        kubeconfig = json.load(f)
+    self.creds.token = "new-token"
+    with gke.kubeconfig("p", "r", "c") as refreshed_path:
+      with open(refreshed_path, encoding="utf-8") as f:
+        refreshed_kubeconfig = json.load(f)
+
+    self.assertFalse(os.path.exists(path))
+    self.assertFalse(os.path.exists(refreshed_path))
+    self.assertEqual(kubeconfig["users"][0]["user"]["token"], "token")
+    self.assertEqual(
+        refreshed_kubeconfig["users"][0]["user"]["token"], "new-token"
+    )
+    self.assertEqual(
+        kubeconfig["clusters"][0]["cluster"]["server"], "https://1.2.3.4"
+    )
+
+
+if __name__ == "__main__":
+  absltest.main()
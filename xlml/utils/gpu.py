@@ -20,6 +20,7 @@ from __future__ import annotations
 from absl import logging
 import airflow
 from airflow.decorators import task, task_group
+from airflow.models import Variable
 import datetime
 import fabric
 from google.cloud import compute_v1
@@ -27,12 +28,21 @@ import io
 import paramiko
 import re
 import time
-from typing import Dict, Iterable
+from typing import Dict, Iterable, Optional
 import uuid
 from xlml.apis import gcp_config, test_config
 from xlml.utils import ssh, composer
 
 
+SSH_USER = "cloud-ml-auto-solutions"
+
+# Image families publish new images at most daily.
+IMAGE_CACHE_TTL = datetime.timedelta(hours=6)
+IMAGE_CACHE_VARIABLE = "gpu-image-family-cache"
+# Maps "<project>/<family>" to {"self_link": ..., "expiry": <unix seconds>}.
+_image_cache: Dict[str, Dict[str, str | float]] = {}
+
+
 def get_image_from_family(project: str, family: str) -> compute_v1.Image:
   """
   Retrieve the newest image that is part of a given family in a project.
@@ -51,6 +61,73 @@ def get_image_from_family(project: str, family: str) -> compute_v1.Image:
   return newest_image
 
 
+def get_image_link_from_family(
+    project: str,
+    family: str,
+    ttl: datetime.timedelta = IMAGE_CACHE_TTL,
+) -> str:
+  """Resolve the newest image of a family, cached for `ttl`.
+
+  Resolved images are cached in process and in an Airflow Variable shared by
+  all workers, so most GPU provisioning requests skip the Compute API lookup.
+
+  Args:
+    project: project ID or project number of the Cloud project to get image.
+    family: name of the image family you want to get image from.
+    ttl: how long a resolved image is reused.
+
+  Returns:
+    The self link of the image.
+  """
+  key = f"{project}/{family}"
+  now = time.time()
+
+  entry = _image_cache.get(key)
+  if not entry or entry["expiry"] <= now:
+    try:
+      entry = Variable.get(
+          IMAGE_CACHE_VARIABLE, default_var={}, deserialize_json=True
+      ).get(key)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+      logging.warning(f"Failed to read {IMAGE_CACHE_VARIABLE}: {e}")
+      entry = None
+
+  if entry and entry["expiry"] > now:
+    logging.info(f"Using cached image {entry['self_link']} for {key}.")
+    _image_cache[key] = entry
+    return entry["self_link"]
+
+  image = get_image_from_family(project=project, family=family)
+  entry = {"self_link": image.self_link, "expiry": now + ttl.total_seconds()}
+  _image_cache[key] = entry
+  try:
+    cache = Variable.get(
+        IMAGE_CACHE_VARIABLE, default_var={}, deserialize_json=True
+    )
+    cache = {k: v for k, v in cache.items() if v["expiry"] > now}
+    cache[key] = entry
+    Variable.set(IMAGE_CACHE_VARIABLE, cache, serialize_json=True)
+  except Exception as e:  # pylint: disable=broad-exception-caught
+    logging.warning(f"Failed to update {IMAGE_CACHE_VARIABLE}: {e}")
+  return entry["self_link"]
+
+
+def get_boot_image(project_id: str, zone: str, instance_name: str) -> str:
+  """Returns the self link of the image the instance booted from.
+
+  Unlike the image family, this does not move when the family gets a new
+  image after the instance was created.
+  """
+  instance = compute_v1.InstancesClient().get(
+      project=project_id, zone=zone, instance=instance_name
+  )
+  boot_disk = next(disk for disk in instance.disks if disk.boot)
+  disk = compute_v1.DisksClient().get(
+      project=project_id, zone=zone, disk=boot_disk.source.rsplit("/", 1)[-1]
+  )
+  return disk.source_image
+
+
 def disk_from_image(
     disk_type: str,
     boot: bool,
@@ -129,17 +206,45 @@ def generate_gpu_name() -> str:
   return f"gpu-{str(uuid.uuid4())}"
 
 
-@task
-def get_existing_resource(
+def _set_metadata(
+    instance_client: compute_v1.InstancesClient,
+    instance_name: str,
+    gcp: gcp_config.GCPConfig,
+    metadata: compute_v1.Metadata,
+) -> None:
+  metadata_request = compute_v1.SetMetadataInstanceRequest(
+      instance=instance_name,
+      project=gcp.project_name,
+      zone=gcp.zone,
+      metadata_resource=metadata,
+  )
+  operation = instance_client.set_metadata(request=metadata_request)
+  if operation.error:
+    logging.error(
+        (
+            "Error during instance set metadata: [Code:"
+            f" {operation.http_error_status_code}]:"
+            f" {operation.http_error_message}"
+            f" {operation.error}"
+        ),
+    )
+    raise operation.exception() or RuntimeError(operation.http_error_message)
+  elif operation.warnings:
+    logging.warning("Warnings during instance set metadata:\n")
+    for warning in operation.warnings:
+      logging.warning(f" - {warning.code}: {warning.message}")
+
+
+def add_ssh_keys(
     instance_name: str,
     ssh_keys: ssh.SshKeys,
     gcp: gcp_config.GCPConfig,
-) -> airflow.XComArg:
-  """Reach a resource node that is already created.
+) -> str:
+  """Authorize one-time use ssh_keys on an existing instance.
 
   Args:
     instance_name: name of the existing instance.
-    ssh_keys: airflow.XComArg,
+    ssh_keys: SSH keys to authorize.
     gcp: GCP project/zone configuration.
 
   Returns:
@@ -163,52 +268,29 @@ def get_existing_resource(
   for item in metadata.items:
     if item.key == "ssh-keys":
       ssh_key_exist = True
-      item.value = (
-          item.value + "\n" + f"cloud-ml-auto-solutions:{ssh_keys.public}"
-      )
+      item.value = item.value + "\n" + f"{SSH_USER}:{ssh_keys.public}"
       break
   if not ssh_key_exist:
     items.append({
         "key": "ssh-keys",
-        "value": f"cloud-ml-auto-solutions:{ssh_keys.public}",
+        "value": f"{SSH_USER}:{ssh_keys.public}",
     })
     metadata.items = items
-  metadata_request = compute_v1.SetMetadataInstanceRequest(
-      instance=instance_name,
-      project=gcp.project_name,
-      zone=gcp.zone,
-      metadata_resource=metadata,
-  )
-  operation = instance_client.set_metadata(request=metadata_request)
-  if operation.error:
-    logging.error(
-        (
-            "Error during instance set metadata: [Code:"
-            f" {operation.http_error_status_code}]:"
-            f" {operation.http_error_message}"
-            f" {operation.error}"
-        ),
-    )
-    raise operation.exception() or RuntimeError(operation.http_error_message)
-  elif operation.warnings:
-    logging.warning("Warnings during instance set metadata:\n")
-    for warning in operation.warnings:
-      logging.warning(f" - {warning.code}: {warning.message}")
+  _set_metadata(instance_client, instance_name, gcp, metadata)
 
   return ip_address
 
 
-@task(trigger_rule="all_done")
-def clean_up_ssh_keys(
+def remove_ssh_keys(
     instance_name: str,
     ssh_keys: ssh.SshKeys,
     gcp: gcp_config.GCPConfig,
-) -> airflow.XComArg:
-  """Remove the generated one-time use ssh_keys from existing instance.
+) -> None:
+  """Remove one-time use ssh_keys from an existing instance.
 
   Args:
     instance_name: name of the existing instance.
-    ssh_keys: airflow.XComArg,
+    ssh_keys: SSH keys to remove.
     gcp: GCP project/zone configuration.
   """
   instance_client = compute_v1.InstancesClient()
@@ -224,31 +306,252 @@ def clean_up_ssh_keys(
   metadata = instance.metadata
   for item in metadata.items:
     if item.key == "ssh-keys":
-      item.value = item.value.replace(
-          f"\ncloud-ml-auto-solutions:{ssh_keys.public}", ""
+      item.value = "\n".join(
+          key
+          for key in item.value.split("\n")
+          if key != f"{SSH_USER}:{ssh_keys.public}"
       )
       break
-  metadata_request = compute_v1.SetMetadataInstanceRequest(
-      instance=instance_name,
-      project=gcp.project_name,
-      zone=gcp.zone,
-      metadata_resource=metadata,
+  _set_metadata(instance_client, instance_name, gcp, metadata)
+
+
+@task
+def get_existing_resource(
+    instance_name: str,
+    ssh_keys: ssh.SshKeys,
+    gcp: gcp_config.GCPConfig,
+) -> airflow.XComArg:
+  """Reach a resource node that is already created.
+
+  Args:
+    instance_name: name of the existing instance.
+    ssh_keys: airflow.XComArg,
+    gcp: GCP project/zone configuration.
+
+  Returns:
+    The ip address of the GPU VM.
+  """
+  return add_ssh_keys(instance_name, ssh_keys, gcp)
+
+
+@task(trigger_rule="all_done")
+def clean_up_ssh_keys(
+    instance_name: str,
+    ssh_keys: ssh.SshKeys,
+    gcp: gcp_config.GCPConfig,
+) -> airflow.XComArg:
+  """Remove the generated one-time use ssh_keys from existing instance.
+
+  Args:
+    instance_name: name of the existing instance.
+    ssh_keys: airflow.XComArg,
+    gcp: GCP project/zone configuration.
+  """
+  remove_ssh_keys(instance_name, ssh_keys, gcp)
+
+
+def request_resource(
+    instance_name: str,
+    image_project: str,
+    image_family: str,
+    accelerator: test_config.Gpu,
+    gcp: gcp_config.GCPConfig,
+    ssh_keys: ssh.SshKeys,
+    instance_termination_action: str,
+    external_access=True,
+    spot: bool = False,
+    delete_protection: bool = False,
+    install_nvidia_drivers: bool = False,
+    reservation: bool = False,
+    labels: Optional[Dict[str, str]] = None,
+) -> str:
+  """
+  Send an instance creation request to the Compute Engine API and wait for
+  it to complete.
+
+  Args:
+      instance_name: name of the new virtual machine (VM) instance.
+      image_project: project of the image.
+      image_family: family of the image.
+      accelerator: Description of GPU to create.
+      gcp: GCP project/zone configuration.
+      ssh_keys: XCom value for SSH keys to communicate with these GPUs.
+      instance_termination_action: What action should be taken once a Spot VM
+          is terminated. Possible values: "STOP", "DELETE"
+      external_access: boolean flag indicating if the instance should have an
+          external IPv4 address assigned.
+      spot: boolean value indicating if the new instance should be a Spot VM
+          or not.
+      delete_protection: boolean value indicating if the new virtual machine
+          should be protected against deletion or not.
+      install_nvidia_drivers: boolean value indicating whether to install
+          Nvidia drivers.
+      reservation: boolean value indicating whether to use VM reservation
+      labels: labels of the new virtual machine.
+  Returns:
+      The name of the instance creation operation.
+  """
+  # Log required info for XLML PLX Dashboard
+  composer.log_metadata_for_xlml_dashboard({
+      "instance_name": instance_name,
+      "cluster_project": gcp.project_name,
+      "zone": gcp.zone,
+      "dataset_name": gcp.dataset_name.value,
+      "composer_project": gcp.composer_project,
+      "dataset_project": gcp.dataset_project,
+      "accelerator": {
+          "type": accelerator.name,
+          "num_cores": accelerator.count,
+          "runtime_version": accelerator.runtime_version,
+          "machine_type": accelerator.machine_type,
+          "image_family": accelerator.image_family,
+      },
+      "accelerator_type": accelerator.machine_type,
+  })
+
+  machine_type = accelerator.machine_type
+  image_link = get_image_link_from_family(
+      project=image_project, family=image_family
   )
-  operation = instance_client.set_metadata(request=metadata_request)
-  if operation.error:
-    logging.error(
-        (
-            "Error during instance set metadata: [Code:"
-            f" {operation.http_error_status_code}]:"
-            f" {operation.http_error_message}"
-            f" {operation.error}"
-        ),
+  disk_type = f"zones/{gcp.zone}/diskTypes/pd-ssd"
+  disks = [
+      disk_from_image(disk_type, True, image_link, accelerator.disk_size_gb)
+  ]
+  if accelerator.attach_local_ssd:
+    for _ in range(accelerator.count):
+      disks.append(local_ssd_disk(gcp.zone))
+  metadata = create_metadata({
+      "install-nvidia-driver": str(install_nvidia_drivers),
+      "proxy-mode": "project_editors",
+      "ssh-keys": f"{SSH_USER}:{ssh_keys.public}",
+  })
+
+  accelerators = [
+      compute_v1.AcceleratorConfig(
+          accelerator_count=accelerator.count,
+          accelerator_type=(
+              f"projects/{gcp.project_name}/zones/{gcp.zone}/"
+              f"acceleratorTypes/{accelerator.accelerator_type}"
+          ),
+      )
+  ]
+  service_account = compute_v1.ServiceAccount(
+      scopes=["https://www.googleapis.com/auth/cloud-platform"]
+  )
+
+  instance_client = compute_v1.InstancesClient()
+  # Use the network interface provided in the network_link argument.
+  network_interface = compute_v1.NetworkInterface()
+  if accelerator.subnetwork:
+    network_interface.network = accelerator.network
+  if accelerator.subnetwork:
+    network_interface.subnetwork = accelerator.subnetwork
+
+  if external_access:
+    access = compute_v1.AccessConfig()
+    access.type_ = compute_v1.AccessConfig.Type.ONE_TO_ONE_NAT.name
+    access.name = "External NAT"
+    access.network_tier = access.NetworkTier.PREMIUM.name
+    network_interface.access_configs = [access]
+
+  # Collect information into the Instance object.
+  instance = compute_v1.Instance()
+  instance.network_interfaces = [network_interface]
+  instance.name = instance_name
+  instance.disks = disks
+  if re.match(r"^zones/[a-z\d\-]+/machineTypes/[a-z\d\-]+$", machine_type):
+    instance.machine_type = machine_type
+  else:
+    instance.machine_type = f"zones/{gcp.zone}/machineTypes/{machine_type}"
+
+  instance.scheduling = compute_v1.Scheduling()
+  if accelerators:
+    instance.guest_accelerators = accelerators
+    instance.scheduling.on_host_maintenance = (
+        compute_v1.Scheduling.OnHostMaintenance.TERMINATE.name
     )
-    raise operation.exception() or RuntimeError(operation.http_error_message)
-  elif operation.warnings:
-    logging.warning("Warnings during instance set metadata:\n")
-    for warning in operation.warnings:
-      logging.warning(f" - {warning.code}: {warning.message}")
+
+  if metadata:
+    instance.metadata = metadata
+
+  if labels:
+    instance.labels = labels
+
+  if service_account:
+    instance.service_accounts = [service_account]
+
+  if spot:
+    # Set the Spot VM setting
+    instance.scheduling.provisioning_model = (
+        compute_v1.Scheduling.ProvisioningModel.SPOT.name
+    )
+    instance.scheduling.instance_termination_action = (
+        instance_termination_action
+    )
+
+  if delete_protection:
+    # Set the delete protection bit
+    instance.deletion_protection = True
+
+  if reservation:
+    # Set reservation affinity if specified
+    reservation_affinity = compute_v1.ReservationAffinity()
+    reservation_affinity.consume_reservation_type = (
+        compute_v1.ReservationAffinity.ConsumeReservationType.ANY_RESERVATION.name
+    )
+    instance.reservation_affinity = reservation_affinity
+
+  # Prepare the request to insert an instance.
+  request = compute_v1.InsertInstanceRequest()
+  request.zone = gcp.zone
+  request.project = gcp.project_name
+  request.instance_resource = instance
+
+  # Wait for the create operation to complete.
+  logging.info(f"Creating the {instance_name} instance in {gcp.zone}...")
+
+  operation = instance_client.insert(request=request)
+  return operation.name
+
+
+def resource_operation_done(
+    operation_name: str, project_id: str, zone: str
+) -> bool:
+  """Check whether an instance creation operation has completed.
+
+  Raises:
+    An exception if the operation failed.
+  """
+  # Retrives the delete opeartion to check the status.
+  client = compute_v1.ZoneOperationsClient()
+  request = compute_v1.GetZoneOperationRequest(
+      operation=operation_name,
+      project=project_id,
+      zone=zone,
+  )
+  operation = client.get(request=request)
+  status = operation.status.name
+  if status in ("RUNNING", "PENDING"):
+    logging.info(
+        f"Resource create status: {status}, {operation.status_message}"
+    )
+    return False
+  else:
+    if operation.error:
+      logging.error(
+          (
+              "Error during resource creation: [Code:"
+              f" {operation.http_error_status_code}]:"
+              f" {operation.http_error_message}"
+              f" {operation.error}"
+          ),
+      )
+      raise operation.exception() or RuntimeError(operation.http_error_message)
+    elif operation.warnings:
+      logging.warning("Warnings during resource creation:\n")
+      for warning in operation.warnings:
+        logging.warning(f" - {warning.code}: {warning.message}")
+    return True
 
 
 @task_group
@@ -294,183 +597,26 @@ def create_resource(
       install_nvidia_drivers: bool = False,
       reservation: bool = False,
   ) -> airflow.XComArg:
-    """
-    Send an instance creation request to the Compute Engine API and wait for
-    it to complete.
-
-    Args:
-        instance_name: name of the new virtual machine (VM) instance.
-        accelerator: Description of GPU to create.
-        ssh_keys: XCom value for SSH keys to communicate with these GPUs.
-        instance_termination_action: What action should be taken once a Spot VM
-            is terminated. Possible values: "STOP", "DELETE"
-        external_access: boolean flag indicating if the instance should have an
-            external IPv4 address assigned.
-        spot: boolean value indicating if the new instance should be a Spot VM
-            or not.
-        delete_protection: boolean value indicating if the new virtual machine
-            should be protected against deletion or not.
-        install_nvidia_drivers: boolean value indicating whether to install
-            Nvidia drivers.
-        reservation: boolean value indicating whether to use VM reservation
-    Returns:
-        Ip address of the instance object created.
-    """
-    # Log required info for XLML PLX Dashboard
-    composer.log_metadata_for_xlml_dashboard({
-        "instance_name": instance_name,
-        "cluster_project": gcp.project_name,
-        "zone": gcp.zone,
-        "dataset_name": gcp.dataset_name.value,
-        "composer_project": gcp.composer_project,
-        "dataset_project": gcp.dataset_project,
-        "accelerator": {
-            "type": accelerator.name,
-            "num_cores": accelerator.count,
-            "runtime_version": accelerator.runtime_version,
-            "machine_type": accelerator.machine_type,
-            "image_family": accelerator.image_family,
-        },
-        "accelerator_type": accelerator.machine_type,
-    })
-
-    machine_type = accelerator.machine_type
-    image = get_image_from_family(project=image_project, family=image_family)
-    disk_type = f"zones/{gcp.zone}/diskTypes/pd-ssd"
-    disks = [
-        disk_from_image(
-            disk_type, True, image.self_link, accelerator.disk_size_gb
-        )
-    ]
-    if accelerator.attach_local_ssd:
-      for _ in range(accelerator.count):
-        disks.append(local_ssd_disk(gcp.zone))
-    metadata = create_metadata({
-        "install-nvidia-driver": str(install_nvidia_drivers),
-        "proxy-mode": "project_editors",
-        "ssh-keys": f"cloud-ml-auto-solutions:{ssh_keys.public}",
-    })
-
-    accelerators = [
-        compute_v1.AcceleratorConfig(
-            accelerator_count=accelerator.count,
-            accelerator_type=(
-                f"projects/{gcp.project_name}/zones/{gcp.zone}/"
-                f"acceleratorTypes/{accelerator.accelerator_type}"
-            ),
-        )
-    ]
-    service_account = compute_v1.ServiceAccount(
-        scopes=["https://www.googleapis.com/auth/cloud-platform"]
+    return request_resource(
+        instance_name,
+        image_project,
+        image_family,
+        accelerator,
+        gcp,
+        ssh_keys,
+        instance_termination_action,
+        external_access=external_access,
+        spot=spot,
+        delete_protection=delete_protection,
+        install_nvidia_drivers=install_nvidia_drivers,
+        reservation=reservation,
     )
 
-    instance_client = compute_v1.InstancesClient()
-    # Use the network interface provided in the network_link argument.
-    network_interface = compute_v1.NetworkInterface()
-    if accelerator.subnetwork:
-      network_interface.network = accelerator.network
-    if accelerator.subnetwork:
-      network_interface.subnetwork = accelerator.subnetwork
-
-    if external_access:
-      access = compute_v1.AccessConfig()
-      access.type_ = compute_v1.AccessConfig.Type.ONE_TO_ONE_NAT.name
-      access.name = "External NAT"
-      access.network_tier = access.NetworkTier.PREMIUM.name
-      network_interface.access_configs = [access]
-
-    # Collect information into the Instance object.
-    instance = compute_v1.Instance()
-    instance.network_interfaces = [network_interface]
-    instance.name = instance_name
-    instance.disks = disks
-    if re.match(r"^zones/[a-z\d\-]+/machineTypes/[a-z\d\-]+$", machine_type):
-      instance.machine_type = machine_type
-    else:
-      instance.machine_type = f"zones/{zone}/machineTypes/{machine_type}"
-
-    instance.scheduling = compute_v1.Scheduling()
-    if accelerators:
-      instance.guest_accelerators = accelerators
-      instance.scheduling.on_host_maintenance = (
-          compute_v1.Scheduling.OnHostMaintenance.TERMINATE.name
-      )
-
-    if metadata:
-      instance.metadata = metadata
-
-    if service_account:
-      instance.service_accounts = [service_account]
-
-    if spot:
-      # Set the Spot VM setting
-      instance.scheduling.provisioning_model = (
-          compute_v1.Scheduling.ProvisioningModel.SPOT.name
-      )
-      instance.scheduling.instance_termination_action = (
-          instance_termination_action
-      )
-
-    if delete_protection:
-      # Set the delete protection bit
-      instance.deletion_protection = True
-
-    if reservation:
-      # Set reservation affinity if specified
-      reservation_affinity = compute_v1.ReservationAffinity()
-      reservation_affinity.consume_reservation_type = (
-          compute_v1.ReservationAffinity.ConsumeReservationType.ANY_RESERVATION.name
-      )
-      instance.reservation_affinity = reservation_affinity
-
-    # Prepare the request to insert an instance.
-    request = compute_v1.InsertInstanceRequest()
-    request.zone = zone
-    request.project = project_id
-    request.instance_resource = instance
-
-    # Wait for the create operation to complete.
-    logging.info(f"Creating the {instance_name} instance in {zone}...")
-
-    operation = instance_client.insert(request=request)
-    return operation.name
-
   @task.sensor(
       poke_interval=60, timeout=timeout.total_seconds(), mode="reschedule"
   )
   def wait_for_resource_creation(operation_name: airflow.XComArg):
-    # Retrives the delete opeartion to check the status.
-    client = compute_v1.ZoneOperationsClient()
-    request = compute_v1.GetZoneOperationRequest(
-        operation=operation_name,
-        project=project_id,
-        zone=zone,
-    )
-    operation = client.get(request=request)
-    status = operation.status.name
-    if status in ("RUNNING", "PENDING"):
-      logging.info(
-          f"Resource create status: {status}, {operation.status_message}"
-      )
-      return False
-    else:
-      if operation.error:
-        logging.error(
-            (
-                "Error during resource creation: [Code:"
-                f" {operation.http_error_status_code}]:"
-                f" {operation.http_error_message}"
-                f" {operation.error}"
-            ),
-        )
-        raise operation.exception() or RuntimeError(
-            operation.http_error_message
-        )
-      elif operation.warnings:
-        logging.warning("Warnings during resource creation:\n")
-        for warning in operation.warnings:
-          logging.warning(f" - {warning.code}: {warning.message}")
-      return True
+    return resource_operation_done(operation_name, project_id, zone)
 
   @task
   def get_ip_address(instance: str) -> airflow.XComArg:
@@ -521,10 +667,10 @@ def ssh_host(
 
   ssh_group = fabric.ThreadingGroup(
       ip_address,
-      user="cloud-ml-auto-solutions",
+      user=SSH_USER,
       connect_kwargs={
           "auth_strategy": paramiko.auth_strategy.InMemoryPrivateKey(
-              "cloud-ml-auto-solutions", pkey
+              SSH_USER, pkey
           )
       },
   )
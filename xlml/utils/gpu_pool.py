@@ -0,0 +1,428 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to lease GPU VMs from a warm pool.
+
+Pool membership and leases are tracked by instance labels, like
+`tpu_pool`:
+
+- `warm-pool`: the pool key, derived from the machine type, accelerator count
+  and image.
+- `lease`: the lease holder, or `free` when the instance is idle.
+- `lease-expiry`: unix seconds after which a lease may be taken over.
+- `idle-since`: unix seconds at which the instance was returned to the pool.
+- `ttl`: seconds after creation after which the instance is recycled, like
+  the `ttl` label of TPU nodes.
+
+Leases are claimed with the instance label fingerprint, so concurrent claims
+of the same instance fail instead of overwriting each other.
+
+`clean_up_idle_resources` deletes pool instances that exceed their TTL, stay
+idle for too long, are stopped, or whose lease expired without being released.
+"""
+
+import datetime
+import hashlib
+import io
+import time
+from typing import Dict, List, Optional
+
+from absl import logging
+import airflow
+from airflow.decorators import task
+import fabric
+from google.cloud import compute_v1
+import google.api_core.exceptions
+import invoke
+import paramiko
+
+from xlml.apis import gcp_config, test_config
+from xlml.utils import gpu, ssh, tpu, tpu_pool
+
+
+IDLE_SINCE = "idle-since"
+# Lease holder of instances that are being deleted by the clean up.
+RECLAIMED = "reclaimed"
+
+# Instances older than this are deleted instead of returned to the pool.
+DEFAULT_POOL_TTL = datetime.timedelta(days=7)
+# Idle instances are deleted by `clean_up_idle_resources` after this long.
+DEFAULT_IDLE_TTL = datetime.timedelta(hours=6)
+
+# Brings a previously used VM back to a clean state, then checks the GPUs.
+RESET_SCRIPT = (
+    "set -x; "
+    "if command -v docker >/dev/null; then "
+    "sudo docker ps -aq | xargs -r sudo docker rm -f; fi; "
+    f"sudo pkill -9 -u {gpu.SSH_USER} -f python || true; "
+    r"find ~ -mindepth 1 -maxdepth 1 ! -name .ssh -exec rm -rf {} +; "
+    "nvidia-smi"
+)
+_HEALTH_CHECK_ATTEMPTS = 3
+
+
+def pool_key(
+    accelerator: test_config.Gpu, image_project: str, image_family: str
+) -> str:
+  """Returns the pool of VMs with the given machine type and image."""
+  image_hash = hashlib.sha256(
+      f"{image_project}/{image_family}".encode()
+  ).hexdigest()[:10]
+  return tpu_pool.label_value(
+      f"{accelerator.machine_type}-{accelerator.count}-{image_hash}"
+  )
+
+
+def _remaining_ttl(instance: compute_v1.Instance, now: float) -> float:
+  """Returns the seconds until the instance exceeds its `ttl` label.
+
+  Instances created before the label was set get the default pool TTL.
+  """
+  created = datetime.datetime.fromisoformat(instance.creation_timestamp)
+  ttl = int(instance.labels.get(tpu.TTL) or DEFAULT_POOL_TTL.total_seconds())
+  return created.timestamp() + ttl - now
+
+
+def _lease_active(instance: compute_v1.Instance, now: float) -> bool:
+  return (
+      instance.labels.get(tpu_pool.LEASE) != tpu_pool.FREE
+      and int(instance.labels.get(tpu_pool.LEASE_EXPIRY) or 0) >= now
+  )
+
+
+def _leasable_instances(
+    instances: List[compute_v1.Instance],
+    key: str,
+    lease_seconds: float,
+    now: float,
+) -> List[compute_v1.Instance]:
+  """Returns idle, running pool instances that can host a lease."""
+  return [
+      instance
+      for instance in instances
+      if instance.labels.get(tpu_pool.POOL) == key
+      and instance.status == compute_v1.Instance.Status.RUNNING.name
+      and not _lease_active(instance, now)
+      # Avoid instances that would be cleaned up in the middle of a test.
+      and _remaining_ttl(instance, now) > lease_seconds
+  ]
+
+
+def _set_labels(
+    client: compute_v1.InstancesClient,
+    instance: compute_v1.Instance,
+    project: str,
+    zone: str,
+    labels: Dict[str, str],
+) -> None:
+  """Updates labels, failing if they changed since `instance` was read."""
+  request = compute_v1.InstancesSetLabelsRequest(
+      labels={**instance.labels, **labels},
+      label_fingerprint=instance.label_fingerprint,
+  )
+  operation = client.set_labels(
+      project=project,
+      zone=zone,
+      instance=instance.name,
+      instances_set_labels_request_resource=request,
+  )
+  operation.result()
+
+
+def _healthy(ip_address: str, ssh_keys: ssh.SshKeys) -> bool:
+  """Resets the VM over SSH and checks that its GPUs are usable."""
+  pkey = paramiko.RSAKey.from_private_key(io.StringIO(ssh_keys.private))
+  for attempt in range(_HEALTH_CHECK_ATTEMPTS):
+    # New SSH keys take a few seconds to propagate to the VM.
+    time.sleep(20)
+    try:
+      with fabric.Connection(
+          ip_address,
+          user=gpu.SSH_USER,
+          connect_timeout=30,
+          connect_kwargs={
+              "auth_strategy": paramiko.auth_strategy.InMemoryPrivateKey(
+                  gpu.SSH_USER, pkey
+              )
+          },
+      ) as connection:
+        connection.run(RESET_SCRIPT, timeout=300)
+      return True
+    except (invoke.exceptions.Failure, paramiko.SSHException, OSError) as e:
+      logging.warning(f"Health check attempt {attempt} failed: {e}")
+  return False
+
+
+def _delete(
+    client: compute_v1.InstancesClient,
+    instance_name: str,
+    project: str,
+    zone: str,
+) -> None:
+  operation = client.delete(project=project, zone=zone, instance=instance_name)
+  logging.info(f"Deleting {instance_name}: {operation.name}")
+
+
+@task(multiple_outputs=True)
+def lease_resource(
+    gpu_name: str,
+    image_project: str,
+    image_family: str,
+    accelerator: test_config.Gpu,
+    gcp: gcp_config.GCPConfig,
+    ssh_keys: ssh.SshKeys,
+    lease_duration: datetime.timedelta,
+    install_nvidia_drivers: bool = False,
+    reservation: bool = False,
+    pool_ttl: datetime.timedelta = DEFAULT_POOL_TTL,
+) -> Dict[str, str]:
+  """Lease a healthy GPU VM from the warm pool, or create one.
+
+  Warm VMs get `ssh_keys` authorized, are reset over SSH and checked with
+  `nvidia-smi`. Unhealthy VMs are deleted.
+
+  Args:
+    gpu_name: Unique GPU name, used if a new VM is created.
+    image_project: project of the image.
+    image_family: family of the image.
+    accelerator: Description of GPU to create.
+    gcp: GCP project/zone configuration.
+    ssh_keys: SSH keys to communicate with the VM.
+    lease_duration: Time after which the lease may be taken over, covering
+      VM creation, the test and post processing.
+    install_nvidia_drivers: Whether to install Nvidia drivers.
+    reservation: Whether to use an existing reservation.
+    pool_ttl: Age after which a new VM is recycled.
+
+  Returns:
+    The instance name, the lease ID and the creation operation name, which is
+    empty if a warm VM was leased.
+  """
+  client = compute_v1.InstancesClient()
+  key = pool_key(accelerator, image_project, image_family)
+  # The generated GPU name is unique and a valid label value.
+  lease_id = gpu_name
+  now = time.time()
+  lease_expiry = int(now + lease_duration.total_seconds())
+
+  instances = client.list(project=gcp.project_name, zone=gcp.zone)
+  for instance in _leasable_instances(
+      list(instances), key, lease_duration.total_seconds(), now
+  ):
+    try:
+      _set_labels(
+          client,
+          instance,
+          gcp.project_name,
+          gcp.zone,
+          {
+              tpu_pool.LEASE: lease_id,
+              tpu_pool.LEASE_EXPIRY: str(lease_expiry),
+              IDLE_SINCE: "",
+          },
+      )
+    except google.api_core.exceptions.GoogleAPICallError as e:
+      logging.info(f"Failed to lease {instance.name}: {e}")
+      continue
+
+    ip_address = gpu.add_ssh_keys(instance.name, ssh_keys, gcp)
+    if _healthy(ip_address, ssh_keys):
+      logging.info(f"Leased {instance.name} from warm pool {key}.")
+      return {
+          "instance_name": instance.name,
+          "lease_id": lease_id,
+          "operation": "",
+      }
+
+    logging.warning(f"{instance.name} is unhealthy.")
+    _delete(client, instance.name, gcp.project_name, gcp.zone)
+
+  logging.info(f"No GPU VM available in warm pool {key}. Creating {gpu_name}.")
+  operation = gpu.request_resource(
+      gpu_name,
+      image_project,
+      image_family,
+      accelerator,
+      gcp,
+      ssh_keys,
+      instance_termination_action="STOP",
+      install_nvidia_drivers=install_nvidia_drivers,
+      reservation=reservation,
+      labels={
+          tpu_pool.POOL: key,
+          tpu_pool.LEASE: lease_id,
+          tpu_pool.LEASE_EXPIRY: str(lease_expiry),
+          tpu.TTL: str(int(pool_ttl.total_seconds())),
+      },
+  )
+  return {
+      "instance_name": gpu_name,
+      "lease_id": lease_id,
+      "operation": operation,
+  }
+
+
+@task.sensor(poke_interval=60, timeout=3600, mode="reschedule")
+def wait_for_resource_creation(
+    operation_name: str, gcp: gcp_config.GCPConfig
+) -> bool:
+  if not operation_name:
+    logging.info("Leased a warm VM. Nothing to wait for.")
+    return True
+  return gpu.resource_operation_done(operation_name, gcp.project_name, gcp.zone)
+
+
+@task
+def get_ip_address(
+    instance_name: str, operation_name: str, gcp: gcp_config.GCPConfig
+) -> airflow.XComArg:
+  if operation_name:
+    # It takes time to be able to use the ssh with the ip address of a new VM.
+    time.sleep(60)
+  instance = compute_v1.InstancesClient().get(
+      project=gcp.project_name, zone=gcp.zone, instance=instance_name
+  )
+  return instance.network_interfaces[0].network_i_p
+
+
+@task(trigger_rule="all_done")
+def release_resource(
+    instance_name: str,
+    lease_id: str,
+    ssh_keys: ssh.SshKeys,
+    gcp: gcp_config.GCPConfig,
+    pool_size: int,
+) -> None:
+  """Return a leased VM to the warm pool, or delete it if the pool is full.
+
+  Args:
+    instance_name: Name of the leased instance.
+    lease_id: The ID returned by `lease_resource`.
+    ssh_keys: SSH keys authorized for this lease.
+    gcp: GCP project/zone configuration.
+    pool_size: Number of idle VMs to keep in the pool.
+  """
+  client = compute_v1.InstancesClient()
+  try:
+    instance = client.get(
+        project=gcp.project_name, zone=gcp.zone, instance=instance_name
+    )
+  except google.api_core.exceptions.NotFound:
+    logging.info(f"{instance_name} not found")
+    return
+
+  if instance.labels.get(tpu_pool.LEASE) != lease_id:
+    logging.warning(f"{instance_name} is no longer leased by {lease_id}.")
+    return
+
+  key = instance.labels.get(tpu_pool.POOL)
+  idle_instances = [
+      i
+      for i in client.list(project=gcp.project_name, zone=gcp.zone)
+      if i.labels.get(tpu_pool.POOL) == key
+      and i.labels.get(tpu_pool.LEASE) == tpu_pool.FREE
+  ]
+  now = time.time()
+  if (
+      instance.status == compute_v1.Instance.Status.RUNNING.name
+      and len(idle_instances) < pool_size
+      and _remaining_ttl(instance, now) > 0
+  ):
+    gpu.remove_ssh_keys(instance_name, ssh_keys, gcp)
+    _set_labels(
+        client,
+        instance,
+        gcp.project_name,
+        gcp.zone,
+        {
+            tpu_pool.LEASE: tpu_pool.FREE,
+            tpu_pool.LEASE_EXPIRY: "",
+            IDLE_SINCE: str(int(now)),
+        },
+    )
+    logging.info(f"Returned {instance_name} to warm pool.")
+  else:
+    _delete(client, instance_name, gcp.project_name, gcp.zone)
+
+
+def _reclaim_reason(
+    instance: compute_v1.Instance, idle_ttl: datetime.timedelta, now: float
+) -> Optional[str]:
+  """Returns why a pool instance should be deleted, if it should."""
+  if _lease_active(instance, now):
+    return None
+  if _remaining_ttl(instance, now) <= 0:
+    return "it exceeded its time to live (TTL)"
+  if instance.labels.get(tpu_pool.LEASE) != tpu_pool.FREE:
+    return "its lease expired without being released"
+  if instance.status != compute_v1.Instance.Status.RUNNING.name:
+    return f"it is {instance.status}"
+  idle_since = instance.labels.get(IDLE_SINCE)
+  if idle_since and now - int(idle_since) > idle_ttl.total_seconds():
+    return f"it was idle for more than {idle_ttl}"
+  return None
+
+
+@task
+def clean_up_idle_resources(
+    project_name: str,
+    idle_ttl: datetime.timedelta = DEFAULT_IDLE_TTL,
+) -> List[str]:
+  """Delete warm pool VMs that are expired, idle, stopped or leaked.
+
+  Each VM is claimed with its label fingerprint before it is deleted, so VMs
+  leased concurrently are kept.
+
+  Args:
+    project_name: The project of the warm pools, in all zones.
+    idle_ttl: Time after which idle VMs are deleted.
+
+  Returns:
+    Names of the deleted VMs.
+  """
+  client = compute_v1.InstancesClient()
+  now = time.time()
+  instances = client.aggregated_list(
+      request=compute_v1.AggregatedListInstancesRequest(
+          project=project_name, filter=f"labels.{tpu_pool.POOL}:*"
+      )
+  )
+
+  deleted = []
+  for scope, scoped_list in instances:
+    zone = scope.removeprefix("zones/")
+    for instance in scoped_list.instances:
+      reason = _reclaim_reason(instance, idle_ttl, now)
+      if not reason:
+        continue
+      try:
+        _set_labels(
+            client,
+            instance,
+            project_name,
+            zone,
+            {
+                tpu_pool.LEASE: RECLAIMED,
+                # Lets the clean up retry if the deletion fails.
+                tpu_pool.LEASE_EXPIRY: str(int(now + 3600)),
+            },
+        )
+      except google.api_core.exceptions.GoogleAPICallError as e:
+        logging.info(f"Failed to reclaim {instance.name}: {e}")
+        continue
+
+      logging.info(f"Deleting {instance.name} because {reason}.")
+      _delete(client, instance.name, project_name, zone)
+      deleted.append(instance.name)
+  return deleted
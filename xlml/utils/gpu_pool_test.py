@@ -0,0 +1,209 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for gpu_pool.py."""
+
+import datetime
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from google.api_core import exceptions
+from google.cloud import compute_v1
+from xlml.utils import gpu_pool, tpu, tpu_pool
+
+
+_NOW = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _instance(
+    pool: str = "a2-highgpu-1g-1-abc",
+    lease: str = tpu_pool.FREE,
+    lease_expiry: str = "",
+    idle: datetime.timedelta = datetime.timedelta(hours=1),
+    age: datetime.timedelta = datetime.timedelta(days=1),
+    status: str = compute_v1.Instance.Status.RUNNING.name,
+    name: str = "gpu",
+) -> compute_v1.Instance:
+  return compute_v1.Instance(
+      name=name,
+      status=status,
+      creation_timestamp=(_NOW - age).isoformat(),
+      labels={
+          tpu.TTL: str(int(gpu_pool.DEFAULT_POOL_TTL.total_seconds())),
+          tpu_pool.POOL: pool,
+          tpu_pool.LEASE: lease,
+          tpu_pool.LEASE_EXPIRY: lease_expiry,
+          gpu_pool.IDLE_SINCE: (
+              str(int((_NOW - idle).timestamp()))
+              if lease == tpu_pool.FREE
+              else ""
+          ),
+      },
+  )
+
+
+class LeasableInstancesTest(parameterized.TestCase, absltest.TestCase):
+
+  @parameterized.named_parameters(
+      ("free", _instance(), True),
+      ("other_pool", _instance(pool="a2-highgpu-2g-2-abc"), False),
+      ("leased", _instance(lease="gpu-1", lease_expiry="1999999999"), False),
+      ("expired_lease", _instance(lease="gpu-1", lease_expiry="1"), True),
+      (
+          "stopped",
+          _instance(status=compute_v1.Instance.Status.TERMINATED.name),
+          False,
+      ),
+      ("too_old", _instance(age=datetime.timedelta(days=8)), False),
+      (
+          "expires_during_lease",
+          _instance(age=datetime.timedelta(days=7, hours=-1)),
+          False,
+      ),
+  )
+  def test_leasable_instances(
+      self, instance: compute_v1.Instance, leasable: bool
+  ):
+    instances = gpu_pool._leasable_instances(
+        [instance],
+        key="a2-highgpu-1g-1-abc",
+        lease_seconds=datetime.timedelta(hours=3).total_seconds(),
+        now=_NOW.timestamp(),
+    )
+
+    self.assertEqual(len(instances) == 1, leasable)
+
+
+class CleanUpIdleResourcesTest(parameterized.TestCase, absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.client = self.enter_context(
+        mock.patch.object(gpu_pool.compute_v1, "InstancesClient")
+    ).return_value
+    self.enter_context(
+        mock.patch.object(gpu_pool.time, "time", return_value=_NOW.timestamp())
+    )
+
+  def _clean_up(self, *instances: compute_v1.Instance):
+    self.client.aggregated_list.return_value = [(
+        "zones/us-central1-a",
+        compute_v1.InstancesScopedList(instances=list(instances)),
+    )]
+    return gpu_pool.clean_up_idle_resources.function("project")
+
+  @parameterized.named_parameters(
+      ("expired", _instance(age=datetime.timedelta(days=8))),
+      ("idle", _instance(idle=datetime.timedelta(hours=7))),
+      ("leaked", _instance(lease="gpu-1", lease_expiry="1")),
+      (
+          "stopped",
+          _instance(status=compute_v1.Instance.Status.TERMINATED.name),
+      ),
+  )
+  def test_deletes(self, instance: compute_v1.Instance):
+    self.assertEqual(self._clean_up(instance), ["gpu"])
+
+    self.client.delete.assert_called_once_with(
+        project="project", zone="us-central1-a", instance="gpu"
+    )
+    request = self.client.set_labels.call_args.kwargs[
+        "instances_set_labels_request_resource"
+    ]
+    self.assertEqual(request.labels[tpu_pool.LEASE], gpu_pool.RECLAIMED)
+
+  @parameterized.named_parameters(
+      ("recently_used", _instance()),
+      (
+          "leased",
+          _instance(
+              lease="gpu-1",
+              lease_expiry="1999999999",
+              age=datetime.timedelta(days=8),
+          ),
+      ),
+  )
+  def test_keeps(self, instance: compute_v1.Instance):
+    self.assertEqual(self._clean_up(instance), [])
+
+    self.client.set_labels.assert_not_called()
+    self.client.delete.assert_not_called()
+
+  def test_keeps_instance_leased_concurrently(self):
+    self.client.set_labels.side_effect = [
+        exceptions.PreconditionFailed("fingerprint changed"),
+        mock.Mock(),
+    ]
+
+    deleted = self._clean_up(
+        _instance(name="gpu-0", idle=datetime.timedelta(hours=7)),
+        _instance(name="gpu-1", idle=datetime.timedelta(hours=7)),
+    )
+
+    self.assertEqual(deleted, ["gpu-1"])
+    self.client.delete.assert_called_once_with(
+        project="project", zone="us-central1-a", instance="gpu-1"
+    )
+
+
+class ReleaseResourceTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.client = self.enter_context(
+        mock.patch.object(gpu_pool.compute_v1, "InstancesClient")
+    ).return_value
+    self.client.list.return_value = []
+    self.enter_context(mock.patch.object(gpu_pool.gpu, "remove_ssh_keys"))
+    self.enter_context(
+        mock.patch.object(gpu_pool.time, "time", return_value=_NOW.timestamp())
+    )
+    self.gcp = mock.Mock(project_name="project", zone="zone")
+
+  def _release(self, instance: compute_v1.Instance) -> None:
+    self.client.get.return_value = instance
+    gpu_pool.release_resource.function(
+        "gpu", "gpu-1", mock.Mock(), self.gcp, pool_size=1
+    )
+
+  def test_marks_returned_instance_idle(self):
+    self._release(_instance(lease="gpu-1", lease_expiry="1999999999"))
+
+    request = self.client.set_labels.call_args.kwargs[
+        "instances_set_labels_request_resource"
+    ]
+    self.assertEqual(request.labels[tpu_pool.LEASE], tpu_pool.FREE)
+    self.assertEqual(
+        request.labels[gpu_pool.IDLE_SINCE], str(int(_NOW.timestamp()))
+    )
+    self.client.delete.assert_not_called()
+
+  def test_deletes_expired_instance(self):
+    self._release(
+        _instance(
+            lease="gpu-1",
+            lease_expiry="1999999999",
+            age=datetime.timedelta(days=8),
+        )
+    )
+
+    self.client.set_labels.assert_not_called()
+    self.client.delete.assert_called_once_with(
+        project="project", zone="zone", instance="gpu"
+    )
+
+
+if __name__ == "__main__":
+  absltest.main()
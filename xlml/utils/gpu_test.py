@@ -0,0 +1,113 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for gpu.py."""
+
+import time
+from unittest import mock
+
+from absl.testing import absltest
+from google.cloud import compute_v1
+from xlml.utils import gpu
+
+
+class GetImageLinkFromFamilyTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    gpu._image_cache.clear()
+    self.variables = {}
+
+    def get_variable(key, default_var=None, deserialize_json=False):
+      return self.variables.get(key, default_var)
+
+    def set_variable(key, value, serialize_json=False):
+      self.variables[key] = value
+
+    self.enter_context(
+        mock.patch.object(gpu.Variable, "get", side_effect=get_variable)
+    )
+    self.enter_context(
+        mock.patch.object(gpu.Variable, "set", side_effect=set_variable)
+    )
+    self.get_image = self.enter_context(
+        mock.patch.object(
+            gpu,
+            "get_image_from_family",
+            return_value=compute_v1.Image(self_link="images/new"),
+        )
+    )
+
+  def test_resolves_once_in_process(self):
+    gpu.get_image_link_from_family("p", "f")
+    link = gpu.get_image_link_from_family("p", "f")
+
+    self.assertEqual(link, "images/new")
+    self.get_image.assert_called_once()
+
+  def test_uses_variable_cache(self):
+    self.variables[gpu.IMAGE_CACHE_VARIABLE] = {
+        "p/f": {"self_link": "images/cached", "expiry": time.time() + 60}
+    }
+
+    link = gpu.get_image_link_from_family("p", "f")
+
+    self.assertEqual(link, "images/cached")
+    self.get_image.assert_not_called()
+
+  def test_refreshes_expired_entry(self):
+    self.variables[gpu.IMAGE_CACHE_VARIABLE] = {
+        "p/f": {"self_link": "images/old", "expiry": time.time() - 60}
+    }
+
+    link = gpu.get_image_link_from_family("p", "f")
+
+    self.assertEqual(link, "images/new")
+    self.assertEqual(
+        self.variables[gpu.IMAGE_CACHE_VARIABLE]["p/f"]["self_link"],
+        "images/new",
+    )
+
+
+class GetBootImageTest(absltest.TestCase):
+
+  def test_returns_source_image_of_boot_disk(self):
+    instances = self.enter_context(
+        mock.patch.object(gpu.compute_v1, "InstancesClient")
+    ).return_value
+    disks = self.enter_context(
+        mock.patch.object(gpu.compute_v1, "DisksClient")
+    ).return_value
+    instances.get.return_value = compute_v1.Instance(
+        disks=[
+            compute_v1.AttachedDisk(
+                boot=False, source="projects/p/zones/z/disks/scratch"
+            ),
+            compute_v1.AttachedDisk(
+                boot=True, source="projects/p/zones/z/disks/vm-boot"
+            ),
+        ]
+    )
+    disks.get.return_value = compute_v1.Disk(
+        source_image="projects/p/global/images/image-2"
+    )
+
+    self.assertEqual(
+        gpu.get_boot_image("p", "z", "vm"), "projects/p/global/images/image-2"
+    )
+    disks.get.assert_called_once_with(project="p", zone="z", disk="vm-boot")
+
+
+if __name__ == "__main__":
+  absltest.main()
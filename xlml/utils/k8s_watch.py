@@ -0,0 +1,359 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Deferrable operators that wait on GKE pods from the triggerer.
+
+The triggers watch pods and pod logs with `kubernetes_asyncio`, so a waiting
+task holds no worker slot until its pods reach a terminal condition.
+"""
+
+import abc
+import asyncio
+import contextlib
+import datetime
+from http import HTTPStatus
+import re
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from absl import logging
+from airflow.exceptions import AirflowFailException
+from airflow.models import BaseOperator
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+import kubernetes_asyncio
+
+from xlml.utils import gke
+
+
+# Conditions of `PodsTrigger`.
+STARTED = "started"
+READY = "ready"
+COMPLETED = "completed"
+
+SUCCESS = "success"
+FAILED = "failed"
+
+# Watches are restarted after this long, in case events were missed.
+_WATCH_TIMEOUT_SECONDS = 600
+
+
+@contextlib.asynccontextmanager
+async def async_core_api(
+    project_id: str, region: str, cluster_name: str
+) -> AsyncIterator[kubernetes_asyncio.client.CoreV1Api]:
+  """Provides an async client sharing the cached client's credentials."""
+  sync_client = await asyncio.to_thread(
+      gke.get_authenticated_client, project_id, region, cluster_name
+  )
+  sync_configuration = sync_client.configuration
+
+  configuration = kubernetes_asyncio.client.Configuration()
+  configuration.host = sync_configuration.host
+  configuration.ssl_ca_cert = sync_configuration.ssl_ca_cert
+
+  async def refresh_token(
+      config: kubernetes_asyncio.client.Configuration,
+  ) -> None:
+    config.api_key["authorization"] = await asyncio.to_thread(
+        sync_configuration.get_api_key_with_prefix, "authorization"
+    )
+
+  configuration.refresh_api_key_hook = refresh_token
+  async with kubernetes_asyncio.client.ApiClient(configuration) as api_client:
+    yield kubernetes_asyncio.client.CoreV1Api(api_client)
+
+
+def evaluate(
+    condition: str, phases: Dict[str, str], expected_pods: int = 0
+) -> Optional[Dict[str, str]]:
+  """Checks whether pods reached a condition.
+
+  Args:
+    condition: `STARTED`, `READY` or `COMPLETED`.
+    phases: Phase of each pod, by pod name.
+    expected_pods: Number of pods that must exist to be `READY` or
+      `COMPLETED`.
+
+  Returns:
+    A trigger event payload if the condition is reached or can no longer be
+    reached, otherwise None.
+  """
+  failed = sorted(name for name, phase in phases.items() if phase == "Failed")
+  if condition != STARTED and failed:
+    return {"status": FAILED, "message": f"Pods failed: {failed}"}
+
+  if condition == STARTED:
+    done = bool(phases)
+  elif condition == READY:
+    done = len(phases) >= expected_pods
+  elif condition == COMPLETED:
+    done = len(phases) >= max(expected_pods, 1) and all(
+        phase == "Succeeded" for phase in phases.values()
+    )
+  else:
+    raise ValueError(f"Unknown condition: {condition}")
+
+  if done:
+    return {"status": SUCCESS, "message": f"Pods are {condition}: {phases}"}
+  return None
+
+
+class PodsTrigger(BaseTrigger):
+  """Fires when the pods matching a label selector reach a condition."""
+
+  def __init__(
+      self,
+      project_id: str,
+      region: str,
+      cluster_name: str,
+      label_selector: str,
+      condition: str,
+      expected_pods: int = 0,
+      namespace: str = "default",
+  ):
+    super().__init__()
+    self.project_id = project_id
+    self.region = region
+    self.cluster_name = cluster_name
+    self.label_selector = label_selector
+    self.condition = condition
+    self.expected_pods = expected_pods
+    self.namespace = namespace
+
+  def serialize(self) -> Tuple[str, Dict[str, Any]]:
+    return (
+        f"{self.__class__.__module__}.{self.__class__.__name__}",
+        {
+            "project_id": self.project_id,
+            "region": self.region,
+            "cluster_name": self.cluster_name,
+            "label_selector": self.label_selector,
+            "condition": self.condition,
+            "expected_pods": self.expected_pods,
+            "namespace": self.namespace,
+        },
+    )
+
+  async def run(self) -> AsyncIterator[TriggerEvent]:
+    async with async_core_api(
+        self.project_id, self.region, self.cluster_name
+    ) as core_api:
+      while True:
+        # The condition is checked against all pods before watching, so it is
+        # never reached from the pods seen so far.
+        pods = await core_api.list_namespaced_pod(
+            self.namespace, label_selector=self.label_selector
+        )
+        phases = {
+            pod.metadata.name: pod.status.phase
+            for pod in pods.items
+            if pod.status.phase
+        }
+        result = evaluate(self.condition, phases, self.expected_pods)
+        if result:
+          yield TriggerEvent(result)
+          return
+
+        try:
+          async with kubernetes_asyncio.watch.Watch() as watch:
+            async for event in watch.stream(
+                core_api.list_namespaced_pod,
+                self.namespace,
+                label_selector=self.label_selector,
+                resource_version=pods.metadata.resource_version,
+                timeout_seconds=_WATCH_TIMEOUT_SECONDS,
+            ):
+              pod = event["object"]
+              if event["type"] == "DELETED" or not pod.status.phase:
+                phases.pop(pod.metadata.name, None)
+              else:
+                phases[pod.metadata.name] = pod.status.phase
+
+              result = evaluate(self.condition, phases, self.expected_pods)
+              if result:
+                yield TriggerEvent(result)
+                return
+        except kubernetes_asyncio.client.ApiException as e:
+          # The listed version expired, so the pods are listed again.
+          if e.status != HTTPStatus.GONE:
+            raise
+        self.log.info(f"Pods of {self.label_selector}: {phases}")
+
+
+class PodLogStepTrigger(BaseTrigger):
+  """Fires when the last running pod logs a step of at least `step`."""
+
+  def __init__(
+      self,
+      project_id: str,
+      region: str,
+      cluster_name: str,
+      label_selector: str,
+      step: int,
+      step_pattern: str,
+      namespace: str = "default",
+      poll_interval: float = 30,
+  ):
+    super().__init__()
+    self.project_id = project_id
+    self.region = region
+    self.cluster_name = cluster_name
+    self.label_selector = label_selector
+    self.step = step
+    self.step_pattern = step_pattern
+    self.namespace = namespace
+    self.poll_interval = poll_interval
+
+  def serialize(self) -> Tuple[str, Dict[str, Any]]:
+    return (
+        f"{self.__class__.__module__}.{self.__class__.__name__}",
+        {
+            "project_id": self.project_id,
+            "region": self.region,
+            "cluster_name": self.cluster_name,
+            "label_selector": self.label_selector,
+            "step": self.step,
+            "step_pattern": self.step_pattern,
+            "namespace": self.namespace,
+            "poll_interval": self.poll_interval,
+        },
+    )
+
+  async def run(self) -> AsyncIterator[TriggerEvent]:
+    pattern = re.compile(self.step_pattern)
+    async with async_core_api(
+        self.project_id, self.region, self.cluster_name
+    ) as core_api:
+      while True:
+        pods = await core_api.list_namespaced_pod(
+            self.namespace, label_selector=self.label_selector
+        )
+        phases = {pod.metadata.name: pod.status.phase for pod in pods.items}
+        result = evaluate(COMPLETED, phases)
+        if result and result["status"] == FAILED:
+          yield TriggerEvent(result)
+          return
+
+        if phases and all(phase == "Running" for phase in phases.values()):
+          pod = pods.items[-1]
+          self.log.info(f"Following logs of {pod.metadata.name}")
+          response = await core_api.read_namespaced_pod_log(
+              pod.metadata.name,
+              self.namespace,
+              follow=True,
+              _preload_content=False,
+          )
+          try:
+            async for line in response.content:
+              match = pattern.search(line.decode(errors="replace"))
+              if match and int(match.group(1)) >= self.step:
+                yield TriggerEvent({
+                    "status": SUCCESS,
+                    "message": f"{pod.metadata.name} reached step {self.step}",
+                })
+                return
+          finally:
+            response.release()
+          # The log stream ends when the pod terminates.
+
+        await asyncio.sleep(self.poll_interval)
+
+
+class _DeferredOperator(BaseOperator, abc.ABC):
+  """Defers to a trigger, and fails if it reports a failure."""
+
+  template_fields = ("project_id", "region", "cluster_name", "label_value")
+
+  def __init__(
+      self,
+      *,
+      project_id: str,
+      region: str,
+      cluster_name: str,
+      label_key: str,
+      label_value: str,
+      timeout: datetime.timedelta,
+      **kwargs,
+  ):
+    super().__init__(**kwargs)
+    self.project_id = project_id
+    self.region = region
+    self.cluster_name = cluster_name
+    self.label_key = label_key
+    self.label_value = label_value
+    self.timeout = timeout
+
+  @abc.abstractmethod
+  def trigger(self) -> BaseTrigger:
+    """Returns the trigger to defer to."""
+
+  def execute(self, context) -> None:
+    self.defer(
+        trigger=self.trigger(),
+        method_name="execute_complete",
+        timeout=self.timeout,
+    )
+
+  def execute_complete(self, context, event: Dict[str, str]) -> None:
+    del context
+    if event["status"] != SUCCESS:
+      raise AirflowFailException(event["message"])
+    logging.info(event["message"])
+
+
+class WaitForPodsOperator(_DeferredOperator):
+  """Waits in the triggerer for pods with a label to reach a condition.
+
+  Attributes:
+    condition: `STARTED`, `READY` or `COMPLETED`.
+    expected_pods: Number of pods that must exist to be `READY`.
+  """
+
+  def __init__(self, *, condition: str, expected_pods: int = 0, **kwargs):
+    super().__init__(**kwargs)
+    self.condition = condition
+    self.expected_pods = expected_pods
+
+  def trigger(self) -> BaseTrigger:
+    return PodsTrigger(
+        project_id=self.project_id,
+        region=self.region,
+        cluster_name=self.cluster_name,
+        label_selector=f"{self.label_key}={self.label_value}",
+        condition=self.condition,
+        expected_pods=self.expected_pods,
+    )
+
+
+class WaitForStepOperator(_DeferredOperator):
+  """Waits in the triggerer for a pod with a label to log a training step.
+
+  Attributes:
+    step: Step to wait for.
+    step_pattern: Regex whose first group is the step in a log line.
+  """
+
+  def __init__(self, *, step: int, step_pattern: str, **kwargs):
+    super().__init__(**kwargs)
+    self.step = step
+    self.step_pattern = step_pattern
+
+  def trigger(self) -> BaseTrigger:
+    return PodLogStepTrigger(
+        project_id=self.project_id,
+        region=self.region,
+        cluster_name=self.cluster_name,
+        label_selector=f"{self.label_key}={self.label_value}",
+        step=self.step,
+        step_pattern=self.step_pattern,
+    )
@@ -0,0 +1,226 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for k8s_watch.py."""
+
+import asyncio
+import contextlib
+import datetime
+from typing import Dict, List, Optional
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from airflow.exceptions import TaskDeferred
+from kubernetes_asyncio import client as k8s_client
+from xlml.utils import k8s_watch
+
+
+class EvaluateTest(parameterized.TestCase, absltest.TestCase):
+
+  @parameterized.named_parameters(
+      ("not_started", k8s_watch.STARTED, {}, 0, None),
+      ("started", k8s_watch.STARTED, {"a": "Pending"}, 0, k8s_watch.SUCCESS),
+      ("not_ready", k8s_watch.READY, {"a": "Running"}, 2, None),
+      (
+          "ready",
+          k8s_watch.READY,
+          {"a": "Running", "b": "Pending"},
+          2,
+          k8s_watch.SUCCESS,
+      ),
+      ("running", k8s_watch.COMPLETED, {"a": "Running"}, 0, None),
+      ("not_all_seen", k8s_watch.COMPLETED, {"a": "Succeeded"}, 2, None),
+      (
+          "succeeded",
+          k8s_watch.COMPLETED,
+          {"a": "Succeeded", "b": "Succeeded"},
+          0,
+          k8s_watch.SUCCESS,
+      ),
+      (
+          "failed",
+          k8s_watch.COMPLETED,
+          {"a": "Running", "b": "Failed"},
+          0,
+          k8s_watch.FAILED,
+      ),
+  )
+  def test_evaluate(
+      self,
+      condition: str,
+      phases: Dict[str, str],
+      expected_pods: int,
+      status: Optional[str],
+  ):
+    result = k8s_watch.evaluate(condition, phases, expected_pods)
+
+    self.assertEqual(result["status"] if result else None, status)
+
+
+def _pod(name: str, phase: Optional[str]) -> k8s_client.V1Pod:
+  return k8s_client.V1Pod(
+      metadata=k8s_client.V1ObjectMeta(name=name),
+      status=k8s_client.V1PodStatus(phase=phase),
+  )
+
+
+class _FakeWatch:
+  """Streams a fixed list of events, then ends as if the watch timed out."""
+
+  def __init__(self, events: List[Dict[str, object]]):
+    self.events = events
+    self.kwargs = None
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *args):
+    pass
+
+  def stream(self, func, *args, **kwargs):
+    del func, args
+    self.kwargs = kwargs
+    return self._events()
+
+  async def _events(self):
+    for event in self.events:
+      yield event
+    # Lets the test time out the trigger, which then watches again.
+    await asyncio.sleep(0.01)
+
+
+class PodsTriggerTest(absltest.TestCase):
+
+  def _run(
+      self,
+      listed: List[k8s_client.V1Pod],
+      events: List[Dict[str, object]],
+      expected_pods: int = 0,
+  ) -> Optional[Dict[str, str]]:
+    core_api = mock.Mock()
+    core_api.list_namespaced_pod = mock.AsyncMock(
+        return_value=k8s_client.V1PodList(
+            items=listed,
+            metadata=k8s_client.V1ListMeta(resource_version="7"),
+        )
+    )
+
+    @contextlib.asynccontextmanager
+    async def async_core_api(*args):
+      del args
+      yield core_api
+
+    self.watch = _FakeWatch(events)
+    self.enter_context(
+        mock.patch.object(k8s_watch, "async_core_api", async_core_api)
+    )
+    self.enter_context(
+        mock.patch.object(
+            k8s_watch.kubernetes_asyncio.watch, "Watch", lambda: self.watch
+        )
+    )
+    trigger = k8s_watch.PodsTrigger(
+        "p", "r", "c", "a=b", k8s_watch.COMPLETED, expected_pods
+    )
+
+    async def first_event():
+      # The trigger lists the pods again when a watch ends, which would loop.
+      return await asyncio.wait_for(anext(trigger.run()), timeout=0.2)
+
+    try:
+      return asyncio.run(first_event()).payload
+    except asyncio.TimeoutError:
+      return None
+
+  def test_waits_for_listed_pods_before_completing(self):
+    result = self._run(
+        listed=[_pod("a", "Succeeded"), _pod("b", "Running")],
+        events=[
+            {"type": "MODIFIED", "object": _pod("a", "Succeeded")},
+            {"type": "MODIFIED", "object": _pod("b", "Succeeded")},
+        ],
+    )
+
+    self.assertEqual(result["status"], k8s_watch.SUCCESS)
+    self.assertIn("'b': 'Succeeded'", result["message"])
+    self.assertEqual(self.watch.kwargs["resource_version"], "7")
+
+  def test_does_not_complete_while_a_listed_pod_runs(self):
+    result = self._run(
+        listed=[_pod("a", "Succeeded"), _pod("b", "Running")],
+        events=[{"type": "MODIFIED", "object": _pod("a", "Succeeded")}],
+    )
+
+    self.assertIsNone(result)
+
+  def test_does_not_complete_before_expected_pods_have_a_phase(self):
+    result = self._run(
+        listed=[_pod("a", "Succeeded")],
+        events=[{"type": "ADDED", "object": _pod("b", None)}],
+        expected_pods=2,
+    )
+
+    self.assertIsNone(result)
+
+  def test_fails_on_failed_pod(self):
+    result = self._run(
+        listed=[_pod("a", "Failed"), _pod("b", "Running")], events=[]
+    )
+
+    self.assertEqual(result["status"], k8s_watch.FAILED)
+
+  def test_serialize(self):
+    trigger = k8s_watch.PodsTrigger(
+        project_id="p",
+        region="r",
+        cluster_name="c",
+        label_selector="a=b",
+        condition=k8s_watch.COMPLETED,
+    )
+
+    classpath, kwargs = trigger.serialize()
+
+    self.assertEqual(classpath, "xlml.utils.k8s_watch.PodsTrigger")
+    self.assertEqual(
+        k8s_watch.PodsTrigger(**kwargs).serialize(), (classpath, kwargs)
+    )
+
+
+class WaitForStepOperatorTest(absltest.TestCase):
+
+  def test_defers_with_timeout(self):
+    operator = k8s_watch.WaitForStepOperator(
+        task_id="wait",
+        project_id="p",
+        region="r",
+        cluster_name="c",
+        label_key="a",
+        label_value="b",
+        step=5,
+        step_pattern=r"step: (\d+)",
+        timeout=datetime.timedelta(minutes=30),
+    )
+
+    with self.assertRaises(TaskDeferred) as deferred:
+      operator.execute({})
+
+    self.assertIsInstance(
+        deferred.exception.trigger, k8s_watch.PodLogStepTrigger
+    )
+    self.assertEqual(deferred.exception.timeout, datetime.timedelta(minutes=30))
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -13,10 +13,10 @@
 # limitations under the License.
 
 """Utilities to run workloads with mantaray."""
-import subprocess
 import tempfile
 from airflow.decorators import task
 from airflow.hooks.subprocess import SubprocessHook
+from xlml.apis import gcs
 
 
 MANTARAY_G3_GS_BUCKET = "gs://borgcron/cmcs-benchmark-automation/mantaray"
@@ -24,15 +24,8 @@ MAXLIBRARY_G3_GS_BUCKET = "gs://borgcron/maxlibrary"
 
 
 def load_file_from_gcs(gs_file_path):
-  """Loads a file from a Google Cloud Storage bucket."""
-  with tempfile.TemporaryDirectory() as tmpdir:
-    subprocess.run(
-        f"gcloud storage cp {gs_file_path} {tmpdir}/file",
-        check=False,
-        shell=True,
-    )
-    with open(f"{tmpdir}/file", "r") as f:  # pylint: disable=unspecified-encoding
-      return f.read()
+  """Loads a file from a Google Cloud Storage bucket at DAG parse time."""
+  return gcs.read_file_for_dag_parsing(gs_file_path).decode()
 
 
 @task
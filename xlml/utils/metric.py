@@ -806,6 +806,28 @@ def get_xpk_job_status() -> bigquery.JobStatus:
   return bigquery.JobStatus.FAILED
 
 
+def get_xpk_timing_metrics(base_id: str) -> List[bigquery.MetricHistoryRow]:
+  """Get the orchestration time breakdown recorded for the XPK run, if any."""
+  context = get_current_context()
+  try:
+    timing_task_id = find_full_task_id_from_upstream(
+        context["task"], "record_workload_timing"
+    )
+  except AirflowFailException:
+    logging.info("No workload timing was recorded.")
+    return []
+
+  breakdown = context["ti"].xcom_pull(task_ids=timing_task_id) or {}
+  return [
+      bigquery.MetricHistoryRow(
+          job_uuid=generate_row_uuid(base_id, 0),
+          metric_key=key,
+          metric_value=value,
+      )
+      for key, value in breakdown.items()
+  ]
+
+
 def get_gke_job_status(
     task_test_config: test_config.TestConfig[test_config.Accelerator],
 ) -> bigquery.JobStatus:
@@ -1040,6 +1062,10 @@ def process_metrics(
       for index in range(len(metric_history_rows_list)):
         metric_history_rows_list[index].extend(profile_history_rows_list[index])
 
+  if hasattr(task_test_config, "cluster_name") and metric_history_rows_list:
+    # A workload runs once, so its timing belongs to the first test run.
+    metric_history_rows_list[0].extend(get_xpk_timing_metrics(base_id))
+
   test_run_rows = []
 
   dataset_name = update_dataset_name_if_needed(task_gcp_config.dataset_name)
@@ -0,0 +1,221 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streams the logs of a job's pods to GCS with bounded concurrency.
+
+Each pod's log is written to `<archive_location>/<pod>/<index>.log.gz`,
+rotating to a new chunk every `CHUNK_BYTES` of uncompressed log. Only a tail
+of each pod's log is kept in memory, for the task log.
+"""
+
+import asyncio
+import collections
+import datetime
+import gzip
+import io
+import re
+from typing import Dict, List, Optional, Tuple
+
+from absl import logging
+from airflow.providers.google.cloud.hooks.gcs import GCSHook
+import kubernetes_asyncio
+
+from xlml.utils import k8s_watch
+
+
+MAX_CONCURRENT_STREAMS = 16
+CHUNK_BYTES = 32 * 1024 * 1024
+TAIL_LINES = 50
+PODS_READY_TIMEOUT = datetime.timedelta(minutes=5)
+
+
+class ChunkWriter:
+  """Writes a log to rotating gzip chunks under a GCS prefix."""
+
+  def __init__(self, archive_location: str, chunk_bytes: int = CHUNK_BYTES):
+    match = re.fullmatch(r"gs://([^/]+)/(.+)", archive_location.rstrip("/"))
+    if not match:
+      raise ValueError(f"Invalid GCS path: {archive_location}")
+    self.bucket, self.prefix = match.groups()
+    self.chunk_bytes = chunk_bytes
+    self.index = 0
+    self._hook = GCSHook()
+    self._reset()
+
+  def _reset(self) -> None:
+    self._buffer = io.BytesIO()
+    self._gzip = gzip.GzipFile(fileobj=self._buffer, mode="wb")
+    self._size = 0
+
+  async def write(self, data: bytes) -> None:
+    self._gzip.write(data)
+    self._size += len(data)
+    if self._size >= self.chunk_bytes:
+      await self.flush()
+
+  async def flush(self) -> None:
+    """Uploads the current chunk, if not empty, and starts a new one."""
+    if not self._size:
+      return
+    self._gzip.close()
+    await asyncio.to_thread(
+        self._hook.upload,
+        bucket_name=self.bucket,
+        object_name=f"{self.prefix}/{self.index:05d}.log.gz",
+        data=self._buffer.getvalue(),
+        mime_type="application/gzip",
+    )
+    self.index += 1
+    self._reset()
+
+
+async def _stream_pod(
+    core_api: kubernetes_asyncio.client.CoreV1Api,
+    pod_name: str,
+    namespace: str,
+    archive_location: Optional[str],
+    semaphore: asyncio.Semaphore,
+) -> Tuple[Optional[int], List[str]]:
+  """Streams a pod's log until it terminates.
+
+  Returns:
+    The exit code of the pod, if known, and the tail of its log.
+  """
+  async with kubernetes_asyncio.watch.Watch() as watch:
+    async for event in watch.stream(
+        core_api.list_namespaced_pod,
+        namespace,
+        field_selector=f"metadata.name={pod_name}",
+    ):
+      if event["object"].status.phase != "Pending":
+        break
+
+  tail = collections.deque(maxlen=TAIL_LINES)
+  writer = (
+      ChunkWriter(f"{archive_location}/{pod_name}")
+      if archive_location
+      else None
+  )
+  # Logs are read from the start, so pods waiting for a slot lose nothing.
+  async with semaphore:
+    response = await core_api.read_namespaced_pod_log(
+        pod_name, namespace, follow=True, _preload_content=False
+    )
+    try:
+      async for line in response.content:
+        tail.append(line.decode(errors="replace").rstrip("\n"))
+        if writer:
+          await writer.write(line)
+    finally:
+      response.release()
+    if writer:
+      await writer.flush()
+
+  pod = await core_api.read_namespaced_pod(pod_name, namespace)
+  for status in pod.status.container_statuses or []:
+    if status.state.terminated:
+      return status.state.terminated.exit_code, list(tail)
+  return None, list(tail)
+
+
+async def _stream_job_logs(
+    project_id: str,
+    region: str,
+    cluster_name: str,
+    label_selector: str,
+    expected_pods: int,
+    archive_location: Optional[str],
+    namespace: str,
+) -> Dict[str, Tuple[Optional[int], List[str]]]:
+  ready = k8s_watch.PodsTrigger(
+      project_id,
+      region,
+      cluster_name,
+      label_selector,
+      k8s_watch.READY,
+      expected_pods,
+      namespace,
+  )
+  event = await asyncio.wait_for(
+      anext(ready.run()), PODS_READY_TIMEOUT.total_seconds()
+  )
+  if event.payload["status"] != k8s_watch.SUCCESS:
+    raise RuntimeError(event.payload["message"])
+
+  async with k8s_watch.async_core_api(
+      project_id, region, cluster_name
+  ) as core_api:
+    pods = await core_api.list_namespaced_pod(
+        namespace, label_selector=label_selector
+    )
+    names = [pod.metadata.name for pod in pods.items]
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_STREAMS)
+    results = await asyncio.gather(
+        *(
+            _stream_pod(core_api, name, namespace, archive_location, semaphore)
+            for name in names
+        )
+    )
+  return dict(zip(names, results))
+
+
+def stream_job_logs(
+    project_id: str,
+    region: str,
+    cluster_name: str,
+    label_selector: str,
+    expected_pods: int,
+    archive_location: Optional[str] = None,
+    namespace: str = "default",
+) -> Dict[str, Optional[int]]:
+  """Waits for a job's pods, then streams their logs until they terminate.
+
+  Args:
+    project_id: Project of the cluster.
+    region: Region of the cluster.
+    cluster_name: Name of the cluster.
+    label_selector: Selector of the job's pods.
+    expected_pods: Number of pods to wait for before streaming.
+    archive_location: GCS folder to write the logs to. If empty, logs are
+      not archived.
+    namespace: Namespace of the pods.
+
+  Returns:
+    The exit code of each pod, or None if it is unknown.
+
+  Raises:
+    asyncio.TimeoutError: If the pods are not created within
+      `PODS_READY_TIMEOUT`.
+  """
+  results = asyncio.run(
+      _stream_job_logs(
+          project_id,
+          region,
+          cluster_name,
+          label_selector,
+          expected_pods,
+          archive_location,
+          namespace,
+      )
+  )
+
+  for name, (exit_code, tail) in results.items():
+    logging.info(f"Pod {name} exited with code {exit_code}.")
+    if exit_code != 0:
+      logging.info(f"Last {len(tail)} lines of logs for pod {name}:")
+      for line in tail:
+        logging.info(f"{name}] {line}")
+  if archive_location:
+    logging.info(f"Full logs are archived in {archive_location}")
+  return {name: exit_code for name, (exit_code, _) in results.items()}
@@ -0,0 +1,68 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for pod_logs.py."""
+
+import asyncio
+import gzip
+from unittest import mock
+
+from absl.testing import absltest
+from xlml.utils import pod_logs
+
+
+class ChunkWriterTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.upload = self.enter_context(
+        mock.patch.object(pod_logs, "GCSHook")
+    ).return_value.upload
+
+  def test_rotates_chunks(self):
+    writer = pod_logs.ChunkWriter("gs://bucket/logs/pod-0/", chunk_bytes=10)
+
+    async def write():
+      for line in (b"123456\n", b"789\n", b"abc\n"):
+        await writer.write(line)
+      await writer.flush()
+
+    asyncio.run(write())
+
+    self.assertEqual(
+        [call.kwargs["object_name"] for call in self.upload.call_args_list],
+        ["logs/pod-0/00000.log.gz", "logs/pod-0/00001.log.gz"],
+    )
+    self.assertEqual(
+        gzip.decompress(self.upload.call_args_list[0].kwargs["data"]),
+        b"123456\n789\n",
+    )
+    self.assertEqual(
+        self.upload.call_args_list[0].kwargs["bucket_name"], "bucket"
+    )
+
+  def test_skips_empty_chunk(self):
+    writer = pod_logs.ChunkWriter("gs://bucket/logs")
+
+    asyncio.run(writer.flush())
+
+    self.upload.assert_not_called()
+
+  def test_invalid_location(self):
+    with self.assertRaises(ValueError):
+      pod_logs.ChunkWriter("/local/logs")
+
+
+if __name__ == "__main__":
+  absltest.main()
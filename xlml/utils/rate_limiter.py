@@ -0,0 +1,77 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utility to rate limit calls against per-minute API quotas."""
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+  """A thread-safe token bucket rate limiter.
+
+  Tokens refill continuously at `rate_per_minute` up to `capacity`. Each call
+  to `acquire` consumes one token, blocking until one is available.
+
+  The bucket starts empty and holds a single token by default, so calls are
+  spread evenly and no window of a minute exceeds the rate. A full bucket of
+  one minute's worth of tokens would allow twice the rate in the first minute.
+  """
+
+  def __init__(
+      self,
+      rate_per_minute: float,
+      capacity: Optional[int] = None,
+      clock: Callable[[], float] = time.monotonic,
+      sleep: Callable[[float], None] = time.sleep,
+  ):
+    if rate_per_minute <= 0:
+      raise ValueError(f"rate_per_minute must be positive: {rate_per_minute}")
+
+    self._rate_per_second = rate_per_minute / 60
+    self._capacity = capacity or 1
+    self._tokens = 0.0
+    self._clock = clock
+    self._sleep = sleep
+    self._last_refill = clock()
+    self._lock = threading.Lock()
+
+  def _refill(self) -> None:
+    now = self._clock()
+    elapsed = now - self._last_refill
+    self._tokens = min(
+        self._capacity, self._tokens + elapsed * self._rate_per_second
+    )
+    self._last_refill = now
+
+  def try_acquire(self) -> bool:
+    """Consumes a token if one is available without blocking."""
+    with self._lock:
+      self._refill()
+      if self._tokens >= 1:
+        self._tokens -= 1
+        return True
+      return False
+
+  def acquire(self) -> None:
+    """Blocks until a token is available, then consumes it."""
+    while True:
+      with self._lock:
+        self._refill()
+        if self._tokens >= 1:
+          self._tokens -= 1
+          return
+        wait_seconds = (1 - self._tokens) / self._rate_per_second
+      self._sleep(wait_seconds)
@@ -0,0 +1,96 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for rate_limiter.py."""
+
+from absl.testing import absltest
+from xlml.utils import rate_limiter
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 0.0
+
+  def time(self) -> float:
+    return self.now
+
+  def sleep(self, seconds: float) -> None:
+    self.now += seconds
+
+
+class TokenBucketTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.clock = FakeClock()
+
+  def test_burst_up_to_capacity(self):
+    bucket = rate_limiter.TokenBucket(
+        rate_per_minute=60,
+        capacity=3,
+        clock=self.clock.time,
+        sleep=self.clock.sleep,
+    )
+
+    self.clock.now += 3
+    self.assertTrue(bucket.try_acquire())
+    self.assertTrue(bucket.try_acquire())
+    self.assertTrue(bucket.try_acquire())
+    self.assertFalse(bucket.try_acquire())
+
+  def test_starts_empty(self):
+    bucket = rate_limiter.TokenBucket(
+        rate_per_minute=60, clock=self.clock.time, sleep=self.clock.sleep
+    )
+
+    self.assertFalse(bucket.try_acquire())
+    self.clock.now += 1
+    self.assertTrue(bucket.try_acquire())
+
+  def test_acquire_waits_for_refill(self):
+    bucket = rate_limiter.TokenBucket(
+        rate_per_minute=30,
+        capacity=1,
+        clock=self.clock.time,
+        sleep=self.clock.sleep,
+    )
+
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()
+
+    # One token every 2 seconds, starting empty.
+    self.assertAlmostEqual(self.clock.now, 6.0)
+
+  def test_refill_does_not_exceed_capacity(self):
+    bucket = rate_limiter.TokenBucket(
+        rate_per_minute=60,
+        capacity=2,
+        clock=self.clock.time,
+        sleep=self.clock.sleep,
+    )
+
+    self.clock.now += 600
+    self.assertTrue(bucket.try_acquire())
+    self.assertTrue(bucket.try_acquire())
+    self.assertFalse(bucket.try_acquire())
+
+  def test_invalid_rate(self):
+    with self.assertRaises(ValueError):
+      rate_limiter.TokenBucket(rate_per_minute=0)
+
+
+if __name__ == "__main__":
+  absltest.main()
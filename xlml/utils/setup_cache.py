@@ -0,0 +1,82 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utility to cache the results of accelerator setup scripts in GCS.
+
+Setup results are stored as a tarball of the home directory, addressed by a
+hash of the setup script and runtime version. Only changes under `$HOME` (e.g.
+`pip install --user`, virtualenvs and git clones) are cached, so setup scripts
+that modify system packages should not use the cache. Setup scripts that
+install nightly builds should not use the cache either.
+"""
+
+import hashlib
+import shlex
+
+from dags import gcs_bucket
+
+
+def cache_key(setup_script: str, *versions: str) -> str:
+  """Returns a content address for the given setup script and versions."""
+  content = '\n'.join((*versions, setup_script))
+  return hashlib.sha256(content.encode()).hexdigest()
+
+
+def cache_location(key: str, cache_dir: str = gcs_bucket.SETUP_CACHE_DIR):
+  return f'{cache_dir}/{key}.tar.gz'
+
+
+def with_setup_cache(
+    setup_script: str,
+    key: str,
+    cache_dir: str = gcs_bucket.SETUP_CACHE_DIR,
+) -> str:
+  """Wraps a setup script to restore its results from the cache if present.
+
+  On a cache hit, the cached home directory is unpacked and the setup script is
+  skipped. On a cache miss, the setup script runs and worker 0 uploads the
+  resulting home directory for later runs.
+
+  Args:
+    setup_script: The setup script to cache.
+    key: The content address returned by `cache_key`.
+    cache_dir: GCS folder holding cached setup results.
+
+  Returns:
+    The wrapped setup script.
+  """
+  location = cache_location(key, cache_dir)
+  archive = f'/tmp/setup-cache-{key}.tar.gz'
+  return f"""set -xue
+if gcloud storage cp {location} {archive}; then
+  echo "Setup cache hit: {location}"
+  tar -xzf {archive} -C "$HOME"
+  rm -f {archive}
+  exit 0
+fi
+
+echo "Setup cache miss: {location}"
+bash -c {shlex.quote(setup_script)}
+
+worker_id=$(curl -sf -H 'Metadata-Flavor: Google' \\
+  http://metadata.google.internal/computeMetadata/v1/instance/attributes/agent-worker-number \\
+  || echo 0)
+if [ "$worker_id" = "0" ]; then
+  tar -czf {archive} -C "$HOME" \\
+    --exclude=./.ssh --exclude=./.cache --exclude=./.config/gcloud .
+  gcloud storage cp {archive} {location} \\
+    || echo "Failed to populate setup cache: {location}"
+  rm -f {archive}
+fi
+"""
@@ -0,0 +1,160 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for setup_cache.py."""
+
+import os
+import subprocess
+import tempfile
+import textwrap
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from xlml.utils import setup_cache
+
+
+_SCRIPT = "pip install --user jax==0.4.30"
+_IMAGE = "https://www.googleapis.com/compute/v1/projects/p/global/images/i-1"
+
+
+class CacheKeyTest(parameterized.TestCase):
+
+  def test_is_stable(self):
+    self.assertEqual(
+        setup_cache.cache_key(_SCRIPT, "a100", _IMAGE),
+        setup_cache.cache_key(_SCRIPT, "a100", _IMAGE),
+    )
+
+  @parameterized.named_parameters(
+      ("script", (_SCRIPT + " flax", "a100", _IMAGE)),
+      ("accelerator", (_SCRIPT, "h100", _IMAGE)),
+      ("image", (_SCRIPT, "a100", _IMAGE.replace("i-1", "i-2"))),
+  )
+  def test_changes_with(self, args):
+    self.assertNotEqual(
+        setup_cache.cache_key(_SCRIPT, "a100", _IMAGE),
+        setup_cache.cache_key(*args),
+    )
+
+  def test_separates_versions_from_script(self):
+    self.assertNotEqual(
+        setup_cache.cache_key("b", "a"), setup_cache.cache_key("", "a\nb")
+    )
+
+  def test_location(self):
+    self.assertEqual(
+        setup_cache.cache_location("abc", "gs://bucket/cache"),
+        "gs://bucket/cache/abc.tar.gz",
+    )
+
+
+class WithSetupCacheTest(absltest.TestCase):
+  """Runs the wrapped script with `gcloud` and `curl` backed by a local dir."""
+
+  def setUp(self):
+    super().setUp()
+    root = self.enter_context(tempfile.TemporaryDirectory())
+    self.home = os.path.join(root, "home")
+    self.bucket = os.path.join(root, "bucket")
+    self.bin = os.path.join(root, "bin")
+    for path in (self.home, self.bucket, self.bin):
+      os.makedirs(path)
+    self.worker_id = "0"
+    self._add_command(
+        "gcloud",
+        f"""
+        src=${{3/gs:\\/\\//{self.bucket}/}}
+        dst=${{4/gs:\\/\\//{self.bucket}/}}
+        mkdir -p "$(dirname "$dst")"
+        cp "$src" "$dst" 2>/dev/null
+        """,
+    )
+    self._add_command("curl", 'echo "$WORKER_ID"')
+
+  def _add_command(self, name: str, body: str) -> None:
+    path = os.path.join(self.bin, name)
+    with open(path, "w") as f:
+      f.write("#!/bin/bash\n" + textwrap.dedent(body))
+    os.chmod(path, 0o755)
+
+  def _run(self, setup_script: str) -> str:
+    script = setup_cache.with_setup_cache(
+        setup_script, "key", cache_dir="gs://cache"
+    )
+    return subprocess.run(
+        ["bash", "-c", script],
+        env={
+            "HOME": self.home,
+            "PATH": f"{self.bin}:{os.environ['PATH']}",
+            "WORKER_ID": self.worker_id,
+        },
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+  def test_miss_runs_setup_and_uploads_home(self):
+    output = self._run('echo installed > "$HOME/lib.txt"')
+
+    self.assertIn("Setup cache miss: gs://cache/key.tar.gz", output)
+    self.assertTrue(
+        os.path.exists(os.path.join(self.bucket, "cache/key.tar.gz"))
+    )
+
+  def test_hit_restores_home_without_running_setup(self):
+    self._run('echo installed > "$HOME/lib.txt"')
+    os.remove(os.path.join(self.home, "lib.txt"))
+
+    output = self._run('echo ran > "$HOME/setup_ran.txt"')
+
+    self.assertIn("Setup cache hit: gs://cache/key.tar.gz", output)
+    with open(os.path.join(self.home, "lib.txt")) as f:
+      self.assertEqual(f.read(), "installed\n")
+    self.assertFalse(os.path.exists(os.path.join(self.home, "setup_ran.txt")))
+
+  def test_only_worker_0_uploads(self):
+    self.worker_id = "1"
+
+    self._run('echo installed > "$HOME/lib.txt"')
+
+    self.assertFalse(
+        os.path.exists(os.path.join(self.bucket, "cache/key.tar.gz"))
+    )
+
+  def test_excludes_credentials(self):
+    os.makedirs(os.path.join(self.home, ".ssh"))
+    with open(os.path.join(self.home, ".ssh/id_rsa"), "w") as f:
+      f.write("secret")
+    self._run("true")
+
+    listing = subprocess.run(
+        ["tar", "-tzf", os.path.join(self.bucket, "cache/key.tar.gz")],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    self.assertNotIn(".ssh", listing)
+
+  def test_failed_setup_is_not_cached(self):
+    with self.assertRaises(subprocess.CalledProcessError):
+      self._run("exit 1")
+
+    self.assertFalse(
+        os.path.exists(os.path.join(self.bucket, "cache/key.tar.gz"))
+    )
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -15,11 +15,35 @@
 """Utility for startup scripts."""
 
 import shlex
+from typing import Optional
 
+EXIT_STATUS = 'exit_status'
+LOGS_TAIL = 'logs_tail'
+# Size of the log tail pushed alongside the exit status.
+LOGS_TAIL_BYTES = 64 * 1024
 
-def generate_startup_script(main_command: str) -> str:
+
+def status_location(status_dir: str, tpu_name: str) -> str:
+  """Returns the GCS folder that startup scripts of a TPU report to."""
+  return f'{status_dir}/{tpu_name}'
+
+
+def generate_startup_script(
+    main_command: str, report_location: Optional[str] = None
+) -> str:
+  """Generates a startup script that runs the main command in background.
+
+  Args:
+    main_command: The command to run.
+    report_location: If set, worker 0 of each slice uploads the log tail and
+      then the exit status to `<report_location>/<hostname>/` in GCS once the
+      command finishes, so completion can be detected without SSH.
+
+  Returns:
+    The startup script.
+  """
   escaped_command = shlex.quote(main_command)
-  return f"""
+  script = f"""
 set -o pipefail
 bash -c {escaped_command} 2>&1 | tee /tmp/logs &
 pid=$!
@@ -28,6 +52,21 @@ wait $pid
 exit_status=$?
 echo $exit_status > /tmp/process_exit_status.txt
 """
+  if not report_location:
+    return script
+
+  # The exit status is uploaded last, as it marks the report as complete.
+  report = f"""
+worker_id=$(curl -sf -H 'Metadata-Flavor: Google' \\
+  http://metadata.google.internal/computeMetadata/v1/instance/attributes/agent-worker-number \\
+  || echo 0)
+if [ "$worker_id" = "0" ]; then
+  report={report_location}/$(hostname)
+  tail -c {LOGS_TAIL_BYTES} /tmp/logs | gcloud storage cp - $report/{LOGS_TAIL}
+  gcloud storage cp /tmp/process_exit_status.txt $report/{EXIT_STATUS}
+fi
+"""
+  return script + report
 
 
 def monitor_startup_script() -> str:
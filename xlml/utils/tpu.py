@@ -14,11 +14,12 @@
 
 """Utilities to create, delete, and SSH with TPUs."""
 
+import concurrent.futures
 import datetime
 import io
 import itertools
 import os
-from typing import Dict, Iterable, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 import uuid
 
 from absl import logging
@@ -28,8 +29,10 @@ from airflow.utils.task_group import TaskGroup
 from airflow.operators.python import get_current_context
 from airflow.models import Variable
 from airflow.exceptions import AirflowFailException
-from xlml.apis import gcp_config, test_config
-from xlml.utils import ssh, startup_script, composer
+from airflow.providers.google.cloud.hooks.gcs import GCSHook
+from xlml.apis import gcp_config, gcs, test_config
+from xlml.utils import ssh, startup_script, composer, rate_limiter
+from dags.common.vm_resource import Zone
 import fabric
 import google.api_core.exceptions
 import google.auth
@@ -40,6 +43,10 @@ from google.protobuf.duration_pb2 import Duration
 
 
 TTL = 'ttl'
+# Stay below the per-minute quota of TPU API delete requests, e.g. DeleteNode.
+DELETE_REQUESTS_PER_MINUTE = 20
+_MAX_LIST_WORKERS = 8
+_MAX_DELETE_WORKERS = 4
 
 
 @task
@@ -53,171 +60,261 @@ def generate_tpu_name(
   return tpu_name
 
 
-def create_queued_resource(
-    tpu_name: airflow.XComArg,
+def request_queued_resource(
+    tpu_name: str,
     gcp: gcp_config.GCPConfig,
-    ssh_keys: airflow.XComArg,
+    ssh_keys: ssh.SshKeys,
     timeout: datetime.timedelta,
     task_test_config: Union[
         test_config.TpuVmTest, test_config.JSonnetTpuVmTest
     ],
     use_startup_script: bool = False,
-) -> Tuple[TaskGroup, airflow.XComArg]:
-  """Request a QueuedResource and wait until the nodes are created.
+    labels: Optional[Dict[str, str]] = None,
+    startup_script_status_dir: Optional[str] = None,
+) -> str:
+  """Send a QueuedResource creation request.
 
   Args:
-    tpu_name: XCom value for unique TPU name.
-    accelerator: Description of TPU to create.
+    tpu_name: Unique TPU name.
     gcp: GCP project/zone configuration.
-    ssh_keys: XCom value for SSH keys to communicate with these TPUs.
+    ssh_keys: SSH keys to communicate with these TPUs.
     timeout: Amount of time to wait for TPUs to be created.
     task_test_config: Test config of the task.
     use_startup_script: Indicator to use startup script.
+    labels: Extra labels for the TPU nodes. Overrides the default TTL label.
+    startup_script_status_dir: GCS folder the startup script reports its exit
+      status and log tail to, if any.
 
   Returns:
-    A TaskGroup for the entire create operation and an XCom value for the
-    qualified queued_resource name.
+    The qualified name of the queued resource.
   """
+  # Log required info for XLML PLX Dashboard
+  composer.log_metadata_for_xlml_dashboard({
+      'instance_name': tpu_name,
+      'cluster_project': gcp.project_name,
+      'zone': gcp.zone,
+      'dataset_name': gcp.dataset_name.value,
+      'composer_project': gcp.composer_project,
+      'dataset_project': gcp.dataset_project,
+      'accelerator': {
+          'name': task_test_config.accelerator.name,
+          'num_cores': task_test_config.accelerator.cores,
+          'runtime_version': task_test_config.accelerator.runtime_version,
+          'version': task_test_config.accelerator.version.value,
+      },
+      'accelerator_type': task_test_config.accelerator.name,
+  })
 
-  @task
-  def create_queued_resource_request(
-      tpu_name: str, ssh_keys: ssh.SshKeys
-  ) -> str:
-    # Log required info for XLML PLX Dashboard
-    composer.log_metadata_for_xlml_dashboard({
-        'instance_name': tpu_name,
-        'cluster_project': gcp.project_name,
-        'zone': gcp.zone,
-        'dataset_name': gcp.dataset_name.value,
-        'composer_project': gcp.composer_project,
-        'dataset_project': gcp.dataset_project,
-        'accelerator': {
-            'name': task_test_config.accelerator.name,
-            'num_cores': task_test_config.accelerator.cores,
-            'runtime_version': task_test_config.accelerator.runtime_version,
-            'version': task_test_config.accelerator.version.value,
-        },
-        'accelerator_type': task_test_config.accelerator.name,
-    })
-
-    creds, _ = google.auth.default()
-    client = tpu_api.TpuClient(credentials=creds)
+  creds, _ = google.auth.default()
+  client = tpu_api.TpuClient(credentials=creds)
 
-    parent = f'projects/{gcp.project_name}/locations/{gcp.zone}'
-
-    # Determine node_id and multiNodeParams based on num_slices
-    if task_test_config.num_slices == 1:
-      node_id = tpu_name
-      multi_node_params = None
-    else:
-      node_id = None
-      multi_node_params = (
-          tpu_api.types.QueuedResource.Tpu.NodeSpec.MultiNodeParams(
-              node_count=task_test_config.num_slices, node_id_prefix=tpu_name
-          )
-      )
+  parent = f'projects/{gcp.project_name}/locations/{gcp.zone}'
 
-    startup_script_command = ''
+  # Determine node_id and multiNodeParams based on num_slices
+  if task_test_config.num_slices == 1:
+    node_id = tpu_name
+    multi_node_params = None
+  else:
+    node_id = None
+    multi_node_params = (
+        tpu_api.types.QueuedResource.Tpu.NodeSpec.MultiNodeParams(
+            node_count=task_test_config.num_slices, node_id_prefix=tpu_name
+        )
+    )
 
-    if use_startup_script:
-      main_command = '\n'.join(
-          task_test_config.set_up_cmds + task_test_config.run_model_cmds
-      )
-      startup_script_command = startup_script.generate_startup_script(
-          main_command
-      )
+  startup_script_command = ''
 
-    metadata = {
-        'ssh-keys': f'{ssh_keys.user}:{ssh_keys.public}',
-        'startup-script': startup_script_command,
-    }
-
-    create_tpu_timeout_in_sec = int(timeout.total_seconds())
-    if task_test_config.timeout:
-      run_model_timeout_in_sec = int(task_test_config.timeout.total_seconds())
-    else:
-      run_model_timeout_in_sec = 7200  # Assume a default timeout of 2 hours
-    # Time to live (ttl) is combination of:
-    # 1) tpu provision timeout
-    # 2) tpu run model timeout
-    # 3) 1 hour buffer timeout (provision, post_process, etc)
-    ttl = create_tpu_timeout_in_sec + run_model_timeout_in_sec + 3600
-    labels = {
-        TTL: str(ttl),
-    }
-
-    accelerator = task_test_config.accelerator
-    queued_resource = tpu_api.QueuedResource(
-        # TODO(ranran): enable configuration via `AcceleratorConfig`
-        tpu=tpu_api.QueuedResource.Tpu(
-            node_spec=[
-                tpu_api.QueuedResource.Tpu.NodeSpec(
-                    node_id=node_id,
-                    multi_node_params=multi_node_params,
-                    parent=parent,
-                    node=tpu_api.Node(
-                        accelerator_type=accelerator.name,
-                        description='noteardown',
-                        runtime_version=accelerator.runtime_version,
-                        network_config=tpu_api.NetworkConfig(
-                            network=accelerator.network,
-                            subnetwork=accelerator.subnetwork,
-                            enable_external_ips=True,
-                        ),
-                        metadata=metadata,
-                        labels=labels,
-                        scheduling_config=tpu_api.SchedulingConfig(
-                            preemptible=accelerator.preemptible,
-                            reserved=accelerator.reserved,
-                        ),
-                    ),
-                )
-            ],
-        ),
-        guaranteed=tpu_api.QueuedResource.Guaranteed(
-            reserved=accelerator.reserved,
-        ),
-        queueing_policy=tpu_api.QueuedResource.QueueingPolicy(
-            valid_until_duration=Duration(seconds=int(timeout.total_seconds())),
-        ),
+  if use_startup_script:
+    main_command = '\n'.join(
+        task_test_config.set_up_cmds + task_test_config.run_model_cmds
     )
-
-    qr_operation = client.create_queued_resource(
-        parent=parent,
-        queued_resource_id=tpu_name,
-        queued_resource=queued_resource,
+    startup_script_command = startup_script.generate_startup_script(
+        main_command,
+        startup_script.status_location(startup_script_status_dir, tpu_name)
+        if startup_script_status_dir
+        else None,
     )
-    response = qr_operation.result()
-    logging.info(f'Create QR response: {response}')
-    # TODO(wcromar): do anything about failures
 
-    return response.name
+  metadata = {
+      'ssh-keys': f'{ssh_keys.user}:{ssh_keys.public}',
+      'startup-script': startup_script_command,
+  }
 
-  @task.sensor(
-      poke_interval=60, timeout=timeout.total_seconds(), mode='reschedule'
+  create_tpu_timeout_in_sec = int(timeout.total_seconds())
+  if task_test_config.timeout:
+    run_model_timeout_in_sec = int(task_test_config.timeout.total_seconds())
+  else:
+    run_model_timeout_in_sec = 7200  # Assume a default timeout of 2 hours
+  # Time to live (ttl) is combination of:
+  # 1) tpu provision timeout
+  # 2) tpu run model timeout
+  # 3) 1 hour buffer timeout (provision, post_process, etc)
+  ttl = create_tpu_timeout_in_sec + run_model_timeout_in_sec + 3600
+  labels = {
+      TTL: str(ttl),
+      **(labels or {}),
+  }
+
+  accelerator = task_test_config.accelerator
+  queued_resource = tpu_api.QueuedResource(
+      # TODO(ranran): enable configuration via `AcceleratorConfig`
+      tpu=tpu_api.QueuedResource.Tpu(
+          node_spec=[
+              tpu_api.QueuedResource.Tpu.NodeSpec(
+                  node_id=node_id,
+                  multi_node_params=multi_node_params,
+                  parent=parent,
+                  node=tpu_api.Node(
+                      accelerator_type=accelerator.name,
+                      description='noteardown',
+                      runtime_version=accelerator.runtime_version,
+                      network_config=tpu_api.NetworkConfig(
+                          network=accelerator.network,
+                          subnetwork=accelerator.subnetwork,
+                          enable_external_ips=True,
+                      ),
+                      metadata=metadata,
+                      labels=labels,
+                      scheduling_config=tpu_api.SchedulingConfig(
+                          preemptible=accelerator.preemptible,
+                          reserved=accelerator.reserved,
+                      ),
+                  ),
+              )
+          ],
+      ),
+      guaranteed=tpu_api.QueuedResource.Guaranteed(
+          reserved=accelerator.reserved,
+      ),
+      queueing_policy=tpu_api.QueuedResource.QueueingPolicy(
+          valid_until_duration=Duration(seconds=int(timeout.total_seconds())),
+      ),
   )
-  def wait_for_ready_queued_resource(qualified_name: str):
-    creds, _ = google.auth.default()
-    client = tpu_api.TpuClient(credentials=creds)
 
-    qr = client.get_queued_resource(name=qualified_name)
-    state = qr.state.state
-    logging.info(f'Queued resource state: {state.name}')
-    if qr.state.state == tpu_api.QueuedResourceState.State.ACTIVE:
-      return True
-    elif qr.state.state in [
-        tpu_api.QueuedResourceState.State.CREATING,
-        tpu_api.QueuedResourceState.State.WAITING_FOR_RESOURCES,
-        tpu_api.QueuedResourceState.State.ACCEPTED,
-        tpu_api.QueuedResourceState.State.PROVISIONING,
-    ]:
-      return False
-    else:
-      raise RuntimeError(f'Bad queued resource state {state.name}')
+  qr_operation = client.create_queued_resource(
+      parent=parent,
+      queued_resource_id=tpu_name,
+      queued_resource=queued_resource,
+  )
+  response = qr_operation.result()
+  logging.info(f'Create QR response: {response}')
+  # TODO(wcromar): do anything about failures
+
+  return response.name
+
+
+@task.sensor(poke_interval=60, timeout=3600, mode='reschedule')
+def wait_for_ready_queued_resource(qualified_name: str):
+  creds, _ = google.auth.default()
+  client = tpu_api.TpuClient(credentials=creds)
+
+  qr = client.get_queued_resource(name=qualified_name)
+  state = qr.state.state
+  logging.info(f'Queued resource state: {state.name}')
+  if qr.state.state == tpu_api.QueuedResourceState.State.ACTIVE:
+    return True
+  elif qr.state.state in [
+      tpu_api.QueuedResourceState.State.CREATING,
+      tpu_api.QueuedResourceState.State.WAITING_FOR_RESOURCES,
+      tpu_api.QueuedResourceState.State.ACCEPTED,
+      tpu_api.QueuedResourceState.State.PROVISIONING,
+  ]:
+    return False
+  else:
+    raise RuntimeError(f'Bad queued resource state {state.name}')
+
+
+@task.sensor(poke_interval=60, mode='reschedule')
+def wait_for_startup_script_status(
+    tpu_name: str, status_dir: str, num_slices: int
+) -> bool:
+  """Waits for the startup scripts of all slices to report an exit status.
+
+  Args:
+    tpu_name: Unique TPU name.
+    status_dir: GCS folder passed to `request_queued_resource`.
+    num_slices: Number of slices expected to report.
+
+  Returns:
+    True once every slice has reported.
+
+  Raises:
+    AirflowFailException: If any slice reports a non-zero exit status.
+  """
+  location = startup_script.status_location(status_dir, tpu_name)
+  reports = [
+      name
+      for name in gcs.obtain_file_list(location)
+      if name.endswith(f'/{startup_script.EXIT_STATUS}')
+  ]
+  logging.info(f'{len(reports)}/{num_slices} slices reported: {reports}')
+  if len(reports) < num_slices:
+    return False
+
+  bucket_name = location.removeprefix('gs://').split('/', 1)[0]
+  hook = GCSHook()
+  failed = []
+  for report in reports:
+    report_dir = report.rsplit('/', 1)[0]
+    try:
+      logs_tail = hook.download(
+          bucket_name, f'{report_dir}/{startup_script.LOGS_TAIL}'
+      )
+      logging.info(f'Log tail of {report_dir}:\n{logs_tail.decode()}')
+    except google.api_core.exceptions.NotFound:
+      # The upload of the log tail is allowed to fail, unlike the exit status.
+      logging.warning(f'No log tail was uploaded to {report_dir}.')
+    exit_status = hook.download(bucket_name, report).decode().strip()
+    logging.info(f'{report_dir} exited with status {exit_status}.')
+    if exit_status != '0':
+      failed.append(report_dir)
+
+  if failed:
+    raise AirflowFailException(f'Startup script failed on {failed}.')
+  return True
+
+
+def create_queued_resource(
+    tpu_name: airflow.XComArg,
+    gcp: gcp_config.GCPConfig,
+    ssh_keys: airflow.XComArg,
+    timeout: datetime.timedelta,
+    task_test_config: Union[
+        test_config.TpuVmTest, test_config.JSonnetTpuVmTest
+    ],
+    use_startup_script: bool = False,
+    startup_script_status_dir: Optional[str] = None,
+) -> Tuple[TaskGroup, airflow.XComArg]:
+  """Request a QueuedResource and wait until the nodes are created.
+
+  Args:
+    tpu_name: XCom value for unique TPU name.
+    accelerator: Description of TPU to create.
+    gcp: GCP project/zone configuration.
+    ssh_keys: XCom value for SSH keys to communicate with these TPUs.
+    timeout: Amount of time to wait for TPUs to be created.
+    task_test_config: Test config of the task.
+    use_startup_script: Indicator to use startup script.
+    startup_script_status_dir: If set, the startup script pushes its exit
+      status to this GCS folder, and completion is detected by a rescheduling
+      sensor instead of an SSH session that holds a worker slot.
+
+  Returns:
+    A TaskGroup for the entire create operation and an XCom value for the
+    qualified queued_resource name.
+  """
 
   def check_if_startup_script_end(
       queued_resource: airflow.XComArg, ssh_keys: airflow.XComArg
   ):
+    if startup_script_status_dir:
+      run_timeout = task_test_config.timeout or datetime.timedelta(hours=2)
+      return wait_for_startup_script_status.override(
+          task_id='check_if_startup_script_end',
+          timeout=run_timeout.total_seconds(),
+          owner=task_test_config.task_owner,
+      )(tpu_name, startup_script_status_dir, task_test_config.num_slices)
+
     check_script = startup_script.monitor_startup_script()
 
     return ssh_tpu.override(
@@ -231,15 +328,28 @@ def create_queued_resource(
         False,
     )
 
+  @task
+  def create_queued_resource_request(
+      tpu_name: str, ssh_keys: ssh.SshKeys
+  ) -> str:
+    return request_queued_resource(
+        tpu_name,
+        gcp,
+        ssh_keys,
+        timeout,
+        task_test_config,
+        use_startup_script,
+        startup_script_status_dir=startup_script_status_dir,
+    )
+
   with TaskGroup(group_id='create_queued_resource') as tg:
     qualified_name = create_queued_resource_request(tpu_name, ssh_keys)
+    wait_for_ready = wait_for_ready_queued_resource.override(
+        timeout=timeout.total_seconds()
+    )(qualified_name)
 
     if use_startup_script:
-      wait_for_ready_queued_resource(
-          qualified_name
-      ) >> check_if_startup_script_end(qualified_name, ssh_keys)
-    else:
-      wait_for_ready_queued_resource(qualified_name)
+      wait_for_ready >> check_if_startup_script_end(qualified_name, ssh_keys)
 
   return tg, qualified_name
 
@@ -442,73 +552,202 @@ def ssh_tpu(
   ssh_group_run(cmds)
 
 
+def _list_in_zones(
+    list_fn: Callable[[str], Iterable[Any]],
+    project_name: str,
+    zones: Iterable[Zone],
+) -> List[Any]:
+  """List resources in all zones concurrently.
+
+  Args:
+   list_fn: Function listing resources under a `projects/*/locations/*` parent.
+   project_name: The project of resources.
+   zones: Zones to list resources in.
+
+  Returns:
+    Resources from all zones, flattened into a single list.
+  """
+  parents = [
+      f'projects/{project_name}/locations/{zone.value}' for zone in zones
+  ]
+  if not parents:
+    return []
+
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=min(len(parents), _MAX_LIST_WORKERS)
+  ) as executor:
+    # `list_fn` returns a lazy pager, so materialize it in the worker thread.
+    results = executor.map(lambda parent: list(list_fn(parent)), parents)
+    return list(itertools.chain.from_iterable(results))
+
+
+def _delete_with_rate_limit(
+    delete_fn: Callable[[str], Any],
+    names: Iterable[str],
+    requests_per_minute: float,
+) -> List[str]:
+  """Issue delete requests concurrently without exceeding the API quota.
+
+  The returned long-running operations are not waited on. Completion is
+  tracked by the resource state on the next clean up run.
+
+  Args:
+   delete_fn: Function sending a delete request for a qualified name.
+   names: Qualified names of resources to delete.
+   requests_per_minute: Maximum delete requests to send per minute.
+
+  Returns:
+    Names of the started delete operations.
+
+  Raises:
+    google.api_core.exceptions.GoogleAPICallError: The first error of failed
+      delete requests, once all requests are sent.
+  """
+  names = list(names)
+  if not names:
+    return []
+
+  limiter = rate_limiter.TokenBucket(requests_per_minute)
+  errors = []
+
+  def delete(name: str) -> Optional[str]:
+    limiter.acquire()
+    try:
+      op = delete_fn(name)
+    except google.api_core.exceptions.NotFound:
+      logging.info(f'{name} is already deleted')
+      return None
+    except google.api_core.exceptions.GoogleAPICallError as e:
+      logging.error(f'Failed to delete {name}: {e}')
+      errors.append(e)
+      return None
+
+    logging.info(f'Delete operation {op.operation.name} started for {name}.')
+    return op.operation.name
+
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=min(len(names), _MAX_DELETE_WORKERS)
+  ) as executor:
+    op_names = [op_name for op_name in executor.map(delete, names) if op_name]
+
+  if errors:
+    logging.error(
+        f'{len(errors)} of {len(names)} delete requests failed, started'
+        f' {op_names}.'
+    )
+    raise errors[0]
+  return op_names
+
+
+def _idle_queued_resources(
+    queued_resources: Iterable[tpu_api.QueuedResource],
+) -> List[tpu_api.QueuedResource]:
+  """Returns queued resources in FAILED or SUSPENDED states."""
+  return [
+      qr
+      for qr in queued_resources
+      if qr.state.state
+      in (
+          tpu_api.QueuedResourceState.State.FAILED,
+          tpu_api.QueuedResourceState.State.SUSPENDED,
+      )
+  ]
+
+
+def _expired_nodes(
+    nodes: Iterable[tpu_api.Node], current_time: datetime.datetime
+) -> List[Tuple[tpu_api.Node, datetime.timedelta]]:
+  """Returns expired nodes, paired with how long they exceeded their TTL."""
+  expired = []
+  for node in nodes:
+    ttl = int(node.labels[TTL]) if TTL in node.labels else None
+    if not ttl:
+      continue
+
+    active_time = current_time - node.create_time
+    delta = active_time.total_seconds() - ttl
+    if delta > 0:
+      expired.append((node, datetime.timedelta(seconds=delta)))
+  return expired
+
+
 @task
 def clean_up_idle_queued_resources(
-    project_name: str, zones: Iterable[str]
-) -> None:
+    project_name: str,
+    zones: Iterable[Zone],
+    requests_per_minute: float = DELETE_REQUESTS_PER_MINUTE,
+) -> List[str]:
   """Clean up queued resources in FAILED or SUSPENDED states.
 
   Args:
    project_name: The project of resources.
    zones: Available zones to clean up for the project.
+   requests_per_minute: Maximum delete requests to send per minute.
+
+  Returns:
+    Names of the started delete operations.
   """
   creds, _ = google.auth.default()
   client = tpu_api.TpuClient(credentials=creds)
 
   logging.info(f'Cleaning up resources in project {project_name}.')
-  for zone in zones:
-    logging.info(f'Checking in zone {zone.value}.')
-    parent = f'projects/{project_name}/locations/{zone.value}'
-    request = tpu_api.types.ListQueuedResourcesRequest(parent=parent)
-    responses = client.list_queued_resources(request)
-
-    for qr in responses:
-      state = qr.state.state
-      if (
-          state == tpu_api.QueuedResourceState.State.FAILED
-          or state == tpu_api.QueuedResourceState.State.SUSPENDED
-      ):
-        logging.info(f'Deleting {qr.name} in {state.name} status.')
-        client.delete_queued_resource(name=qr.name)
+  queued_resources = _list_in_zones(
+      lambda parent: client.list_queued_resources(parent=parent),
+      project_name,
+      zones,
+  )
+  logging.info(f'Found {len(queued_resources)} queued resources.')
+
+  idle_queued_resources = _idle_queued_resources(queued_resources)
+  for qr in idle_queued_resources:
+    logging.info(f'Deleting {qr.name} in {qr.state.state.name} status.')
+
+  return _delete_with_rate_limit(
+      lambda name: client.delete_queued_resource(name=name),
+      [qr.name for qr in idle_queued_resources],
+      requests_per_minute,
+  )
 
 
 @task
-def clean_up_idle_nodes(project_name: str, zones: Iterable[str]) -> None:
+def clean_up_idle_nodes(
+    project_name: str,
+    zones: Iterable[Zone],
+    requests_per_minute: float = DELETE_REQUESTS_PER_MINUTE,
+) -> List[str]:
   """Clean up TPU nodes that are expired.
 
   Args:
    project_name: The project of resources.
    zones: Available zones to clean up for the project.
+   requests_per_minute: Maximum delete requests to send per minute.
+
+  Returns:
+    Names of the started delete operations.
   """
   creds, _ = google.auth.default()
   client = tpu_api.TpuClient(credentials=creds)
 
   logging.info(f'Cleaning up nodes in project {project_name}.')
-  for zone in zones:
-    logging.info(f'Checking in zone {zone.value}.')
-    parent = f'projects/{project_name}/locations/{zone.value}'
-    request = tpu_api.types.ListNodesRequest(parent=parent)
-    responses = client.list_nodes(request)
-
-    for node in responses:
-      ttl = int(node.labels[TTL]) if TTL in node.labels else None
-      if ttl:
-        create_time = node.create_time
-        current_time = datetime.datetime.now(datetime.timezone.utc)
-        logging.info(
-            (
-                f'Checking node {node.name}: create_time is {create_time},'
-                f' and current_time is {current_time}.'
-            )
+  nodes = _list_in_zones(
+      lambda parent: client.list_nodes(parent=parent),
+      project_name,
+      zones,
+  )
+  logging.info(f'Found {len(nodes)} nodes.')
+
+  current_time = datetime.datetime.now(datetime.timezone.utc)
+  expired_nodes = _expired_nodes(nodes, current_time)
+  for node, delta in expired_nodes:
+    logging.info(
+        (
+            f'Deleting node {node.name} due to exceeding its time to'
+            f' live (TTL) by {delta}.'
         )
-        active_time = current_time - create_time
-        delta = active_time.total_seconds() - ttl
-        if delta > 0:
-          datetime_delta = str(datetime.timedelta(seconds=delta))
-          logging.info(
-              (
-                  f'Deleting node {node.name} due to exceeding its time to'
-                  f' live (TTL) by {datetime_delta}.'
-              )
-          )
-          client.delete_node(name=node.name)
+    )
+
+  return _delete_with_rate_limit(
+      lambda name: client.delete_node(name=name),
+      [node.name for node, _ in expired_nodes],
+      requests_per_minute,
+  )
@@ -0,0 +1,373 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to lease TPUs from a warm pool of queued resources.
+
+Pool membership and leases are tracked by node labels:
+
+- `warm-pool`: the pool key, derived from the accelerator type, runtime
+  version and setup script, so a leased node is already set up for the test.
+- `lease`: the lease holder, or `free` when the node is idle.
+- `lease-expiry`: unix seconds after which a lease may be taken over.
+
+Pool nodes keep the `ttl` label, so `tpu.clean_up_idle_nodes` still deletes
+nodes that are leaked or exceed the pool lifetime.
+
+TPU node updates can't be made conditional, so a lease is first claimed by
+writing an object per node under `gcs_bucket.TPU_POOL_LEASE_DIR`, conditional
+on its generation, and only the winner of a claim updates the node labels.
+
+Only single-slice TPUs are pooled. Multi-slice TPUs are leased without the
+`warm-pool` label, so they are deleted when released.
+"""
+
+import datetime
+import hashlib
+import json
+import re
+import time
+from typing import Dict, List, Optional, Union
+import uuid
+
+from absl import logging
+from airflow.decorators import task
+from google.protobuf import field_mask_pb2
+import google.api_core.exceptions
+import google.auth
+from google.cloud import storage
+import google.cloud.tpu_v2alpha1 as tpu_api
+
+from dags import gcs_bucket
+from xlml.apis import gcp_config, test_config
+from xlml.utils import ssh, tpu
+
+
+POOL = 'warm-pool'
+LEASE = 'lease'
+LEASE_EXPIRY = 'lease-expiry'
+FREE = 'free'
+
+# Nodes are recycled by `tpu.clean_up_idle_nodes` once they exceed this age.
+DEFAULT_POOL_TTL = datetime.timedelta(hours=24)
+
+# Brings a previously used TPU back to a clean state before the next test.
+RESET_SCRIPT = (
+    'set -x; '
+    'sudo lsof -t /dev/accel* /dev/vfio/* 2>/dev/null | xargs -r sudo kill -9; '
+    'sudo rm -f /tmp/libtpu_lockfile; '
+    'sudo rm -rf /tmp/tpu_logs; '
+    'sudo rm -f /tmp/main_process_id.txt /tmp/process_exit_status.txt /tmp/logs'
+)
+
+
+def label_value(value: str) -> str:
+  """Converts a string to a valid label value."""
+  return re.sub(r'[^a-z0-9_-]', '-', value.lower())[:63]
+
+
+def pool_key(
+    task_test_config: Union[test_config.TpuVmTest, test_config.JSonnetTpuVmTest]
+) -> str:
+  """Returns the pool of TPUs that are set up for the given test."""
+  accelerator = task_test_config.accelerator
+  setup_hash = hashlib.sha256(
+      '\n'.join([
+          accelerator.runtime_version,
+          str(task_test_config.num_slices),
+          task_test_config.setup_script or '',
+      ]).encode()
+  ).hexdigest()[:10]
+  return label_value(f'{accelerator.name}-{setup_hash}')
+
+
+def _lease_expired(node: tpu_api.Node, now: float) -> bool:
+  expiry = node.labels.get(LEASE_EXPIRY)
+  return bool(expiry) and int(expiry) < now
+
+
+def _remaining_ttl(node: tpu_api.Node, now: float) -> float:
+  ttl = int(node.labels[tpu.TTL]) if tpu.TTL in node.labels else 0
+  return node.create_time.timestamp() + ttl - now
+
+
+def _leasable_nodes(
+    nodes: List[tpu_api.Node],
+    key: str,
+    lease_seconds: float,
+    now: float,
+) -> List[tpu_api.Node]:
+  """Returns idle pool nodes that can host a lease of the given length."""
+  return [
+      node
+      for node in nodes
+      if node.labels.get(POOL) == key
+      and node.state == tpu_api.Node.State.READY
+      and (node.labels.get(LEASE) == FREE or _lease_expired(node, now))
+      # Avoid nodes that would be cleaned up in the middle of a test.
+      and _remaining_ttl(node, now) > lease_seconds
+  ]
+
+
+def _update_labels(
+    client: tpu_api.TpuClient, node: tpu_api.Node, labels: Dict[str, str]
+) -> tpu_api.Node:
+  node.labels.update(labels)
+  op = client.update_node(
+      node=node, update_mask=field_mask_pb2.FieldMask(paths=['labels'])
+  )
+  return op.result()
+
+
+def _claim_blob(node_name: str, lease_dir: str) -> storage.Blob:
+  bucket_name, _, prefix = lease_dir.removeprefix('gs://').partition('/')
+  name = f'{prefix.strip("/")}/{node_name}' if prefix else node_name
+  return storage.Client().bucket(bucket_name).blob(name)
+
+
+def _claim(
+    node_name: str, lease_id: str, lease_expiry: int, now: float, lease_dir: str
+) -> bool:
+  """Claims the lease of a node, unless it is claimed by an active lease.
+
+  The claim is written conditionally on the generation that was read, so only
+  one of concurrent claims succeeds.
+  """
+  blob = _claim_blob(node_name, lease_dir)
+  try:
+    blob.reload()
+  except google.api_core.exceptions.NotFound:
+    generation = 0
+  else:
+    generation = blob.generation
+    try:
+      claim = json.loads(blob.download_as_bytes(if_generation_match=generation))
+    except (
+        google.api_core.exceptions.NotFound,
+        google.api_core.exceptions.PreconditionFailed,
+    ):
+      # Claimed or released since it was read.
+      return False
+    if claim['expiry'] >= now:
+      return False
+
+  try:
+    blob.upload_from_string(
+        json.dumps({'lease': lease_id, 'expiry': lease_expiry}),
+        content_type='application/json',
+        if_generation_match=generation,
+    )
+  except google.api_core.exceptions.PreconditionFailed:
+    return False
+  return True
+
+
+def _release_claim(node_name: str, lease_id: str, lease_dir: str) -> None:
+  """Deletes the claim of a node, if it is still held by the lease."""
+  blob = _claim_blob(node_name, lease_dir)
+  try:
+    blob.reload()
+    claim = json.loads(
+        blob.download_as_bytes(if_generation_match=blob.generation)
+    )
+    if claim['lease'] == lease_id:
+      blob.delete(if_generation_match=blob.generation)
+  except (
+      google.api_core.exceptions.NotFound,
+      google.api_core.exceptions.PreconditionFailed,
+  ):
+    # Never claimed, e.g. a node created for the lease, or claimed again.
+    pass
+
+
+def _try_lease(
+    client: tpu_api.TpuClient,
+    node: tpu_api.Node,
+    lease_id: str,
+    lease_expiry: int,
+    now: float,
+    lease_dir: str,
+) -> bool:
+  """Claims a node, then records the lease in its labels."""
+  try:
+    if not _claim(node.name, lease_id, lease_expiry, now, lease_dir):
+      logging.info(f'{node.name} was leased concurrently.')
+      return False
+  except google.api_core.exceptions.GoogleAPICallError as e:
+    logging.warning(f'Failed to claim {node.name}: {e}')
+    return False
+
+  try:
+    _update_labels(
+        client, node, {LEASE: lease_id, LEASE_EXPIRY: str(lease_expiry)}
+    )
+  except google.api_core.exceptions.GoogleAPICallError as e:
+    logging.warning(f'Failed to lease {node.name}: {e}')
+    _release_claim(node.name, lease_id, lease_dir)
+    return False
+  return True
+
+
+@task(multiple_outputs=True)
+def lease_queued_resource(
+    tpu_name: str,
+    gcp: gcp_config.GCPConfig,
+    ssh_keys: ssh.SshKeys,
+    timeout: datetime.timedelta,
+    task_test_config: Union[
+        test_config.TpuVmTest, test_config.JSonnetTpuVmTest
+    ],
+    pool_ttl: datetime.timedelta = DEFAULT_POOL_TTL,
+    setup_script: Optional[str] = None,
+    lease_dir: str = gcs_bucket.TPU_POOL_LEASE_DIR,
+) -> Dict[str, str]:
+  """Lease a TPU from the warm pool, or create one if the pool is exhausted.
+
+  Args:
+    tpu_name: Unique TPU name, used if a new TPU is created.
+    gcp: GCP project/zone configuration.
+    ssh_keys: SSH keys to communicate with these TPUs.
+    timeout: Amount of time to wait for TPUs to be created.
+    task_test_config: Test config of the task.
+    pool_ttl: Time after which pool TPUs are recycled.
+    setup_script: Setup script for a new TPU, if different from the test
+      config's (e.g. wrapped with `setup_cache.with_setup_cache`).
+    lease_dir: GCS folder holding the lease claims of pool TPUs.
+
+  Returns:
+    The qualified queued resource name, the lease ID, and the commands that
+    prepare the TPU for the test: the full setup script for a new TPU, or a
+    reset script for a warm one.
+  """
+  creds, _ = google.auth.default()
+  client = tpu_api.TpuClient(credentials=creds)
+
+  key = pool_key(task_test_config)
+  lease_id = uuid.uuid4().hex[:16]
+  now = time.time()
+  run_timeout = task_test_config.timeout or datetime.timedelta(hours=2)
+  # Leases outlive the test by 1 hour to cover post processing and retries.
+  lease_seconds = (run_timeout + datetime.timedelta(hours=1)).total_seconds()
+  lease_expiry = int(now + timeout.total_seconds() + lease_seconds)
+
+  if task_test_config.num_slices == 1:
+    parent = f'projects/{gcp.project_name}/locations/{gcp.zone}'
+    nodes = list(client.list_nodes(parent=parent))
+    for node in _leasable_nodes(nodes, key, lease_seconds, now):
+      if node.queued_resource and _try_lease(
+          client, node, lease_id, lease_expiry, now, lease_dir
+      ):
+        logging.info(f'Leased {node.name} from warm pool {key}.')
+        return {
+            'qualified_name': node.queued_resource,
+            'lease_id': lease_id,
+            'setup_cmds': RESET_SCRIPT,
+        }
+
+  logging.info(f'No TPU available in warm pool {key}. Creating {tpu_name}.')
+  labels = {
+      tpu.TTL: str(int(pool_ttl.total_seconds())),
+      LEASE: lease_id,
+      LEASE_EXPIRY: str(lease_expiry),
+  }
+  if task_test_config.num_slices == 1:
+    labels[POOL] = key
+  qualified_name = tpu.request_queued_resource(
+      tpu_name, gcp, ssh_keys, timeout, task_test_config, labels=labels
+  )
+  return {
+      'qualified_name': qualified_name,
+      'lease_id': lease_id,
+      'setup_cmds': setup_script or task_test_config.setup_script,
+  }
+
+
+def _pool_nodes(
+    client: tpu_api.TpuClient, parent: str, key: str
+) -> List[tpu_api.Node]:
+  return [
+      node
+      for node in client.list_nodes(parent=parent)
+      if node.labels.get(POOL) == key
+  ]
+
+
+@task(trigger_rule='all_done')
+def release_queued_resource(
+    qualified_name: Optional[str],
+    lease_id: Optional[str],
+    pool_size: int,
+    lease_dir: str = gcs_bucket.TPU_POOL_LEASE_DIR,
+) -> None:
+  """Return a leased TPU to the warm pool, or delete it if the pool is full.
+
+  Deleted nodes leave a SUSPENDED queued resource behind, which is removed by
+  `tpu.clean_up_idle_queued_resources`.
+
+  Args:
+    qualified_name: The qualified name of the leased queued resource.
+    lease_id: The ID returned by `lease_queued_resource`.
+    pool_size: Number of idle TPUs to keep in the pool.
+    lease_dir: GCS folder holding the lease claims of pool TPUs.
+  """
+  if not qualified_name:
+    logging.info('No lease to release.')
+    return
+
+  creds, _ = google.auth.default()
+  client = tpu_api.TpuClient(credentials=creds)
+
+  try:
+    qr = client.get_queued_resource(name=qualified_name)
+  except google.api_core.exceptions.NotFound:
+    logging.info(f'{qualified_name} not found')
+    return
+
+  # Multi-slice node specs have no node ID, so nodes are found by their queued
+  # resource, which may be named with the project number.
+  qr_id = qualified_name.rsplit('/', 1)[-1]
+  for parent in {node_spec.parent for node_spec in qr.tpu.node_spec}:
+    nodes = [
+        node
+        for node in client.list_nodes(parent=parent)
+        if node.queued_resource.rsplit('/', 1)[-1] == qr_id
+    ]
+    if not nodes:
+      logging.info(f'Nodes of {qualified_name} are already deleted')
+
+    for node in nodes:
+      if node.labels.get(LEASE) != lease_id:
+        logging.warning(f'{node.name} is no longer leased by {lease_id}.')
+        continue
+
+      key = node.labels.get(POOL)
+      idle_nodes = [
+          n
+          for n in (_pool_nodes(client, parent, key) if key else [])
+          if n.labels.get(LEASE) == FREE
+      ]
+      now = time.time()
+      # The claim is released first, so the node isn't leased before it is
+      # marked as free.
+      _release_claim(node.name, lease_id, lease_dir)
+      if (
+          key
+          and node.state == tpu_api.Node.State.READY
+          and len(idle_nodes) < pool_size
+          and _remaining_ttl(node, now) > 0
+      ):
+        _update_labels(client, node, {LEASE: FREE, LEASE_EXPIRY: ''})
+        logging.info(f'Returned {node.name} to warm pool.')
+      else:
+        op = client.delete_node(name=node.name)
+        logging.info(f'Delete node state: {op}')
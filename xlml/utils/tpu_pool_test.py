@@ -0,0 +1,143 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for tpu_pool.py."""
+
+import datetime
+import json
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from google.api_core import exceptions
+from google.cloud import storage
+import google.cloud.tpu_v2alpha1 as tpu_api
+from xlml.utils import tpu, tpu_pool
+
+
+_NOW = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _node(
+    name: str,
+    pool: str = "v4-8-abc",
+    lease: str = tpu_pool.FREE,
+    lease_expiry: str = "",
+    age: datetime.timedelta = datetime.timedelta(hours=1),
+    ttl: datetime.timedelta = tpu_pool.DEFAULT_POOL_TTL,
+    state: tpu_api.Node.State = tpu_api.Node.State.READY,
+) -> tpu_api.Node:
+  return tpu_api.Node(
+      name=name,
+      state=state,
+      create_time=_NOW - age,
+      labels={
+          tpu.TTL: str(int(ttl.total_seconds())),
+          tpu_pool.POOL: pool,
+          tpu_pool.LEASE: lease,
+          tpu_pool.LEASE_EXPIRY: lease_expiry,
+      },
+  )
+
+
+class LeasableNodesTest(parameterized.TestCase, absltest.TestCase):
+
+  @parameterized.named_parameters(
+      ("free", _node("n"), True),
+      ("other_pool", _node("n", pool="v5e-4-abc"), False),
+      ("leased", _node("n", lease="abc", lease_expiry="1999999999"), False),
+      ("expired_lease", _node("n", lease="abc", lease_expiry="1"), True),
+      ("creating", _node("n", state=tpu_api.Node.State.CREATING), False),
+      ("near_ttl", _node("n", age=datetime.timedelta(hours=23.5)), False),
+  )
+  def test_leasable_nodes(self, node: tpu_api.Node, leasable: bool):
+    nodes = tpu_pool._leasable_nodes(
+        [node],
+        key="v4-8-abc",
+        lease_seconds=datetime.timedelta(hours=1).total_seconds(),
+        now=_NOW.timestamp(),
+    )
+
+    self.assertEqual(len(nodes) == 1, leasable)
+
+  def test_label_value(self):
+    self.assertEqual(tpu_pool.label_value("V5LITE_Pod.4"), "v5lite_pod-4")
+    self.assertLen(tpu_pool.label_value("a" * 100), 63)
+
+
+class ClaimTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.blob = mock.Mock(generation=7)
+    client = self.enter_context(mock.patch.object(storage, "Client"))
+    client.return_value.bucket.return_value.blob.return_value = self.blob
+    self.now = _NOW.timestamp()
+
+  def _claim(self) -> bool:
+    return tpu_pool._claim(
+        "projects/p/locations/z/nodes/n",
+        "lease",
+        int(self.now) + 3600,
+        self.now,
+        "gs://bucket/leases",
+    )
+
+  def _claimed_until(self, expiry: float) -> None:
+    self.blob.download_as_bytes.return_value = json.dumps(
+        {"lease": "other", "expiry": expiry}
+    ).encode()
+
+  def test_claims_unclaimed_node(self):
+    self.blob.reload.side_effect = exceptions.NotFound("no claim")
+
+    self.assertTrue(self._claim())
+    self.assertEqual(
+        self.blob.upload_from_string.call_args.kwargs["if_generation_match"], 0
+    )
+
+  def test_takes_over_expired_claim(self):
+    self._claimed_until(self.now - 1)
+
+    self.assertTrue(self._claim())
+    self.assertEqual(
+        self.blob.upload_from_string.call_args.kwargs["if_generation_match"], 7
+    )
+
+  def test_skips_active_claim(self):
+    self._claimed_until(self.now + 60)
+
+    self.assertFalse(self._claim())
+    self.blob.upload_from_string.assert_not_called()
+
+  def test_loses_concurrent_claim(self):
+    self.blob.reload.side_effect = exceptions.NotFound("no claim")
+    self.blob.upload_from_string.side_effect = exceptions.PreconditionFailed(
+        "claimed"
+    )
+
+    self.assertFalse(self._claim())
+
+  def test_releases_own_claim_only(self):
+    self._claimed_until(self.now + 60)
+
+    tpu_pool._release_claim("n", "lease", "gs://bucket/leases")
+    self.blob.delete.assert_not_called()
+
+    tpu_pool._release_claim("n", "other", "gs://bucket/leases")
+    self.blob.delete.assert_called_once_with(if_generation_match=7)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,176 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cluster-wide cache of JobSet pod statuses, shared by XPK sensors.
+
+Instead of every sensor listing the pods of its own workload, the first
+sensor on a worker lists the pods of all JobSets in the cluster with one call.
+The result is written to the worker's local disk and answers queries of any
+sensor on the same cluster for `CACHE_TTL`.
+"""
+
+import dataclasses
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from absl import logging
+from kubernetes import client as k8s_client
+
+from xlml.utils import gke
+
+
+CACHE_TTL = datetime.timedelta(seconds=30)
+CACHE_DIR = os.environ.get(
+    "WORKLOAD_STATUS_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "workload_status_cache"),
+)
+JOBSET_NAME_LABEL = "jobset.sigs.k8s.io/jobset-name"
+
+
+@dataclasses.dataclass
+class ContainerStatus:
+  name: str
+  waiting_reason: Optional[str] = None
+  waiting_message: Optional[str] = None
+  terminated_reason: Optional[str] = None
+  exit_code: Optional[int] = None
+
+
+@dataclasses.dataclass
+class PodStatus:
+  """The parts of a pod's status that XPK sensors check."""
+
+  name: str
+  namespace: str
+  phase: str
+  num_containers: int
+  container_statuses: List[ContainerStatus] = dataclasses.field(
+      default_factory=list
+  )
+  node_name: Optional[str] = None
+
+  @classmethod
+  def from_pod(cls, pod: k8s_client.V1Pod) -> "PodStatus":
+    container_statuses = []
+    for status in pod.status.container_statuses or []:
+      waiting = status.state.waiting if status.state else None
+      terminated = status.state.terminated if status.state else None
+      container_statuses.append(
+          ContainerStatus(
+              name=status.name,
+              waiting_reason=waiting.reason if waiting else None,
+              waiting_message=waiting.message if waiting else None,
+              terminated_reason=terminated.reason if terminated else None,
+              exit_code=terminated.exit_code if terminated else None,
+          )
+      )
+    return cls(
+        name=pod.metadata.name,
+        namespace=pod.metadata.namespace,
+        phase=pod.status.phase,
+        num_containers=len(pod.spec.containers),
+        container_statuses=container_statuses,
+        node_name=pod.spec.node_name,
+    )
+
+  @classmethod
+  def from_dict(cls, pod: Dict[str, Any]) -> "PodStatus":
+    return cls(
+        **{
+            **pod,
+            "container_statuses": [
+                ContainerStatus(**status)
+                for status in pod["container_statuses"]
+            ],
+        }
+    )
+
+
+def _list_cluster_pods(
+    project_id: str, region: str, cluster_name: str
+) -> Dict[str, List[Dict[str, Any]]]:
+  """Lists the pods of all JobSets in a cluster, grouped by JobSet."""
+  core_api = k8s_client.CoreV1Api(
+      gke.get_authenticated_client(project_id, region, cluster_name)
+  )
+  pods = core_api.list_namespaced_pod(
+      namespace="default", label_selector=JOBSET_NAME_LABEL
+  )
+  workloads = {}
+  for pod in pods.items:
+    workloads.setdefault(pod.metadata.labels[JOBSET_NAME_LABEL], []).append(
+        dataclasses.asdict(PodStatus.from_pod(pod))
+    )
+  logging.info(
+      f"Listed {len(pods.items)} pods of {len(workloads)} workloads in"
+      f" {cluster_name}."
+  )
+  return workloads
+
+
+def workload_pods(
+    project_id: str,
+    region: str,
+    cluster_name: str,
+    workload_id: str,
+    cache_ttl: datetime.timedelta = CACHE_TTL,
+) -> List[PodStatus]:
+  """Returns the pod statuses of a workload, at most `cache_ttl` old.
+
+  Args:
+    project_id: Project of the cluster.
+    region: Region of the cluster.
+    cluster_name: Name of the cluster.
+    workload_id: Name of the workload's JobSet.
+    cache_ttl: Age after which the cluster's pods are listed again.
+
+  Returns:
+    The statuses of the workload's pods, empty if it has none.
+  """
+  cluster_key = f"{project_id}/{region}/{cluster_name}"
+  path = os.path.join(
+      CACHE_DIR, hashlib.sha256(cluster_key.encode()).hexdigest()[:16]
+  )
+  os.makedirs(CACHE_DIR, exist_ok=True)
+  # The lock is held while listing, so concurrent sensors wait for one list
+  # call instead of making their own.
+  with open(f"{path}.lock", "a", encoding="utf-8") as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    try:
+      with open(f"{path}.json", encoding="utf-8") as f:
+        cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+      cache = None
+
+    if cache is None or time.time() - cache["time"] > cache_ttl.total_seconds():
+      cache = {
+          "time": time.time(),
+          "workloads": _list_cluster_pods(project_id, region, cluster_name),
+      }
+      with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+      os.replace(f"{path}.tmp", f"{path}.json")
+    else:
+      logging.info(f"Using pod statuses of {cluster_key} from cache.")
+
+  return [
+      PodStatus.from_dict(pod)
+      for pod in cache["workloads"].get(workload_id, [])
+  ]
@@ -0,0 +1,104 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for workload_status.py."""
+
+import datetime
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from kubernetes import client as k8s_client
+from xlml.utils import workload_status
+
+
+def _pod(name: str, workload_id: str, phase: str) -> k8s_client.V1Pod:
+  return k8s_client.V1Pod(
+      metadata=k8s_client.V1ObjectMeta(
+          name=name,
+          namespace="default",
+          labels={workload_status.JOBSET_NAME_LABEL: workload_id},
+      ),
+      spec=k8s_client.V1PodSpec(containers=[k8s_client.V1Container(name="c")]),
+      status=k8s_client.V1PodStatus(
+          phase=phase,
+          container_statuses=[
+              k8s_client.V1ContainerStatus(
+                  name="c",
+                  image="image",
+                  image_id="",
+                  ready=False,
+                  restart_count=0,
+                  state=k8s_client.V1ContainerState(
+                      terminated=k8s_client.V1ContainerStateTerminated(
+                          exit_code=1, reason="Error"
+                      )
+                  ),
+              )
+          ],
+      ),
+  )
+
+
+class WorkloadPodsTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(
+        mock.patch.object(
+            workload_status,
+            "CACHE_DIR",
+            self.enter_context(tempfile.TemporaryDirectory()),
+        )
+    )
+    self.enter_context(
+        mock.patch.object(workload_status.gke, "get_authenticated_client")
+    )
+    core_api = self.enter_context(
+        mock.patch.object(k8s_client, "CoreV1Api")
+    ).return_value
+    self.list_pods = core_api.list_namespaced_pod
+    self.list_pods.return_value = k8s_client.V1PodList(
+        items=[
+            _pod("a-0", "a", "Running"),
+            _pod("b-0", "b", "Failed"),
+            _pod("a-1", "a", "Pending"),
+        ]
+    )
+
+  def test_groups_pods_by_workload(self):
+    pods = workload_status.workload_pods("p", "r", "c", "a")
+
+    self.assertEqual([pod.name for pod in pods], ["a-0", "a-1"])
+    self.assertEqual(pods[0].container_statuses[0].exit_code, 1)
+    self.assertEqual(workload_status.workload_pods("p", "r", "c", "other"), [])
+
+  def test_shares_list_across_workloads(self):
+    workload_status.workload_pods("p", "r", "c", "a")
+    pods = workload_status.workload_pods("p", "r", "c", "b")
+
+    self.assertEqual(pods[0].phase, "Failed")
+    self.list_pods.assert_called_once()
+
+  def test_lists_again_after_ttl(self):
+    workload_status.workload_pods("p", "r", "c", "a")
+    workload_status.workload_pods(
+        "p", "r", "c", "a", cache_ttl=datetime.timedelta(0)
+    )
+
+    self.assertEqual(self.list_pods.call_count, 2)
+
+
+if __name__ == "__main__":
+  absltest.main()
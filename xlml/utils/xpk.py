@@ -15,25 +15,92 @@
 """Utilities to run workloads with xpk
 (https://github.com/AI-Hypercomputer/xpk)."""
 
+import concurrent.futures
+import collections
+import contextlib
+import dataclasses
+import datetime
+import fcntl
+import hashlib
+from http import HTTPStatus
+import math
 import os
+import shutil
+import subprocess
 import tempfile
+import time
 import uuid
 import sys
 import re
-from typing import Tuple
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 from absl import logging
 from airflow.decorators import task
 from airflow.exceptions import AirflowFailException
 from airflow.hooks.subprocess import SubprocessHook
-from kubernetes import client as k8s_client
+from airflow.models import TaskInstance, Variable
+from airflow.operators.python import get_current_context
+from airflow.utils.context import Context
+from kubernetes import client as k8s_client, watch
+from kubernetes.client.rest import ApiException
 from google.cloud import compute_v1
-from xlml.apis import metric_config
-from xlml.utils import gke, composer
+from xlml.apis import gcs, metric_config
+from xlml.utils import gke, composer, workload_status, xpk_jobset
 from dags.common.vm_resource import GpuVersion
 
 # NOTE: This version needs to be pinned to ensure compatibility when using
 # xpk.py for workload creation.
 MAIN_BRANCH = "v0.17.3"
+XPK_REPO = "https://github.com/AI-Hypercomputer/xpk"
+
+# XPK installations are cached on the worker's local disk, keyed by branch,
+# commit and extra packages.
+XPK_CACHE_DIR = os.environ.get(
+    "XPK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "xpk_cache")
+)
+VERTEX_AI_PACKAGES = (
+    "google-cloud-aiplatform",
+    "cloud-accelerator-diagnostics",
+)
+
+# Workloads submitted in parallel by `run_workloads`.
+BATCH_LAUNCH_CONCURRENCY = 8
+
+# Lines of the last pod's log printed when a workload finishes.
+LOG_TAIL_LINES = 1000
+# Extra seconds of logs re-read on each poke, to tolerate clock skew between
+# the worker and the node. Lines already seen are skipped.
+_LOG_CURSOR_OVERLAP_SECONDS = 60
+# How far the saved log cursor may fall behind the last line read before it is
+# saved again without a new step.
+_LOG_CURSOR_SAVE_INTERVAL = datetime.timedelta(minutes=5)
+COMPLETED_STEP_PATTERN = r"completed step: (\d+)"
+_COMPLETED_STEP = re.compile(COMPLETED_STEP_PATTERN)
+# Default time allowed for a workload to log the step it is waited for.
+REACH_STEP_TIMEOUT = datetime.timedelta(hours=1)
+
+# Milestones of a workload run, in order, each with the stage that ends at it.
+# Stages are written as metrics with the "orchestration/" prefix.
+TIMING_STAGES = (
+    ("launched", None),
+    ("jobset_created", "xpk_setup_seconds"),
+    ("pods_created", "admission_seconds"),
+    ("pods_scheduled", "scheduling_seconds"),
+    ("pods_initialized", "initialization_seconds"),
+    ("containers_started", "container_start_seconds"),
+    ("first_log", "first_log_seconds"),
+    ("first_step", "first_step_seconds"),
+    ("last_step", "training_seconds"),
+    ("pods_finished", "finish_seconds"),
+)
+_POD_CONDITION_MILESTONES = {
+    "PodScheduled": "pods_scheduled",
+    "Initialized": "pods_initialized",
+}
+
+# Bounds on waiting for a disrupted workload to reach its step and restart.
+DISRUPTION_TIMEOUT = datetime.timedelta(hours=2)
+# Age of pod statuses accepted while waiting for pods to run.
+_DISRUPTION_POLL_INTERVAL = datetime.timedelta(seconds=5)
 
 # Duration = past 7 days
 LOGGING_URL_FORMAT = (
@@ -50,11 +117,12 @@ LOGGING_URL_FORMAT = (
 )
 
 
-def get_xpk_setup_cmd(tmpdir, branch: str = MAIN_BRANCH):
-  clone_branch = (
-      f"git clone --branch {branch} https://github.com/AI-Hypercomputer/xpk"
-      f" {tmpdir}/xpk"
-  )
+def get_xpk_setup_cmd(
+    tmpdir, branch: str = MAIN_BRANCH, commit: Optional[str] = None
+):
+  clone_branch = f"git clone --branch {branch} {XPK_REPO} {tmpdir}/xpk"
+  if commit:
+    clone_branch += f" && git -C {tmpdir}/xpk checkout {commit}"
 
   bash_setup = "set -xue"
 
@@ -74,6 +142,119 @@ def get_xpk_setup_cmd(tmpdir, branch: str = MAIN_BRANCH):
   return cmds
 
 
+def _resolve_xpk_commit(branch: str) -> str:
+  """Returns the commit that an xpk branch or tag points to."""
+  output = subprocess.run(
+      ["git", "ls-remote", XPK_REPO, branch, f"{branch}^{{}}"],
+      check=True,
+      capture_output=True,
+      text=True,
+      timeout=60,
+  ).stdout
+  refs = {
+      ref: sha for sha, ref in (line.split() for line in output.splitlines())
+  }
+  # Annotated tags resolve to the commit through the peeled `^{}` ref.
+  for ref in (f"refs/tags/{branch}^{{}}", f"refs/tags/{branch}"):
+    if ref in refs:
+      return refs[ref]
+  if f"refs/heads/{branch}" in refs:
+    return refs[f"refs/heads/{branch}"]
+  raise ValueError(f"xpk branch {branch} not found in {XPK_REPO}")
+
+
+def _build_xpk_venv(
+    cache_entry: str, branch: str, commit: str, extra_packages: Sequence[str]
+) -> None:
+  shutil.rmtree(cache_entry, ignore_errors=True)
+  os.makedirs(cache_entry)
+  cmds = get_xpk_setup_cmd(cache_entry, branch, commit)
+  if extra_packages:
+    cmds.append(f"pip install -U {' '.join(extra_packages)}")
+  hook = SubprocessHook()
+  result = hook.run_command(["bash", "-c", ";".join(cmds)])
+  if result.exit_code != 0:
+    shutil.rmtree(cache_entry, ignore_errors=True)
+    raise AirflowFailException(
+        f"XPK installation failed with code {result.exit_code}"
+    )
+  open(os.path.join(cache_entry, ".ready"), "w", encoding="utf-8").close()
+
+
+def _prune_xpk_venvs(prefix: str, keep: str) -> None:
+  """Removes cached installations of a branch that are no longer in use."""
+  for name in os.listdir(XPK_CACHE_DIR):
+    path = os.path.join(XPK_CACHE_DIR, name)
+    if not name.startswith(prefix) or path == keep or not os.path.isdir(path):
+      continue
+    with open(f"{path}.lock", "a", encoding="utf-8") as lock:
+      try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except BlockingIOError:
+        continue
+      logging.info(f"Removing stale XPK installation {path}")
+      shutil.rmtree(path, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def cached_xpk_venv(
+    branch: str = MAIN_BRANCH, extra_packages: Sequence[str] = ()
+) -> Iterator[str]:
+  """Provides an XPK installation, reusing it across tasks on this worker.
+
+  Installations are keyed by the commit the branch points to, so they are
+  rebuilt only when the branch head changes. A shared file lock, held while
+  the installation is in use, keeps it from being pruned, and is upgraded to
+  an exclusive lock only to install it, so tasks using an existing
+  installation run concurrently.
+
+  Args:
+    branch: The xpk branch or tag to install.
+    extra_packages: Extra pip packages to install into the venv.
+
+  Yields:
+    The path of the venv with xpk installed.
+  """
+  extras_hash = hashlib.sha256(" ".join(extra_packages).encode()).hexdigest()
+  prefix = f"{re.sub(r'[^a-zA-Z0-9.-]', '_', branch)}-{extras_hash[:8]}-"
+  os.makedirs(XPK_CACHE_DIR, exist_ok=True)
+  try:
+    commit = _resolve_xpk_commit(branch)
+    cache_entry = os.path.join(XPK_CACHE_DIR, f"{prefix}{commit[:12]}")
+  except (subprocess.SubprocessError, ValueError) as e:
+    # Fall back to the newest installation of the branch, if any.
+    ready = sorted(
+        (
+            os.path.join(XPK_CACHE_DIR, name)
+            for name in os.listdir(XPK_CACHE_DIR)
+            if name.startswith(prefix)
+            and os.path.exists(os.path.join(XPK_CACHE_DIR, name, ".ready"))
+        ),
+        key=os.path.getmtime,
+    )
+    if not ready:
+      raise
+    logging.warning(f"Failed to resolve xpk {branch}, using {ready[-1]}: {e}")
+    cache_entry = ready[-1]
+    commit = cache_entry.rsplit("-", 1)[-1]
+
+  ready = os.path.join(cache_entry, ".ready")
+  with open(f"{cache_entry}.lock", "a", encoding="utf-8") as lock:
+    fcntl.flock(lock, fcntl.LOCK_SH)
+    if os.path.exists(ready):
+      logging.info(f"Using cached XPK installation {cache_entry}")
+    else:
+      # Converting the lock isn't atomic, so another task may have installed
+      # XPK in the meantime.
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      if not os.path.exists(ready):
+        logging.info(f"Installing XPK {branch} ({commit}) to {cache_entry}")
+        _build_xpk_venv(cache_entry, branch, commit, extra_packages)
+      fcntl.flock(lock, fcntl.LOCK_SH)
+    _prune_xpk_venvs(prefix, keep=cache_entry)
+    yield os.path.join(cache_entry, "xpk_venv")
+
+
 def is_valid_gpu_version(accelerator_type: str):
   if accelerator_type in [member.value for member in GpuVersion]:
     return True
@@ -113,8 +294,15 @@ def run_workload(
     max_restart: int = 0,
     # to avoid workload preemption by manual tests.
     priority: str = "high",
+    use_k8s_api: bool = False,
 ):
-  """Run workload through xpk tool."""
+  """Run workload through xpk tool.
+
+  With `use_k8s_api`, TPU workloads are submitted as a JobSet through the
+  Kubernetes API instead, which skips installing and running the xpk CLI.
+  Workloads that the JobSet renderer does not support (GPUs, Pathways, MTC,
+  Vertex AI Tensorboard) still go through xpk.
+  """
 
   # Log required info for XLML PLX Dashboard
   composer.log_metadata_for_xlml_dashboard({
@@ -130,6 +318,27 @@ def run_workload(
       "num_slices": num_slices,
   })
 
+  if use_k8s_api and not (
+      use_pathways or mtc_enabled or use_vertex_tensorboard
+  ):
+    try:
+      body = xpk_jobset.tpu_workload(
+          workload_id=workload_id,
+          docker_image=docker_image,
+          accelerator_type=accelerator_type,
+          run_cmds=run_cmds,
+          num_slices=num_slices,
+          env={metric_config.SshEnvVars.GCS_OUTPUT.name: gcs_path},
+          priority=priority,
+          ramdisk_directory=ramdisk_directory,
+          max_restart=max_restart,
+      )
+    except ValueError as e:
+      logging.info(f"Falling back to xpk: {e}")
+    else:
+      create_jobset(cluster_project, zone, cluster_name, body)
+      return
+
   with tempfile.TemporaryDirectory() as tmpdir:
     if accelerator_type in [
         GpuVersion.XPK_H100.value,
@@ -143,7 +352,6 @@ def run_workload(
     type_field = "tpu-type" if use_pathways else "device-type"
 
     workload_create_cmd = (
-        f"source {tmpdir}/xpk_venv/bin/activate && "
         f"xpk workload {create_field}"
         f" --cluster={cluster_name} --workload={workload_id}"
         f" --command='{run_cmds}' --{type_field}={accelerator_type}"
@@ -174,26 +382,150 @@ def run_workload(
       # Default parameter to skip validation procedure.
       workload_create_cmd += " --skip-validation"
 
-    cmds = get_xpk_setup_cmd(tmpdir, xpk_branch)
     if accelerator_type == GpuVersion.XPK_H100_MEGA.value:
       workload_create_cmd += " --scheduler=gke.io/topology-aware-auto"
+    extra_packages = ()
     if use_vertex_tensorboard:
       workload_create_cmd += " --use-vertex-tensorboard"
-      vertex_ai_dependency = (
-          "pip install -U google-cloud-aiplatform cloud-accelerator-diagnostics"
+      extra_packages = VERTEX_AI_PACKAGES
+
+    with cached_xpk_venv(xpk_branch, extra_packages) as venv:
+      cmds = [
+          "set -xue",
+          f"source {venv}/bin/activate && {workload_create_cmd}",
+      ]
+      hook = SubprocessHook()
+      result = hook.run_command(
+          ["bash", "-c", ";".join(cmds)],
+          env={**os.environ, "KUBECONFIG": os.path.join(tmpdir, "xpk.conf")},
       )
-      cmds.append(vertex_ai_dependency)
-    cmds.append(workload_create_cmd)
-    hook = SubprocessHook()
-    result = hook.run_command(
-        ["bash", "-c", ";".join(cmds)],
-        env={**os.environ, "KUBECONFIG": os.path.join(tmpdir, "xpk.conf")},
-    )
     assert (
         result.exit_code == 0
     ), f"XPK command failed with code {result.exit_code}"
 
 
+def _get_jobset(
+    project_id: str, region: str, cluster_name: str, workload_id: str
+) -> Dict[str, Any]:
+  """Gets the JobSet of a workload, whichever way it was created."""
+  client = gke.get_authenticated_client(project_id, region, cluster_name)
+  return k8s_client.CustomObjectsApi(client).get_namespaced_custom_object(
+      group=xpk_jobset.JOBSET_GROUP,
+      version=xpk_jobset.JOBSET_VERSION,
+      namespace="default",
+      plural=xpk_jobset.JOBSET_PLURAL,
+      name=workload_id,
+  )
+
+
+def _jobset_exists(
+    project_id: str, zone: str, cluster_name: str, workload_id: str
+) -> bool:
+  """Whether the JobSet of a workload exists."""
+  try:
+    _get_jobset(project_id, gke.zone_to_region(zone), cluster_name, workload_id)
+  except ApiException as e:
+    if e.status == HTTPStatus.NOT_FOUND:
+      return False
+    raise
+  return True
+
+
+@task
+def run_workloads(
+    cluster_project: str,
+    zone: str,
+    cluster_name: str,
+    workloads: List[Dict[str, Any]],
+    max_concurrency: int = BATCH_LAUNCH_CONCURRENCY,
+    xpk_branch: str = MAIN_BRANCH,
+) -> Dict[str, Optional[str]]:
+  """Launch several workloads on one cluster from a single task.
+
+  Workloads whose JobSet already exists, e.g. launched by a previous try of
+  the task, are skipped. A workload that fails to launch doesn't stop the
+  others: the error is returned for `check_workload_launched` to fail only
+  that workload's tasks.
+
+  Args:
+    cluster_project: Project of the cluster.
+    zone: Zone of the cluster.
+    cluster_name: Name of the cluster.
+    workloads: Keyword arguments of `run_workload` for each workload, with at
+      least `benchmark_id`, `workload_id`, `gcs_path`, `docker_image`,
+      `accelerator_type` and `run_cmds`.
+    max_concurrency: Number of workloads submitted in parallel.
+    xpk_branch: xpk branch to use for workloads that need the xpk CLI.
+
+  Returns:
+    The launch error of each workload ID, None if it was launched, in the
+    order of `workloads`.
+  """
+
+  def launch(workload: Dict[str, Any]) -> Optional[str]:
+    workload_id = workload["workload_id"]
+    try:
+      if _jobset_exists(cluster_project, zone, cluster_name, workload_id):
+        logging.info(f"Workload {workload_id} was already launched.")
+        return None
+      run_workload.function(
+          task_id=workload_id,
+          cluster_project=cluster_project,
+          zone=zone,
+          cluster_name=cluster_name,
+          xpk_branch=xpk_branch,
+          **workload,
+      )
+    except Exception as e:  # pylint: disable=broad-exception-caught
+      logging.exception(f"Failed to launch workload {workload_id}.")
+      return f"{type(e).__name__}: {e}"
+    return None
+
+  with concurrent.futures.ThreadPoolExecutor(max_concurrency) as executor:
+    errors = list(executor.map(launch, workloads))
+  return {
+      workload["workload_id"]: error
+      for workload, error in zip(workloads, errors)
+  }
+
+
+@task
+def check_workload_launched(
+    launch_errors: Dict[str, Optional[str]], workload_id: str
+) -> None:
+  """Fails if `run_workloads` failed to launch a workload."""
+  if error := launch_errors[workload_id]:
+    raise AirflowFailException(f"Failed to launch {workload_id}: {error}")
+
+
+def create_jobset(
+    project_id: str, zone: str, cluster_name: str, body: dict
+) -> None:
+  """Create a JobSet through the Kubernetes API.
+
+  A JobSet that already exists, e.g. created by a previous try of the task,
+  is left as is.
+  """
+  client = gke.get_authenticated_client(
+      project_id, gke.zone_to_region(zone), cluster_name
+  )
+  custom_api = k8s_client.CustomObjectsApi(client)
+  try:
+    custom_api.create_namespaced_custom_object(
+        group=xpk_jobset.JOBSET_GROUP,
+        version=xpk_jobset.JOBSET_VERSION,
+        namespace="default",
+        plural=xpk_jobset.JOBSET_PLURAL,
+        body=body,
+    )
+  except ApiException as e:
+    if e.status != HTTPStatus.CONFLICT:
+      raise
+    logging.info(f"JobSet {body['metadata']['name']} already exists.")
+    return
+  logging.info(f"Created JobSet {body['metadata']['name']}.")
+
+
 def _get_core_api_client(
     project_id: str, region: str, cluster_name: str
 ) -> k8s_client.CoreV1Api:
@@ -254,52 +586,153 @@ def _get_workload_job(
   return jobs.items[0]
 
 
-def _log_workload_pod_statuses(workload_id: str, pods) -> None:
+def _log_workload_pod_statuses(
+    workload_id: str, pods: List[workload_status.PodStatus]
+) -> None:
   """Logs the status of each retrieved pod
   and its containers for troubleshooting."""
-  if not pods.items:
+  if not pods:
     return
 
   logging.info(f"{f' Pod Statuses for Workload {workload_id} ':-^80}")
 
-  for pod in pods.items:
-    logging.info(f"Pod: {pod.metadata.name}, Status: {pod.status.phase}")
+  for pod in pods:
+    logging.info(f"Pod: {pod.name}, Status: {pod.phase}")
 
-    if not pod.status.container_statuses:
-      continue
+    for container_status in pod.container_statuses:
+      # Waiting status
+      if container_status.waiting_reason:
+        logging.warning(
+            f"  Container '{container_status.name}' WAITING. "
+            f"Reason: {container_status.waiting_reason}. "
+            f"Message: {container_status.waiting_message}"
+        )
 
-    for container_status in pod.status.container_statuses:
-      match container_status.state:
-        # Waiting status
-        case state if state.waiting:
-          w = state.waiting
-          logging.warning(
-              f"  Container '{container_status.name}' WAITING. "
-              f"Reason: {w.reason}. Message: {w.message}"
-          )
-
-        # Terminated status
-        case state if state.terminated:
-          t = state.terminated
-          logging.error(
-              f"  Container '{container_status.name}' TERMINATED. "
-              f"Reason: {t.reason}. Exit Code: {t.exit_code}"
-          )
+      # Terminated status
+      elif container_status.exit_code is not None:
+        logging.error(
+            f"  Container '{container_status.name}' TERMINATED. "
+            f"Reason: {container_status.terminated_reason}. "
+            f"Exit Code: {container_status.exit_code}"
+        )
 
   logging.info("-" * 80)
 
 
+@dataclasses.dataclass
+class LogCursor:
+  """Position in a pod's log, and the last training step logged before it."""
+
+  pod: str = ""
+  timestamp: Optional[str] = None
+  step: int = -1
+
+
+def _parse_log_timestamp(timestamp: str) -> datetime.datetime:
+  """Parses an RFC 3339 timestamp with up to nanosecond precision."""
+  seconds, _, fraction = timestamp.rstrip("Z").partition(".")
+  return datetime.datetime.fromisoformat(seconds).replace(
+      microsecond=int(fraction[:6].ljust(6, "0")),
+      tzinfo=datetime.timezone.utc,
+  )
+
+
+def read_new_log_lines(
+    core_api: k8s_client.CoreV1Api,
+    pod: k8s_client.V1Pod,
+    cursor: LogCursor,
+) -> Tuple[List[str], LogCursor]:
+  """Reads the lines a pod logged after the cursor.
+
+  Args:
+    core_api: Client of the cluster running the pod.
+    pod: Pod to read logs from.
+    cursor: Position returned by the previous read, or an empty cursor. The
+      whole log is read if the cursor points to another pod.
+
+  Returns:
+    The new lines and the cursor after them.
+  """
+  kwargs = {}
+  if cursor.pod == pod.metadata.name and cursor.timestamp:
+    last_read = _parse_log_timestamp(cursor.timestamp)
+    elapsed = datetime.datetime.now(datetime.timezone.utc) - last_read
+    kwargs["since_seconds"] = max(
+        1, math.ceil(elapsed.total_seconds()) + _LOG_CURSOR_OVERLAP_SECONDS
+    )
+  else:
+    last_read = None
+    cursor = LogCursor(pod=pod.metadata.name)
+
+  logs = core_api.read_namespaced_pod_log(
+      name=pod.metadata.name,
+      namespace=pod.metadata.namespace,
+      timestamps=True,
+      **kwargs,
+  )
+  lines = []
+  timestamp = cursor.timestamp
+  # Only "\n" ends a log entry, a "\r" is part of its text, e.g. progress bars.
+  for line in logs.split("\n"):
+    line_timestamp, _, text = line.partition(" ")
+    try:
+      logged_at = _parse_log_timestamp(line_timestamp)
+    except ValueError:
+      continue
+    if last_read and logged_at <= last_read:
+      continue
+    lines.append(text)
+    timestamp = line_timestamp
+  return lines, dataclasses.replace(cursor, timestamp=timestamp)
+
+
+def _log_cursor_variable(ti: Optional[TaskInstance] = None) -> str:
+  """Returns the Variable holding the log cursor of a sensor.
+
+  Airflow clears a sensor's XComs before every rescheduled poke, so the cursor
+  is kept in a Variable instead.
+
+  Args:
+    ti: The sensor's task instance, the current one by default.
+  """
+  ti = ti or get_current_context()["ti"]
+  ti_key = f"{ti.dag_id}/{ti.run_id}/{ti.task_id}/{ti.map_index}"
+  return f"xpk-log-cursor-{hashlib.sha256(ti_key.encode()).hexdigest()[:16]}"
+
+
+def _should_save_log_cursor(saved: LogCursor, cursor: LogCursor) -> bool:
+  """Returns whether a poke moved the log cursor far enough to save it.
+
+  Saving on every poke would write to the metadata DB every few seconds. Lines
+  read again because the cursor wasn't saved can't lower its step, so only a new
+  pod or step is saved right away, and the position otherwise every
+  `_LOG_CURSOR_SAVE_INTERVAL` of logs.
+  """
+  if (cursor.pod, cursor.step) != (saved.pod, saved.step):
+    return True
+  if not cursor.timestamp or cursor.timestamp == saved.timestamp:
+    return False
+  if not saved.timestamp:
+    return True
+  return (
+      _parse_log_timestamp(cursor.timestamp)
+      - _parse_log_timestamp(saved.timestamp)
+      >= _LOG_CURSOR_SAVE_INTERVAL
+  )
+
+
 @task.sensor(poke_interval=60, timeout=600, mode="reschedule")
 def wait_for_workload_start(
     workload_id: str, project_id: str, region: str, cluster_name: str
 ) -> bool:
   """Check if the workload has started."""
-  core_api = _get_core_api_client(project_id, region, cluster_name)
-  pods = _list_workload_pods(core_api, workload_id)
+  pods = workload_status.workload_pods(
+      project_id, region, cluster_name, workload_id
+  )
 
   _log_workload_pod_statuses(workload_id, pods)
-  print(f"Found {len(pods.items)} pods for workload {workload_id}")
-  return len(pods.items) > 0
+  print(f"Found {len(pods)} pods for workload {workload_id}")
+  return len(pods) > 0
 
 
 @task.sensor(poke_interval=60, timeout=600, mode="reschedule")
@@ -307,12 +740,13 @@ def wait_for_workload_completion(
     workload_id: str, project_id: str, region: str, cluster_name: str
 ) -> bool:
   """Check the workload status."""
-  core_api = _get_core_api_client(project_id, region, cluster_name)
-  pods = _list_workload_pods(core_api, workload_id)
+  pods = workload_status.workload_pods(
+      project_id, region, cluster_name, workload_id
+  )
 
   _log_workload_pod_statuses(workload_id, pods)
 
-  if not pods.items:
+  if not pods:
     logging.info(f"No pods found for workload selector: {workload_id}.")
 
     # Pathways jobs delete all pods on failure so we must also check if the job
@@ -338,27 +772,32 @@ def wait_for_workload_completion(
 
     return False
 
-  if any(pod.status.phase in ["Pending", "Running"] for pod in pods.items):
+  if any(pod.phase in ["Pending", "Running"] for pod in pods):
     logging.info("At least one pod has yet to complete.")
     return False
-  last_pod = pods.items[-1] if pods.items else None
+  last_pod = pods[-1] if pods else None
   try:
-    for pod in pods.items:
-      if pod.status.phase == "Failed":
+    for pod in pods:
+      if pod.phase == "Failed":
         last_pod = pod
         # Don't keep retrying if the pod has failed
-        raise AirflowFailException(f"Bad pod phase: {pod.status.phase}")
-      elif pod.status.phase in ["Unknown"]:
-        raise RuntimeError(f"Bad pod phase: {pod.status.phase}")
+        raise AirflowFailException(f"Bad pod phase: {pod.phase}")
+      elif pod.phase in ["Unknown"]:
+        raise RuntimeError(f"Bad pod phase: {pod.phase}")
   finally:
     # TODO(jonbolin): log printing for GPUs, which have multiple containers
-    if last_pod and len(last_pod.spec.containers) == 1:
+    if last_pod and last_pod.num_containers == 1:
       # Print the logs of the last pod checked - either the first failed pod or
-      # the last successful one.
+      # the last successful one. The full logs are available from the link.
+      core_api = _get_core_api_client(project_id, region, cluster_name)
       logs = core_api.read_namespaced_pod_log(
-          name=last_pod.metadata.name, namespace=last_pod.metadata.namespace
+          name=last_pod.name,
+          namespace=last_pod.namespace,
+          tail_lines=LOG_TAIL_LINES,
+      )
+      logging.info(
+          f"Last {LOG_TAIL_LINES} lines of logs for pod {last_pod.name}:"
       )
-      logging.info(f"Logs for pod {last_pod.metadata.name}:")
       for line in logs.split("\n"):
         logging.info(line)
     url = LOGGING_URL_FORMAT.format(
@@ -382,16 +821,17 @@ def clean_up_workload(
     xpk_branch: str = MAIN_BRANCH,
 ) -> bool:
   """Delete workload."""
-  with tempfile.TemporaryDirectory() as tmpdir:
+  with tempfile.TemporaryDirectory() as tmpdir, cached_xpk_venv(
+      xpk_branch
+  ) as venv:
     workload_delete_cmd = (
-        f"source {tmpdir}/xpk_venv/bin/activate && "
+        f"source {venv}/bin/activate && "
         f"xpk workload delete"
         f" --cluster={cluster_name} --workload={workload_id}"
         f" --project={project_id} --zone={zone}"
     )
 
-    cmds = get_xpk_setup_cmd(tmpdir, xpk_branch)
-    cmds.append(workload_delete_cmd)
+    cmds = ["set -xue", workload_delete_cmd]
     hook = SubprocessHook()
     result = hook.run_command(
         ["bash", "-c", ";".join(cmds)],
@@ -402,7 +842,18 @@ def clean_up_workload(
     ), f"XPK clean-up failed with code {result.exit_code}"
 
 
-@task.sensor(poke_interval=3, timeout=3600, mode="reschedule")
+def _delete_log_cursor(context: Context) -> None:
+  """Deletes the log cursor of a sensor that ended."""
+  Variable.delete(_log_cursor_variable(context["ti"]))
+
+
+@task.sensor(
+    poke_interval=3,
+    timeout=REACH_STEP_TIMEOUT.total_seconds(),
+    mode="reschedule",
+    on_success_callback=_delete_log_cursor,
+    on_failure_callback=_delete_log_cursor,
+)
 def wait_for_workload_reach_step(
     project_id: str,
     region: str,
@@ -433,22 +884,26 @@ def wait_for_workload_reach_step(
       raise RuntimeError(f"Bad pod phase: {pod.status.phase}")
 
   if all(pod.status.phase in ["Running"] for pod in pods.items):
-    # Pick last one running pod
+    # Pick last one running pod, and only read what it logged since last poke.
     pod = pods.items[len(pods.items) - 1]
-    logs = core_api.read_namespaced_pod_log(
-        name=pod.metadata.name, namespace=pod.metadata.namespace
+    variable = _log_cursor_variable()
+    saved = LogCursor(
+        **Variable.get(variable, default_var={}, deserialize_json=True)
     )
+    lines, cursor = read_new_log_lines(core_api, pod, saved)
     # Check if the workload completed step reached over the expected step
-    completed_step_matches = re.findall(r"completed step: (\d+)", logs)
-    if completed_step_matches:
-      current_step = int(completed_step_matches[-1])
-      if current_step >= int(expect_reach_to_step):
-        logging.info(
-            "Reached to the expected step %s. Current step is %s.",
-            expect_reach_to_step,
-            current_step,
-        )
-        return True
+    for line in lines:
+      if match := _COMPLETED_STEP.search(line):
+        cursor.step = max(cursor.step, int(match.group(1)))
+    if cursor.step >= int(expect_reach_to_step):
+      logging.info(
+          "Reached to the expected step %s. Current step is %s.",
+          expect_reach_to_step,
+          cursor.step,
+      )
+      return True
+    if _should_save_log_cursor(saved, cursor):
+      Variable.set(variable, dataclasses.asdict(cursor), serialize_json=True)
 
   logging.info("Waiting for reaching expected step %s.", expect_reach_to_step)
 
@@ -463,6 +918,33 @@ def extract_numbers(pod_name: str) -> Tuple[int, int]:
   return (0, 0)
 
 
+def select_disruption_target(
+    pods: Sequence[workload_status.PodStatus], last_node: bool = False
+) -> workload_status.PodStatus:
+  """Picks the running pod whose node is deleted to disrupt a workload.
+
+  Args:
+    pods: Pods of the workload.
+    last_node: If True, picks the pod with the highest slice and pod numbers,
+      otherwise the lowest.
+
+  Returns:
+    The status of the picked pod.
+  """
+  pattern = re.compile(r".*slice-job-(\d+)-(\d+)-\w+")
+  running = [
+      pod
+      for pod in pods
+      if pod.phase == "Running" and pod.node_name and pattern.match(pod.name)
+  ]
+  if not running:
+    raise AirflowFailException("No running pods found matching pattern.")
+
+  # Sort by slice number, then by pod number.
+  running.sort(key=lambda pod: extract_numbers(pod.name))
+  return running[-1] if last_node else running[0]
+
+
 def _find_target_pod_node(
     project_id: str,
     region: str,
@@ -473,34 +955,19 @@ def _find_target_pod_node(
   """find the node name for the workload."""
   core_api = _get_core_api_client(project_id, region, cluster_name)
   pods = _list_workload_pods(core_api, workload_id)
-  pod_node_pairs = []
-  pattern = re.compile(r".*slice-job-(\d+)-(\d+)-\w+")
-
-  pod_node_pairs = [
-      (pod.metadata.name, pod.spec.node_name)
-      for pod in pods.items
-      if pod.status.phase == "Running" and pattern.match(pod.metadata.name)
-  ]
-  if not pod_node_pairs:
-    raise AirflowFailException(
-        f"No running pods found for workload {workload_id} matching pattern."
-    )
-
-  # Find the pod with the highest slice and pod numbers.
-  # Sort by slice number, then by pod number, and get the last (highest) one
-  sorted_pairs = sorted(pod_node_pairs, key=lambda x: extract_numbers(x[0]))
-  target_pod, target_node = sorted_pairs[0]
-  if last_node:
-    target_pod, target_node = sorted_pairs[-1]
+  target = select_disruption_target(
+      [workload_status.PodStatus.from_pod(pod) for pod in pods.items],
+      last_node,
+  )
 
   logging.info("Identified Pod for node deletion:")
-  logging.info(f"  Pod Name:   {target_pod}")
-  logging.info(f"  Node Name:  {target_node}")
+  logging.info(f"  Pod Name:   {target.name}")
+  logging.info(f"  Node Name:  {target.node_name}")
   logging.info("-" * 72)
 
   delete_info = {
-      "pod": target_pod,
-      "node": target_node,
+      "pod": target.name,
+      "node": target.node_name,
   }
   return delete_info
 
@@ -547,3 +1014,341 @@ def delete_node(
   except Exception as e:  # pylint: disable=broad-exception-caught
     logging.info(f"Error deleting node {node_name}: {e}", file=sys.stderr)
     sys.exit(1)
+
+
+def _wait_for_running_pods(
+    project_id: str,
+    region: str,
+    cluster_name: str,
+    workload_id: str,
+    deadline: float,
+    replaced: Sequence[str] = (),
+) -> List[workload_status.PodStatus]:
+  """Waits until all pods of a workload run, none of them in `replaced`.
+
+  Raises:
+    AirflowFailException: If the JobSet failed, e.g. because it has no
+      restarts left, or if the pods don't run by the `time.monotonic`
+      deadline.
+  """
+  while True:
+    pods = workload_status.workload_pods(
+        project_id,
+        region,
+        cluster_name,
+        workload_id,
+        cache_ttl=_DISRUPTION_POLL_INTERVAL,
+    )
+    if (
+        pods
+        and all(pod.phase == "Running" for pod in pods)
+        and not {pod.name for pod in pods} & set(replaced)
+    ):
+      return pods
+    jobset = _get_jobset(project_id, region, cluster_name, workload_id)
+    if any(
+        condition.get("type") == "Failed" and condition.get("status") == "True"
+        for condition in jobset.get("status", {}).get("conditions", [])
+    ):
+      raise AirflowFailException(f"Workload {workload_id} failed.")
+    if time.monotonic() > deadline:
+      raise AirflowFailException(
+          f"Pods of {workload_id} did not run within {DISRUPTION_TIMEOUT}."
+      )
+    time.sleep(_DISRUPTION_POLL_INTERVAL.total_seconds())
+
+
+def _follow_until_step(
+    core_api: k8s_client.CoreV1Api,
+    pod: workload_status.PodStatus,
+    min_step: int,
+) -> Optional[int]:
+  """Follows a pod's log until it logs a step of at least `min_step`.
+
+  Returns:
+    The logged step, or None if the pod terminated before logging it.
+  """
+  logging.info(f"Following logs of {pod.name} until step {min_step}.")
+  logs_watcher = watch.Watch()
+  for line in logs_watcher.stream(
+      core_api.read_namespaced_pod_log, name=pod.name, namespace=pod.namespace
+  ):
+    match = _COMPLETED_STEP.search(line)
+    if match and int(match.group(1)) >= min_step:
+      logs_watcher.stop()
+      return int(match.group(1))
+  return None
+
+
+def _wait_for_gcs_file(file_path: str, deadline: float) -> None:
+  """Waits until a file exists in GCS, by a `time.monotonic` deadline.
+
+  Raises:
+    AirflowFailException: If the file doesn't exist by the deadline.
+  """
+  while not gcs.file_exists(file_path):
+    if time.monotonic() > deadline:
+      raise AirflowFailException(
+          f"{file_path} did not exist within {DISRUPTION_TIMEOUT}."
+      )
+    time.sleep(1)
+
+
+def _now() -> str:
+  return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+@task(execution_timeout=DISRUPTION_TIMEOUT + datetime.timedelta(minutes=10))
+def disrupt_node_at_step(
+    project_id: str,
+    zone: str,
+    cluster_name: str,
+    workload_id: str,
+    expect_reach_to_step: int,
+    wait_for_file: Optional[str] = None,
+    last_node: bool = False,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+  """Deletes the node of a workload as soon as it reaches a step.
+
+  Unlike `wait_for_workload_reach_step` followed by `delete_node`, the target
+  node is resolved while the workload is still running toward the step, and
+  the step is detected by following the log rather than polling it. The node
+  deletion is only requested, not waited for, so the disruption lands within
+  moments of the step. The task then waits for the workload to restart and
+  to log its first step again.
+
+  Args:
+    project_id: Project of the cluster and its nodes.
+    zone: Zone of the cluster's nodes.
+    cluster_name: Name of the cluster.
+    workload_id: Name of the workload.
+    expect_reach_to_step: Step after which the node is deleted.
+    wait_for_file: GCS object, such as a checkpoint's commit marker, that must
+      exist before the node is deleted.
+    last_node: If True, deletes the node of the last pod, otherwise of the
+      first.
+    dry_run: If True, only logs the node that would be deleted.
+
+  Returns:
+    The disrupted pod and node, and when the step was seen, the deletion was
+    requested, the replacement pods ran and the workload resumed training.
+  """
+  region = gke.zone_to_region(zone)
+  core_api = _get_core_api_client(project_id, region, cluster_name)
+  instances_client = compute_v1.InstancesClient()
+
+  # Waits fail with a clear error, without retries, before the execution
+  # timeout kills the task.
+  deadline = time.monotonic() + DISRUPTION_TIMEOUT.total_seconds()
+  pods = _wait_for_running_pods(
+      project_id, region, cluster_name, workload_id, deadline
+  )
+  target = select_disruption_target(pods, last_node)
+  logging.info(f"Will delete node {target.node_name} of pod {target.name}.")
+
+  step = _follow_until_step(core_api, pods[-1], int(expect_reach_to_step))
+  if step is None:
+    raise AirflowFailException(
+        f"{pods[-1].name} terminated before step {expect_reach_to_step}."
+    )
+  timeline = {"pod": target.name, "node": target.node_name}
+  timeline["step_seen_at"] = _now()
+  logging.info(f"Workload {workload_id} reached step {step}.")
+  if wait_for_file:
+    _wait_for_gcs_file(wait_for_file, deadline)
+
+  if dry_run:
+    logging.info(f"DRY RUN: Would delete node {target.node_name} in {zone}.")
+    return timeline
+
+  operation = instances_client.delete(
+      project=project_id, zone=zone, instance=target.node_name
+  )
+  timeline["disrupted_at"] = _now()
+  logging.info(f"Deletion of {target.node_name} started: {operation.name}")
+
+  pods = _wait_for_running_pods(
+      project_id,
+      region,
+      cluster_name,
+      workload_id,
+      deadline,
+      replaced=[pod.name for pod in pods],
+  )
+  timeline["restarted_at"] = _now()
+  logging.info(f"Workload {workload_id} restarted with pods {pods}.")
+
+  timeline["resumed_step"] = _follow_until_step(core_api, pods[-1], 0)
+  if timeline["resumed_step"] is not None:
+    timeline["resumed_at"] = _now()
+  logging.info(f"Disruption timeline of {workload_id}: {timeline}")
+  return timeline
+
+
+def time_breakdown(
+    milestones: Dict[str, Optional[datetime.datetime]],
+) -> Dict[str, float]:
+  """Splits the time between workload milestones into stages.
+
+  Args:
+    milestones: Time of each milestone in `TIMING_STAGES`. Missing milestones
+      are skipped, and their stage is counted in the next one.
+
+  Returns:
+    Seconds spent in each stage, and in total, by metric key.
+  """
+  breakdown = {}
+  first = previous = None
+  for milestone, stage in TIMING_STAGES:
+    timestamp = milestones.get(milestone)
+    if timestamp is None:
+      continue
+    if previous is not None and stage:
+      breakdown[f"orchestration/{stage}"] = max(
+          0.0, (timestamp - previous).total_seconds()
+      )
+    first = first or timestamp
+    previous = timestamp
+  if breakdown:
+    breakdown["orchestration/total_seconds"] = (
+        previous - first
+    ).total_seconds()
+  return breakdown
+
+
+def _log_milestones(
+    core_api: k8s_client.CoreV1Api, pod: k8s_client.V1Pod
+) -> Dict[str, datetime.datetime]:
+  """Finds when a pod logged its first line, first step and last step."""
+  milestones = {}
+  response = core_api.read_namespaced_pod_log(
+      name=pod.metadata.name,
+      namespace=pod.metadata.namespace,
+      timestamps=True,
+      _preload_content=False,
+  )
+  try:
+    for line in response:
+      timestamp, _, text = line.decode(errors="replace").partition(" ")
+      try:
+        logged_at = _parse_log_timestamp(timestamp)
+      except ValueError:
+        continue
+      milestones.setdefault("first_log", logged_at)
+      if _COMPLETED_STEP.search(text):
+        milestones["first_step"] = logged_at
+        break
+  finally:
+    response.release_conn()
+
+  tail = core_api.read_namespaced_pod_log(
+      name=pod.metadata.name,
+      namespace=pod.metadata.namespace,
+      timestamps=True,
+      tail_lines=LOG_TAIL_LINES,
+  )
+  # Progress bars end lines with carriage returns, which `splitlines` would
+  # split into lines without a timestamp.
+  for line in reversed(tail.split("\n")):
+    timestamp, _, text = line.partition(" ")
+    if not _COMPLETED_STEP.search(text):
+      continue
+    try:
+      milestones["last_step"] = _parse_log_timestamp(timestamp)
+    except ValueError:
+      continue
+    break
+  return milestones
+
+
+def _workload_milestones(
+    project_id: str, region: str, cluster_name: str, workload_id: str
+) -> Dict[str, datetime.datetime]:
+  """Collects the milestones of a workload from its JobSet, pods and logs."""
+  client = gke.get_authenticated_client(project_id, region, cluster_name)
+  jobset = k8s_client.CustomObjectsApi(client).get_namespaced_custom_object(
+      group=xpk_jobset.JOBSET_GROUP,
+      version=xpk_jobset.JOBSET_VERSION,
+      namespace="default",
+      plural=xpk_jobset.JOBSET_PLURAL,
+      name=workload_id,
+  )
+  core_api = k8s_client.CoreV1Api(client)
+  pods = _list_workload_pods(core_api, workload_id).items
+
+  times = collections.defaultdict(list)
+  for pod in pods:
+    times["pods_created"].append(pod.metadata.creation_timestamp)
+    for condition in pod.status.conditions or []:
+      if condition.status == "True" and (
+          milestone := _POD_CONDITION_MILESTONES.get(condition.type)
+      ):
+        times[milestone].append(condition.last_transition_time)
+    for status in pod.status.container_statuses or []:
+      state = status.state.running or status.state.terminated
+      if state and state.started_at:
+        times["containers_started"].append(state.started_at)
+      if status.state.terminated:
+        times["pods_finished"].append(status.state.terminated.finished_at)
+
+  milestones = {
+      "jobset_created": _parse_log_timestamp(
+          jobset["metadata"]["creationTimestamp"]
+      )
+  }
+  # The workload is admitted when its first pod is created, and each later
+  # milestone is reached when the slowest pod reaches it.
+  for milestone, timestamps in times.items():
+    milestones[milestone] = (
+        min(timestamps) if milestone == "pods_created" else max(timestamps)
+    )
+  # All workers run the same steps, so the logs of the first worker, job 0 and
+  # pod 0, are taken as those of the workload.
+  if pods:
+    first_worker = min(pods, key=lambda pod: extract_numbers(pod.metadata.name))
+    milestones.update(_log_milestones(core_api, first_worker))
+  return milestones
+
+
+@task(trigger_rule="all_done")
+def record_workload_timing(
+    project_id: str,
+    zone: str,
+    cluster_name: str,
+    workload_id: str,
+    launch_task_id: Optional[str] = None,
+) -> Dict[str, float]:
+  """Records how long a workload spent in each stage, from launch to finish.
+
+  Runs before the workload is cleaned up, and never fails the DAG: a workload
+  that cannot be timed yields no metrics. `metric.process_metrics` writes the
+  result alongside the benchmark metrics.
+
+  Args:
+    project_id: Project of the cluster.
+    zone: Zone of the cluster.
+    cluster_name: Name of the cluster.
+    workload_id: Name of the workload.
+    launch_task_id: Task that launched the workload. Its start is the
+      `launched` milestone.
+
+  Returns:
+    Seconds spent in each stage of `TIMING_STAGES`, by metric key.
+  """
+  try:
+    milestones = _workload_milestones(
+        project_id, gke.zone_to_region(zone), cluster_name, workload_id
+    )
+  except Exception as e:  # pylint: disable=broad-exception-caught
+    logging.warning(f"Could not time workload {workload_id}: {e}")
+    return {}
+
+  if launch_task_id:
+    ti = get_current_context()["dag_run"].get_task_instance(launch_task_id)
+    milestones["launched"] = ti.start_date if ti else None
+
+  breakdown = time_breakdown(milestones)
+  for key, seconds in breakdown.items():
+    logging.info(f"{key}: {seconds:.1f}")
+  return breakdown
@@ -0,0 +1,228 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Renders the JobSet that `xpk workload create` submits for TPU workloads.
+
+This allows workloads to be created directly through the Kubernetes API. Only
+TPU slices with power-of-two chip counts are supported; other workloads must
+use the xpk CLI.
+"""
+
+import dataclasses
+import math
+import re
+from typing import Any, Dict, List, Optional
+
+JOBSET_GROUP = "jobset.x-k8s.io"
+JOBSET_VERSION = "v1alpha2"
+JOBSET_PLURAL = "jobsets"
+QUEUE_NAME = "multislice-queue"
+CONTAINER_NAME = "jax-tpu"
+
+
+@dataclasses.dataclass
+class _TpuGeneration:
+  gke_accelerator: str
+  cores_per_chip: int
+  topology_dims: int
+
+
+_TPU_GENERATIONS = {
+    "v4": _TpuGeneration("tpu-v4-podslice", 2, 3),
+    "v5p": _TpuGeneration("tpu-v5p-slice", 2, 3),
+    "v5litepod": _TpuGeneration("tpu-v5-lite-podslice", 1, 2),
+    "v6e": _TpuGeneration("tpu-v6e-slice", 1, 2),
+}
+# Largest single-host slices of 2D TPUs, e.g. v5litepod-8.
+_MAX_SINGLE_HOST_CHIPS = 8
+_CHIPS_PER_VM = 4
+
+
+@dataclasses.dataclass
+class SliceShape:
+  """GKE node selectors and pod layout of a TPU slice."""
+
+  gke_accelerator: str
+  topology: str
+  vms_per_slice: int
+  chips_per_vm: int
+
+
+def _topology(chips: int, dims: int) -> str:
+  """Returns the canonical topology of a slice, e.g. 2x2x4 for 16 chips."""
+  shape: List[int] = [2, 2, 1] if dims == 3 else [1, 1]
+  while math.prod(shape) < chips:
+    # Grow the smallest dimension, keeping dimensions sorted.
+    shape[shape.index(min(shape))] *= 2
+    shape.sort()
+  return "x".join(str(d) for d in shape)
+
+
+def slice_shape(accelerator_type: str) -> SliceShape:
+  """Returns the shape of a TPU slice, e.g. for `v5p-128`.
+
+  Raises:
+    ValueError: If the accelerator type is not a supported TPU slice.
+  """
+  match = re.fullmatch(r"(v[0-9a-z]+)-(\d+)", accelerator_type)
+  generation = _TPU_GENERATIONS.get(match.group(1)) if match else None
+  if not generation:
+    raise ValueError(f"Unsupported accelerator type: {accelerator_type}")
+
+  chips = int(match.group(2)) // generation.cores_per_chip
+  if chips < 1 or chips & (chips - 1):
+    raise ValueError(f"Unsupported slice size: {accelerator_type}")
+
+  if generation.topology_dims == 2 and chips <= _MAX_SINGLE_HOST_CHIPS:
+    chips_per_vm = chips
+  else:
+    chips_per_vm = min(chips, _CHIPS_PER_VM)
+  return SliceShape(
+      gke_accelerator=generation.gke_accelerator,
+      topology=_topology(chips, generation.topology_dims),
+      vms_per_slice=chips // chips_per_vm,
+      chips_per_vm=chips_per_vm,
+  )
+
+
+def _wrap_command(run_cmds: str) -> str:
+  """Wraps the command with the same markers and exit code as xpk."""
+  return (
+      "echo XPK Start: $(date);"
+      " _sigterm() (kill -SIGTERM $! 2>/dev/null;);"
+      " trap _sigterm SIGTERM;"
+      f" ({run_cmds}) & PID=$!;"
+      " wait $PID; EXIT_CODE=$?;"
+      " echo XPK End: $(date);"
+      " echo EXIT_CODE=$EXIT_CODE;"
+      " exit $EXIT_CODE"
+  )
+
+
+def _annotation_env(name: str, annotation: str) -> Dict[str, Any]:
+  return {
+      "name": name,
+      "valueFrom": {
+          "fieldRef": {"fieldPath": f"metadata.annotations['{annotation}']"}
+      },
+  }
+
+
+def tpu_workload(
+    workload_id: str,
+    docker_image: str,
+    accelerator_type: str,
+    run_cmds: str,
+    num_slices: int = 1,
+    env: Optional[Dict[str, str]] = None,
+    priority: str = "high",
+    ramdisk_directory: str = "",
+    max_restart: int = 0,
+) -> Dict[str, Any]:
+  """Renders a TPU workload as a JobSet.
+
+  Args:
+    workload_id: Name of the JobSet.
+    docker_image: Image of the workload container.
+    accelerator_type: TPU type of each slice, e.g. `v5p-128`.
+    run_cmds: Commands to run in the container.
+    num_slices: Number of slices.
+    env: Extra environment variables of the container.
+    priority: Priority class of the workload pods.
+    ramdisk_directory: Directory to mount the emergency checkpoint ramdisk at.
+    max_restart: Number of times the JobSet may be restarted on failure.
+
+  Returns:
+    The JobSet as a dict.
+
+  Raises:
+    ValueError: If the accelerator type is not supported.
+  """
+  shape = slice_shape(accelerator_type)
+  labels = {"xpk.google.com/workload": workload_id}
+
+  volumes = [{"name": "dshm-2", "emptyDir": {"medium": "Memory"}}]
+  volume_mounts = [{"name": "dshm-2", "mountPath": "/dev/shm"}]
+  if ramdisk_directory:
+    volumes.append({
+        "name": "cache",
+        "csi": {"driver": "phase1-checkpoint.csi.storage.gke.io"},
+    })
+    volume_mounts.append({"name": "cache", "mountPath": ramdisk_directory})
+
+  container = {
+      "name": CONTAINER_NAME,
+      "image": docker_image,
+      "env": [
+          _annotation_env(
+              "REPLICATED_JOB_NAME", "jobset.sigs.k8s.io/replicatedjob-name"
+          ),
+          _annotation_env("JOBSET_NAME", "jobset.sigs.k8s.io/jobset-name"),
+          *({"name": k, "value": v} for k, v in (env or {}).items()),
+      ],
+      "ports": [{"containerPort": 8471}, {"containerPort": 8080}],
+      "securityContext": {"privileged": True},
+      "command": ["bash", "-c", _wrap_command(run_cmds)],
+      "resources": {"limits": {"google.com/tpu": shape.chips_per_vm}},
+      "volumeMounts": volume_mounts,
+  }
+
+  return {
+      "apiVersion": f"{JOBSET_GROUP}/{JOBSET_VERSION}",
+      "kind": "JobSet",
+      "metadata": {
+          "name": workload_id,
+          "labels": {"kueue.x-k8s.io/queue-name": QUEUE_NAME, **labels},
+          "annotations": {
+              # One slice per node pool.
+              "alpha.jobset.sigs.k8s.io/exclusive-topology": (
+                  "cloud.google.com/gke-nodepool"
+              ),
+          },
+      },
+      "spec": {
+          "failurePolicy": {"maxRestarts": max_restart},
+          "replicatedJobs": [{
+              "name": "slice-job",
+              "replicas": num_slices,
+              "template": {
+                  "spec": {
+                      "parallelism": shape.vms_per_slice,
+                      "completions": shape.vms_per_slice,
+                      "backoffLimit": 0,
+                      "template": {
+                          "metadata": {"labels": labels},
+                          "spec": {
+                              "restartPolicy": "Never",
+                              "nodeSelector": {
+                                  "cloud.google.com/gke-tpu-accelerator": (
+                                      shape.gke_accelerator
+                                  ),
+                                  "cloud.google.com/gke-tpu-topology": (
+                                      shape.topology
+                                  ),
+                              },
+                              "priorityClassName": priority,
+                              "hostNetwork": True,
+                              "dnsPolicy": "ClusterFirstWithHostNet",
+                              "terminationGracePeriodSeconds": 30,
+                              "containers": [container],
+                              "volumes": volumes,
+                          },
+                      },
+                  }
+              },
+          }],
+      },
+  }
@@ -0,0 +1,89 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for xpk_jobset.py."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from xlml.utils import xpk_jobset
+
+
+class SliceShapeTest(parameterized.TestCase, absltest.TestCase):
+
+  @parameterized.named_parameters(
+      ("v4_8", "v4-8", "tpu-v4-podslice", "2x2x1", 1, 4),
+      ("v5p_128", "v5p-128", "tpu-v5p-slice", "4x4x4", 16, 4),
+      ("v5litepod_8", "v5litepod-8", "tpu-v5-lite-podslice", "2x4", 1, 8),
+      ("v6e_256", "v6e-256", "tpu-v6e-slice", "16x16", 64, 4),
+  )
+  def test_slice_shape(
+      self,
+      accelerator_type: str,
+      gke_accelerator: str,
+      topology: str,
+      vms_per_slice: int,
+      chips_per_vm: int,
+  ):
+    self.assertEqual(
+        xpk_jobset.slice_shape(accelerator_type),
+        xpk_jobset.SliceShape(
+            gke_accelerator, topology, vms_per_slice, chips_per_vm
+        ),
+    )
+
+  @parameterized.named_parameters(
+      ("gpu", "h100-80gb-8"),
+      ("not_power_of_two", "v5p-24"),
+  )
+  def test_unsupported(self, accelerator_type: str):
+    with self.assertRaises(ValueError):
+      xpk_jobset.slice_shape(accelerator_type)
+
+
+class TpuWorkloadTest(absltest.TestCase):
+
+  def test_tpu_workload(self):
+    body = xpk_jobset.tpu_workload(
+        workload_id="test-run",
+        docker_image="gcr.io/image",
+        accelerator_type="v5p-16",
+        run_cmds="python train.py",
+        num_slices=2,
+        env={"GCS_OUTPUT": "gs://bucket/out"},
+        ramdisk_directory="/local",
+        max_restart=3,
+    )
+
+    self.assertEqual(body["metadata"]["name"], "test-run")
+    self.assertEqual(body["spec"]["failurePolicy"]["maxRestarts"], 3)
+    replicated_job = body["spec"]["replicatedJobs"][0]
+    self.assertEqual(replicated_job["replicas"], 2)
+    job_spec = replicated_job["template"]["spec"]
+    self.assertEqual(job_spec["parallelism"], 2)
+    pod_spec = job_spec["template"]["spec"]
+    self.assertEqual(
+        pod_spec["nodeSelector"]["cloud.google.com/gke-tpu-topology"], "2x2x2"
+    )
+    container = pod_spec["containers"][0]
+    self.assertIn(
+        {"name": "GCS_OUTPUT", "value": "gs://bucket/out"}, container["env"]
+    )
+    self.assertIn(
+        {"name": "cache", "mountPath": "/local"}, container["volumeMounts"]
+    )
+    self.assertIn("EXIT_CODE=$EXIT_CODE", container["command"][-1])
+
+
+if __name__ == "__main__":
+  absltest.main()
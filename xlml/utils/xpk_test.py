@@ -0,0 +1,501 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for xpk.py."""
+
+import concurrent.futures
+import datetime
+import os
+import subprocess
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from airflow import DAG
+from kubernetes import client as k8s_client
+from xlml.utils import workload_status
+from xlml.utils import xpk
+
+
+_LS_REMOTE = """\
+1111111111111111111111111111111111111111\trefs/tags/v0.17.3
+2222222222222222222222222222222222222222\trefs/tags/v0.17.3^{}
+3333333333333333333333333333333333333333\trefs/heads/main
+"""
+
+
+class CachedXpkVenvTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(
+        mock.patch.object(
+            xpk,
+            "XPK_CACHE_DIR",
+            self.enter_context(tempfile.TemporaryDirectory()),
+        )
+    )
+    self.run = self.enter_context(
+        mock.patch.object(
+            subprocess,
+            "run",
+            return_value=subprocess.CompletedProcess([], 0, stdout=_LS_REMOTE),
+        )
+    )
+
+    def build(cache_entry, branch, commit, extra_packages):
+      os.makedirs(cache_entry)
+      open(os.path.join(cache_entry, ".ready"), "w").close()
+
+    self.build = self.enter_context(
+        mock.patch.object(xpk, "_build_xpk_venv", side_effect=build)
+    )
+
+  def test_resolves_peeled_tag(self):
+    self.assertEqual(xpk._resolve_xpk_commit("v0.17.3"), "2" * 40)
+
+  def test_resolves_branch(self):
+    self.assertEqual(xpk._resolve_xpk_commit("main"), "3" * 40)
+
+  def test_reuses_installation(self):
+    with xpk.cached_xpk_venv("main") as venv:
+      pass
+    with xpk.cached_xpk_venv("main") as cached_venv:
+      pass
+
+    self.assertEqual(venv, cached_venv)
+    self.build.assert_called_once()
+
+  def test_installation_is_shared_while_in_use(self):
+    def use_venv():
+      with xpk.cached_xpk_venv("main") as venv:
+        return venv
+
+    with xpk.cached_xpk_venv("main") as venv:
+      with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        # Blocks until the timeout if the first use excludes other tasks.
+        concurrent_venv = executor.submit(use_venv).result(timeout=10)
+
+    self.assertEqual(venv, concurrent_venv)
+    self.build.assert_called_once()
+
+  def test_extra_packages_use_separate_installation(self):
+    with xpk.cached_xpk_venv("main") as venv:
+      pass
+    with xpk.cached_xpk_venv("main", xpk.VERTEX_AI_PACKAGES) as vertex_venv:
+      pass
+
+    self.assertNotEqual(venv, vertex_venv)
+
+  def test_falls_back_to_cached_installation(self):
+    with xpk.cached_xpk_venv("main") as venv:
+      pass
+    self.run.side_effect = subprocess.TimeoutExpired("git", 60)
+
+    with xpk.cached_xpk_venv("main") as cached_venv:
+      pass
+
+    self.assertEqual(venv, cached_venv)
+
+
+class ReadNewLogLinesTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.core_api = mock.Mock()
+    self.pod = k8s_client.V1Pod(
+        metadata=k8s_client.V1ObjectMeta(name="pod-0", namespace="default")
+    )
+    now = datetime.datetime.now(datetime.timezone.utc)
+    self.timestamps = [
+        (now - datetime.timedelta(seconds=s)).isoformat().replace("+00:00", "Z")
+        for s in (20, 10)
+    ]
+
+  def test_reads_whole_log_of_new_pod(self):
+    self.core_api.read_namespaced_pod_log.return_value = (
+        f"{self.timestamps[0]} completed step: 1\n"
+        f"{self.timestamps[1]} completed step: 2\n"
+    )
+
+    lines, cursor = xpk.read_new_log_lines(
+        self.core_api, self.pod, xpk.LogCursor(pod="pod-1", step=5)
+    )
+
+    self.assertEqual(lines, ["completed step: 1", "completed step: 2"])
+    self.assertEqual(cursor, xpk.LogCursor("pod-0", self.timestamps[1]))
+    self.assertNotIn(
+        "since_seconds", self.core_api.read_namespaced_pod_log.call_args.kwargs
+    )
+
+  def test_skips_lines_before_cursor(self):
+    self.core_api.read_namespaced_pod_log.return_value = (
+        f"{self.timestamps[0]} completed step: 1\n"
+        f"{self.timestamps[1]} completed step: 2\n"
+    )
+
+    lines, cursor = xpk.read_new_log_lines(
+        self.core_api,
+        self.pod,
+        xpk.LogCursor("pod-0", self.timestamps[0], step=1),
+    )
+
+    self.assertEqual(lines, ["completed step: 2"])
+    self.assertEqual(cursor, xpk.LogCursor("pod-0", self.timestamps[1], 1))
+    self.assertGreater(
+        self.core_api.read_namespaced_pod_log.call_args.kwargs["since_seconds"],
+        20,
+    )
+
+  def test_keeps_carriage_returns_in_lines(self):
+    self.core_api.read_namespaced_pod_log.return_value = (
+        f"{self.timestamps[0]} 10%\r50%\r\n"
+        "unstamped line\n"
+        f"{self.timestamps[1]} completed step: 2\n"
+    )
+
+    lines, cursor = xpk.read_new_log_lines(
+        self.core_api, self.pod, xpk.LogCursor()
+    )
+
+    self.assertEqual(lines, ["10%\r50%\r", "completed step: 2"])
+    self.assertEqual(cursor.timestamp, self.timestamps[1])
+
+  def test_deletes_cursor_of_task_instance(self):
+    delete = self.enter_context(mock.patch.object(xpk.Variable, "delete"))
+    ti = mock.Mock(dag_id="dag", run_id="run", task_id="task", map_index=-1)
+
+    xpk._delete_log_cursor({"ti": ti})
+
+    delete.assert_called_once_with(xpk._log_cursor_variable(ti))
+
+  def test_parses_nanosecond_timestamps(self):
+    self.assertEqual(
+        xpk._parse_log_timestamp("2025-01-01T00:00:00.123456789Z"),
+        datetime.datetime(
+            2025, 1, 1, microsecond=123456, tzinfo=datetime.timezone.utc
+        ),
+    )
+
+
+class WaitForWorkloadReachStepTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.variables = {}
+    self.enter_context(
+        mock.patch.object(
+            xpk.Variable,
+            "get",
+            side_effect=lambda key, default_var, deserialize_json: (
+                self.variables.get(key, default_var)
+            ),
+        )
+    )
+    self.set_variable = self.enter_context(
+        mock.patch.object(
+            xpk.Variable,
+            "set",
+            side_effect=lambda key, value, serialize_json: (
+                self.variables.__setitem__(key, value)
+            ),
+        )
+    )
+    self.enter_context(
+        mock.patch.object(xpk, "_log_cursor_variable", return_value="cursor")
+    )
+    self.core_api = mock.Mock()
+    self.enter_context(
+        mock.patch.object(
+            xpk, "_get_core_api_client", return_value=self.core_api
+        )
+    )
+    pod = k8s_client.V1Pod(
+        metadata=k8s_client.V1ObjectMeta(name="pod-0", namespace="default"),
+        status=k8s_client.V1PodStatus(phase="Running"),
+    )
+    self.enter_context(
+        mock.patch.object(
+            xpk,
+            "_list_workload_pods",
+            return_value=k8s_client.V1PodList(items=[pod]),
+        )
+    )
+    self.now = datetime.datetime.now(datetime.timezone.utc)
+
+  def _poke(self, *lines: tuple[float, str]) -> bool:
+    self.core_api.read_namespaced_pod_log.return_value = "".join(
+        f"{(self.now - datetime.timedelta(seconds=s)).isoformat()} {line}\n"
+        for s, line in lines
+    )
+    return xpk.wait_for_workload_reach_step.function(
+        "project", "region", "cluster", "workload", "10"
+    )
+
+  def test_saves_cursor_at_new_steps_only(self):
+    self.assertFalse(self._poke((600, "completed step: 1")))
+    self.assertFalse(self._poke((590, "loss: 1.0")))
+
+    self.assertEqual(self.set_variable.call_count, 1)
+    self.assertEqual(self.variables["cursor"]["step"], 1)
+
+    self.assertFalse(self._poke((580, "completed step: 2")))
+
+    self.assertEqual(self.set_variable.call_count, 2)
+    self.assertEqual(self.variables["cursor"]["step"], 2)
+
+  def test_saves_cursor_that_fell_behind(self):
+    self._poke((600, "completed step: 1"))
+
+    self.assertFalse(self._poke((60, "loss: 1.0")))
+
+    self.assertEqual(self.set_variable.call_count, 2)
+    self.assertEqual(self.variables["cursor"]["step"], 1)
+
+  def test_does_not_save_cursor_once_step_is_reached(self):
+    self.assertTrue(self._poke((600, "completed step: 10")))
+
+    self.set_variable.assert_not_called()
+
+  def test_deletes_cursor_when_sensor_ends(self):
+    with DAG("dag", start_date=datetime.datetime(2025, 1, 1), schedule=None):
+      sensor = xpk.wait_for_workload_reach_step(
+          "project", "region", "cluster", "workload", "10"
+      ).operator
+
+    self.assertIs(sensor.on_success_callback, xpk._delete_log_cursor)
+    self.assertIs(sensor.on_failure_callback, xpk._delete_log_cursor)
+
+
+class RunWorkloadsTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.run_workload = self.enter_context(
+        mock.patch.object(xpk.run_workload, "function")
+    )
+    self.jobset_exists = self.enter_context(
+        mock.patch.object(xpk, "_jobset_exists", return_value=False)
+    )
+    self.workloads = [
+        {"benchmark_id": f"b{i}", "workload_id": f"w{i}", "use_k8s_api": i > 0}
+        for i in range(3)
+    ]
+
+  def test_launches_all_workloads(self):
+    launch_errors = xpk.run_workloads.function(
+        "project", "zone", "cluster", self.workloads, max_concurrency=2
+    )
+
+    self.assertEqual(launch_errors, {"w0": None, "w1": None, "w2": None})
+    self.assertEqual(
+        sorted(
+            (c.kwargs["workload_id"], c.kwargs["use_k8s_api"])
+            for c in self.run_workload.call_args_list
+        ),
+        [("w0", False), ("w1", True), ("w2", True)],
+    )
+
+  def test_skips_launched_workloads(self):
+    self.jobset_exists.side_effect = lambda *args: args[-1] == "w1"
+
+    launch_errors = xpk.run_workloads.function(
+        "project", "zone", "cluster", self.workloads
+    )
+
+    self.assertEqual(launch_errors, {"w0": None, "w1": None, "w2": None})
+    self.assertNotIn(
+        "w1",
+        [c.kwargs["workload_id"] for c in self.run_workload.call_args_list],
+    )
+
+  def test_isolates_launch_failures(self):
+    def run_workload(**kwargs):
+      if kwargs["workload_id"] == "w1":
+        raise RuntimeError("quota exceeded")
+
+    self.run_workload.side_effect = run_workload
+
+    launch_errors = xpk.run_workloads.function(
+        "project", "zone", "cluster", self.workloads
+    )
+
+    self.assertEqual(
+        launch_errors,
+        {"w0": None, "w1": "RuntimeError: quota exceeded", "w2": None},
+    )
+    xpk.check_workload_launched.function(launch_errors, "w0")
+    with self.assertRaises(xpk.AirflowFailException):
+      xpk.check_workload_launched.function(launch_errors, "w1")
+
+
+def _pod_status(name: str, phase: str = "Running") -> workload_status.PodStatus:
+  return workload_status.PodStatus(
+      name=name,
+      namespace="default",
+      phase=phase,
+      num_containers=1,
+      node_name=f"node-{name}",
+  )
+
+
+class SelectDisruptionTargetTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.pods = [
+        _pod_status("w-slice-job-1-0-abc"),
+        _pod_status("w-slice-job-0-1-abc"),
+        _pod_status("w-slice-job-0-0-abc", phase="Pending"),
+        _pod_status("w-slice-job-1-1-abc"),
+    ]
+
+  def test_selects_first_running_pod(self):
+    target = xpk.select_disruption_target(self.pods)
+
+    self.assertEqual(target.node_name, "node-w-slice-job-0-1-abc")
+
+  def test_selects_last_running_pod(self):
+    target = xpk.select_disruption_target(self.pods, last_node=True)
+
+    self.assertEqual(target.node_name, "node-w-slice-job-1-1-abc")
+
+  def test_fails_without_running_pods(self):
+    with self.assertRaises(xpk.AirflowFailException):
+      xpk.select_disruption_target(self.pods[2:3])
+
+
+class WaitForRunningPodsTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.workload_pods = self.enter_context(
+        mock.patch.object(workload_status, "workload_pods")
+    )
+    self.get_jobset = self.enter_context(
+        mock.patch.object(xpk, "_get_jobset", return_value={})
+    )
+    self.enter_context(mock.patch.object(xpk.time, "sleep"))
+
+  def _wait(self, deadline: float, replaced=()):
+    return xpk._wait_for_running_pods(
+        "project", "region", "cluster", "w", deadline, replaced
+    )
+
+  def test_returns_replacement_pods(self):
+    self.workload_pods.side_effect = [
+        [_pod_status("w-slice-job-0-0-old")],
+        [_pod_status("w-slice-job-0-0-new", phase="Pending")],
+        [_pod_status("w-slice-job-0-0-new")],
+    ]
+
+    pods = self._wait(xpk.time.monotonic() + 60, ["w-slice-job-0-0-old"])
+
+    self.assertEqual([pod.name for pod in pods], ["w-slice-job-0-0-new"])
+
+  def test_fails_when_jobset_fails(self):
+    self.workload_pods.return_value = []
+    self.get_jobset.return_value = {
+        "status": {"conditions": [{"type": "Failed", "status": "True"}]}
+    }
+
+    with self.assertRaisesRegex(xpk.AirflowFailException, "failed"):
+      self._wait(xpk.time.monotonic() + 60)
+
+  def test_fails_after_deadline(self):
+    self.workload_pods.return_value = [
+        _pod_status("w-slice-job-0-0-abc", phase="Pending")
+    ]
+
+    with self.assertRaisesRegex(xpk.AirflowFailException, "within"):
+      self._wait(xpk.time.monotonic() - 1)
+
+
+class LogMilestonesTest(absltest.TestCase):
+
+  def test_skips_lines_without_timestamps(self):
+    stream = mock.MagicMock()
+    stream.__iter__.return_value = [
+        b"unstamped line\n",
+        b"2025-01-01T00:00:01Z starting\n",
+        b"2025-01-01T00:00:02Z completed step: 1\n",
+    ]
+    core_api = mock.Mock()
+    core_api.read_namespaced_pod_log.side_effect = [
+        stream,
+        "2025-01-01T00:00:03Z completed step: 2\n"
+        "2025-01-01T00:00:04Z completed step: 3 10%\r50%\r\n"
+        "unstamped completed step: 4\n",
+    ]
+    pod = k8s_client.V1Pod(
+        metadata=k8s_client.V1ObjectMeta(name="pod-0", namespace="default")
+    )
+
+    milestones = xpk._log_milestones(core_api, pod)
+
+    utc = datetime.timezone.utc
+    self.assertEqual(
+        milestones,
+        {
+            "first_log": datetime.datetime(2025, 1, 1, 0, 0, 1, tzinfo=utc),
+            "first_step": datetime.datetime(2025, 1, 1, 0, 0, 2, tzinfo=utc),
+            "last_step": datetime.datetime(2025, 1, 1, 0, 0, 4, tzinfo=utc),
+        },
+    )
+    stream.release_conn.assert_called_once()
+
+
+class TimeBreakdownTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+  def _at(self, seconds: float) -> datetime.datetime:
+    return self.start + datetime.timedelta(seconds=seconds)
+
+  def test_splits_time_between_milestones(self):
+    breakdown = xpk.time_breakdown({
+        "launched": self._at(0),
+        "jobset_created": self._at(30),
+        "pods_created": self._at(90),
+        "first_step": self._at(200),
+        "last_step": self._at(1000),
+    })
+
+    self.assertEqual(
+        breakdown,
+        {
+            "orchestration/xpk_setup_seconds": 30,
+            "orchestration/admission_seconds": 60,
+            "orchestration/first_step_seconds": 110,
+            "orchestration/training_seconds": 800,
+            "orchestration/total_seconds": 1000,
+        },
+    )
+
+  def test_clamps_out_of_order_milestones(self):
+    breakdown = xpk.time_breakdown({
+        "containers_started": self._at(10),
+        "first_log": self._at(9),
+    })
+
+    self.assertEqual(breakdown["orchestration/first_log_seconds"], 0)
+
+  def test_empty_without_milestones(self):
+    self.assertEqual(xpk.time_breakdown({"launched": self._at(0)}), {})
+
+
+if __name__ == "__main__":
+  absltest.main()